@@ -1,9 +1,14 @@
+import asyncio
+import itertools
 import json
 import logging
+import random
 import re
+import time
 from datetime import datetime, timedelta
 from functools import cache
 
+import httpx
 import requests
 
 from AI.utils import (
@@ -13,8 +18,9 @@ from AI.utils import (
     remove_leading_numbers,
 )
 from pilgram.classes import Artifact, EnemyMeta, Quest, Zone, ZoneEvent, Anomaly
-from pilgram.generics import PilgramGenerator
+from pilgram.generics import GeneratedContent, GenerationBatchError, PilgramGenerator
 from pilgram.globals import ContentMeta
+from pilgram.profiling import current_span
 
 log = logging.getLogger(__name__)
 
@@ -158,7 +164,7 @@ def get_anomaly_system_prompt(zone: Zone) -> list[dict]:
 
 class GPTAPIError(Exception):
 
-    def __init__(self, response: requests.Response):
+    def __init__(self, response: requests.Response | httpx.Response):
         super().__init__()
         self.status_code = response.status_code
         self.response = response
@@ -173,6 +179,11 @@ class ChatGPTAPI:
     """ Wrapper around the ChatGpt API, used by the generator """
 
     BASE_URL = 'https://api.openai.com'
+    # used by the async completions
+    REQUEST_TIMEOUT: float = 120
+    MAX_RETRIES: int = 3
+    RETRY_BASE_DELAY: float = 2
+    RETRY_STATUS_CODES: tuple[int, ...] = (408, 409, 429, 500, 502, 503, 504)
 
     def __init__(
             self,
@@ -180,8 +191,13 @@ class ChatGPTAPI:
             model: str,
             api_version: int = 1,
             project: str | None = None,
-            organization: str | None = None
+            organization: str | None = None,
+            base_url: str | None = None
     ):
+        """
+        :param base_url: url of an OpenAI compatible API (e.g. a local stub server), the OpenAI API if None
+        """
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
         self.token = token
         self.model = model
         self.api_version = api_version
@@ -199,32 +215,161 @@ class ChatGPTAPI:
 
     @cache
     def _build_request_url(self, endpoint: str) -> str:
-        return f"{self.BASE_URL}/v{self.api_version}/{endpoint}"
+        return f"{self.base_url}/v{self.api_version}/{endpoint}"
+
+    @staticmethod
+    def __record_call(json_response: dict, latency: float) -> None:
+        """ add the latency & token usage of a completion to the current tick """
+        span = current_span()
+        span.add_time("api calls", latency)
+        span.count("api calls")
+        usage = json_response.get("usage") or {}
+        span.count("prompt tokens", usage.get("prompt_tokens", 0))
+        span.count("completion tokens", usage.get("completion_tokens", 0))
+        log.debug(f"completion took {latency:.3f}s, usage: {usage}")
+
+    def __get_completion_content(self, json_response: dict, messages: list[dict]) -> str:
+        log.info(json_response)
+        content = json_response["choices"][0]["message"]["content"]
+        log.debug(f"AI input:\n\n{messages}\n\nAI output:\n\n{content}")
+        return content
+
+    def __get_completion_body(self, messages: list[dict], temperature: int, response_format: dict | None) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "response_format": response_format
+        }
 
     def create_completion(self, messages: list[dict], temperature: int = 1, response_format: dict | None = None) -> str:
+        start = time.perf_counter()
         response = requests.post(
             self._build_request_url("chat/completions"),
             None,
-            {
+            self.__get_completion_body(messages, temperature, response_format),
+            headers=self.headers
+        )
+        if response.ok:
+            json_response = response.json()
+            self.__record_call(json_response, time.perf_counter() - start)
+            return self.__get_completion_content(json_response, messages)
+        log.error(f"could not create completion, response: {response.text}")
+        raise GPTAPIError(response)
+
+    async def acreate_completion(
+            self,
+            client: httpx.AsyncClient,
+            messages: list[dict],
+            temperature: int = 1,
+            response_format: dict | None = None
+    ) -> str:
+        """
+        async version of create_completion, made with the given client. Timeouts, connection errors, rate limits &
+        server errors are retried up to MAX_RETRIES times with exponential backoff & full jitter, so that concurrent
+        requests that failed together don't retry together.
+        """
+        span = current_span()
+        for attempt in itertools.count():  # the last attempt raises instead of retrying
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    self._build_request_url("chat/completions"),
+                    json=self.__get_completion_body(messages, temperature, response_format),
+                    headers=self.headers,
+                    timeout=self.REQUEST_TIMEOUT
+                )
+            except httpx.TransportError as e:  # timeouts included
+                if attempt == self.MAX_RETRIES:
+                    raise
+                log.warning(f"completion failed ({type(e).__name__}: {e}), retrying (attempt {attempt + 1})")
+            else:
+                if response.is_success:
+                    json_response = response.json()
+                    self.__record_call(json_response, time.perf_counter() - start)
+                    return self.__get_completion_content(json_response, messages)
+                if (response.status_code not in self.RETRY_STATUS_CODES) or (attempt == self.MAX_RETRIES):
+                    log.error(f"could not create completion, response: {response.text}")
+                    raise GPTAPIError(response)
+                log.warning(f"completion failed with status {response.status_code}, retrying (attempt {attempt + 1})")
+            span.count("api retries")
+            await asyncio.sleep(random.uniform(0, self.RETRY_BASE_DELAY * (2 ** attempt)))
+
+    def create_batch_line(
+            self,
+            custom_id: str,
+            messages: list[dict],
+            temperature: int = 1,
+            response_format: dict | None = None
+    ) -> str:
+        """ return the jsonl line of a chat completion request to add to a batch """
+        return json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": f"/v{self.api_version}/chat/completions",
+            "body": {
                 "model": self.model,
                 "messages": messages,
                 "temperature": temperature,
                 "response_format": response_format
+            }
+        })
+
+    def create_batch(self, lines: list[str]) -> str:
+        """ upload the given batch lines & start a batch with them (batches cost half as much), returns the batch id """
+        # the file is uploaded as multipart form, so the json content type must not be sent
+        headers = {k: v for k, v in self.headers.items() if k != "Content-Type"}
+        response = requests.post(
+            self._build_request_url("files"),
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode())},
+            headers=headers
+        )
+        if not response.ok:
+            log.error(f"could not upload batch file, response: {response.text}")
+            raise GPTAPIError(response)
+        response = requests.post(
+            self._build_request_url("batches"),
+            json={
+                "input_file_id": response.json()["id"],
+                "endpoint": f"/v{self.api_version}/chat/completions",
+                "completion_window": "24h"
             },
             headers=self.headers
         )
+        if not response.ok:
+            log.error(f"could not create batch, response: {response.text}")
+            raise GPTAPIError(response)
+        self.last_batch = response.json()["id"]
+        return self.last_batch
+
+    def get_batch(self, batch_id: str) -> dict:
+        response = requests.get(self._build_request_url(f"batches/{batch_id}"), headers=self.headers)
         if response.ok:
-            json_response = response.json()
-            log.info(json_response)
-            content = json_response["choices"][0]["message"]["content"]
-            log.debug(f"AI input:\n\n{messages}\n\nAI output:\n\n{content}")
-            return content
-        log.error(f"could not create completion, response: {response.text}")
+            return response.json()
+        log.error(f"could not get batch {batch_id}, response: {response.text}")
         raise GPTAPIError(response)
 
-    def create_batch_line(self, messages: list[dict]) -> str:
-        # TODO (?) adding batches would half the cost of API calls
-        pass
+    def get_batch_results(self, batch: dict) -> dict[str, str]:
+        """ return the generated text of each successful request of a completed batch, indexed by custom id """
+        results: dict[str, str] = {}
+        if batch.get("error_file_id"):
+            log.error(f"some requests of batch {batch['id']} failed: {batch.get('request_counts')}")
+        if not batch.get("output_file_id"):
+            return results
+        response = requests.get(self._build_request_url(f"files/{batch['output_file_id']}/content"), headers=self.headers)
+        if not response.ok:
+            log.error(f"could not download results of batch {batch['id']}, response: {response.text}")
+            raise GPTAPIError(response)
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result.get("response") and result["response"]["status_code"] == 200:
+                results[result["custom_id"]] = result["response"]["body"]["choices"][0]["message"]["content"]
+            else:
+                log.error(f"request {result.get('custom_id')} of batch {batch['id']} failed: {result.get('error')}")
+        return results
 
 
 class ChatGPTGenerator(PilgramGenerator):
@@ -321,15 +466,25 @@ class ChatGPTGenerator(PilgramGenerator):
             result.append(enemy_meta)
         return result
 
+    @staticmethod
+    def _get_quests_messages(zone: Zone) -> list[dict]:
+        return get_quests_system_prompt(zone) + build_messages("user", QUESTS_PROMPT)
+
+    @staticmethod
+    def _get_events_messages(zone: Zone) -> list[dict]:
+        return get_quests_system_prompt(zone) + build_messages("user", EVENTS_PROMPT)
+
+    @staticmethod
+    def _get_enemies_messages(zone: Zone) -> list[dict]:
+        return get_enemies_system_prompt(zone) + build_messages("user", ENEMIES_PROMPT)
+
     def generate_quests(self, zone: Zone, quest_numbers: list[int]) -> list[Quest]:
-        messages = get_quests_system_prompt(zone) + build_messages("user", QUESTS_PROMPT)
-        generated_text = self.api_wrapper.create_completion(messages)
+        generated_text = self.api_wrapper.create_completion(self._get_quests_messages(zone))
         starting_number = quest_numbers[zone.zone_id - 1]
         return self._get_quests_from_generated_text(generated_text, zone, starting_number)
 
     def generate_zone_events(self, zone: Zone) -> list[ZoneEvent]:
-        messages = get_quests_system_prompt(zone) + build_messages("user", EVENTS_PROMPT)
-        generated_text = self.api_wrapper.create_completion(messages)
+        generated_text = self.api_wrapper.create_completion(self._get_events_messages(zone))
         return self._get_events_from_generated_text(generated_text, zone)
 
     def generate_artifacts(self) -> list[Artifact]:
@@ -338,10 +493,85 @@ class ChatGPTGenerator(PilgramGenerator):
         return self._get_artifacts_from_generated_text(generated_text)
 
     def generate_enemy_metas(self, zone: Zone) -> list[EnemyMeta]:
-        messages = get_enemies_system_prompt(zone) + build_messages("user", ENEMIES_PROMPT)
-        generated_text = self.api_wrapper.create_completion(messages)
+        generated_text = self.api_wrapper.create_completion(self._get_enemies_messages(zone))
         return self._get_enemies_from_generated_text(generated_text, zone)
 
+    def _get_content_requests(
+            self, quest_zones: list[Zone], quest_numbers: list[int], event_zones: list[Zone]
+    ) -> list[tuple[str, list[dict]]]:
+        """
+        return the (custom id, messages) of the requests needed to generate the content for the given zones.
+        The custom id holds what is needed to parse the result: '<type>-<zone id>[-<quest number>]'
+        """
+        result: list[tuple[str, list[dict]]] = []
+        for zone in quest_zones:
+            result.append((f"quests-{zone.zone_id}-{quest_numbers[zone.zone_id - 1]}", self._get_quests_messages(zone)))
+        for zone in event_zones:
+            result.append((f"events-{zone.zone_id}", self._get_events_messages(zone)))
+            if zone.zone_id != 0:
+                result.append((f"enemies-{zone.zone_id}", self._get_enemies_messages(zone)))
+        return result
+
+    def _get_content_from_generated_texts(self, generated_texts: dict[str, str], zones: dict[int, Zone]) -> GeneratedContent:
+        """ parse the texts generated for the requests made by _get_content_requests, indexed by custom id """
+        result = GeneratedContent()
+        for custom_id, generated_text in generated_texts.items():
+            content_type, zone_id, *extra = custom_id.split("-")
+            zone = zones[int(zone_id)]
+            try:
+                if content_type == "quests":
+                    result.quests.extend(self._get_quests_from_generated_text(generated_text, zone, int(extra[0])))
+                elif content_type == "events":
+                    result.zone_events.extend(self._get_events_from_generated_text(generated_text, zone))
+                elif content_type == "enemies":
+                    result.enemy_metas.extend(self._get_enemies_from_generated_text(generated_text, zone))
+            except GPTMisbehaveError as e:
+                log.error(f"could not parse result of request {custom_id}: {e}")
+        return result
+
+    def generate_content(
+            self,
+            quest_zones: list[Zone],
+            quest_numbers: list[int],
+            event_zones: list[Zone],
+            concurrency: int = 4
+    ) -> GeneratedContent:
+        content_requests = self._get_content_requests(quest_zones, quest_numbers, event_zones)
+        generated_texts = asyncio.run(self.__generate_texts(content_requests, concurrency))
+        return self._get_content_from_generated_texts(
+            generated_texts, {zone.zone_id: zone for zone in quest_zones + event_zones}
+        )
+
+    async def __generate_texts(self, content_requests: list[tuple[str, list[dict]]], concurrency: int) -> dict[str, str]:
+        """ run the given requests with at most concurrency of them in flight, failed requests are logged & skipped """
+        semaphore = asyncio.Semaphore(concurrency)
+        result: dict[str, str] = {}
+
+        async def generate_text(client: httpx.AsyncClient, custom_id: str, messages: list[dict]) -> None:
+            async with semaphore:
+                try:
+                    result[custom_id] = await self.api_wrapper.acreate_completion(client, messages)
+                except Exception as e:
+                    log.error(f"Encountered an error while generating {custom_id}: {e}")
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+            await asyncio.gather(*(generate_text(client, custom_id, messages) for custom_id, messages in content_requests))
+        return result
+
+    def start_batch(self, quest_zones: list[Zone], quest_numbers: list[int], event_zones: list[Zone]) -> str:
+        return self.api_wrapper.create_batch(list(itertools.starmap(
+            self.api_wrapper.create_batch_line,
+            self._get_content_requests(quest_zones, quest_numbers, event_zones)
+        )))
+
+    def get_batch_results(self, batch_id: str, zones: dict[int, Zone]) -> GeneratedContent | None:
+        batch = self.api_wrapper.get_batch(batch_id)
+        if batch["status"] in ("validating", "in_progress", "finalizing"):
+            return None
+        if batch["status"] != "completed":
+            raise GenerationBatchError(f"batch {batch_id} is {batch['status']}: {batch.get('errors')}")
+        return self._get_content_from_generated_texts(self.api_wrapper.get_batch_results(batch), zones)
+
     def generate_anomaly(self, zone: Zone) -> Anomaly:
         messages = get_anomaly_system_prompt(zone) + build_messages("user", ANOMALY_PROMPT)
         generated_output_str = self.api_wrapper.create_completion(messages, response_format=ANOMALY_RESPONSE_FORMAT)
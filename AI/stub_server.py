@@ -0,0 +1,290 @@
+"""
+Local stand-in for the OpenAI API, used to test & benchmark the generator offline.
+
+It speaks the chat completions & batch API shapes and answers with the mock responses found in the fixtures
+directory (the tests folder has them). Latency & errors can be injected to test retries & throughput.
+
+usage:
+    python -m AI.stub_server --directory tests --port 8080 --latency 0.5 --error-rate 0.1
+
+then set "ChatGPT base url" to "http://127.0.0.1:8080" in settings.json.
+"""
+import argparse
+import email
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+from AI.chatgpt import (
+    ANOMALY_PROMPT,
+    ARTIFACTS_PROMPT,
+    ENEMIES_PROMPT,
+    EVENTS_PROMPT,
+    QUESTS_PROMPT,
+)
+
+log = logging.getLogger(__name__)
+
+# user prompt -> file containing the response to replay
+FIXTURES: dict[str, str] = {
+    QUESTS_PROMPT: "mock_quests_response.txt",
+    EVENTS_PROMPT: "mock_events_response.txt",
+    ARTIFACTS_PROMPT: "mock_artifacts_response.txt",
+    ENEMIES_PROMPT: "mock_enemies_response.txt",
+}
+ANOMALY_RESPONSE: dict[str, Any] = {
+    "name": "Stub anomaly",
+    "description": "The air is thick with something that isn't quite real.",
+    "effects": {"xp mult": 1.2, "money mult": 0.9, "level bonus": 2, "item drop bonus": 1, "artifact drop bonus": 0}
+}
+
+
+class StubOpenAIServer:
+    """ OpenAI compatible server that replays fixtures, runs in a background thread """
+
+    def __init__(
+            self,
+            directory: str = ".",
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            batch_delay: float = 0.0,
+            seed: int | None = None
+    ) -> None:
+        """
+        :param directory: the directory containing the fixtures
+        :param host: the host to listen on
+        :param port: the port to listen on, 0 to use a free port
+        :param latency: seconds waited before answering each request
+        :param error_rate: probability (0-1) of a completion failing with a 500 error, also applies to batch lines
+        :param batch_delay: seconds a batch stays in progress before being completed
+        :param seed: seed of the rng used to inject errors
+        """
+        self.directory = directory
+        self.latency = latency
+        self.error_rate = error_rate
+        self.batch_delay = batch_delay
+        self.rng = random.Random(seed)
+        self.fail_next: int = 0  # the next n completions fail regardless of error_rate
+        self.requests: int = 0
+        self.errors: int = 0
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._server = ThreadingHTTPServer((host, port), self.__build_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        log.info(f"stub OpenAI server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "StubOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    # responses ----
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                failed = True
+            else:
+                failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def _get_content(self, body: dict[str, Any]) -> str:
+        user_prompts = [x["content"] for x in body.get("messages", []) if x.get("role") == "user"]
+        prompt = user_prompts[-1] if user_prompts else ""
+        if prompt == ANOMALY_PROMPT:
+            return json.dumps(ANOMALY_RESPONSE)
+        filename = FIXTURES.get(prompt)
+        if filename is None:
+            return "I am a stub, I only know the pilgram prompts."
+        return Path(self.directory, filename).read_text()
+
+    def create_completion(self, body: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        """ return the status code & json body of a chat completion request """
+        if self._should_fail():
+            return 500, {"error": {"message": "injected error", "type": "server_error", "code": None}}
+        content = self._get_content(body)
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())}
+        }
+
+    def create_file(self, content: bytes, purpose: str) -> dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()), "purpose": purpose}
+
+    def create_batch(self, body: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        input_file_id = body.get("input_file_id")
+        if input_file_id not in self.files:
+            return 404, {"error": {"message": f"file {input_file_id} not found", "type": "invalid_request_error"}}
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": input_file_id,
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata")
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+        return 200, batch
+
+    def get_batch(self, batch_id: str) -> tuple[int, dict[str, Any]]:
+        with self._lock:
+            batch = self.batches.get(batch_id)
+        if batch is None:
+            return 404, {"error": {"message": f"batch {batch_id} not found", "type": "invalid_request_error"}}
+        if (batch["status"] == "in_progress") and (time.time() >= batch["created_at"] + self.batch_delay):
+            self.__complete_batch(batch)
+        return 200, batch
+
+    def __complete_batch(self, batch: dict[str, Any]) -> None:
+        outputs: list[str] = []
+        errors: list[str] = []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            status_code, body = self.create_completion(request["body"])
+            result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"]}
+            if status_code == 200:
+                outputs.append(json.dumps(result | {"response": {"status_code": 200, "body": body}, "error": None}))
+            else:
+                errors.append(json.dumps(result | {"response": None, "error": body["error"]}))
+        with self._lock:
+            if batch["status"] != "in_progress":
+                return  # completed by another request in the meantime
+            batch["output_file_id"] = self.create_file("\n".join(outputs).encode(), "batch_output")["id"]
+            if errors:
+                batch["error_file_id"] = self.create_file("\n".join(errors).encode(), "batch_output")["id"]
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+            batch["completed_at"] = int(time.time())
+            batch["status"] = "completed"
+
+    # http ----
+
+    def __build_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format: str, *args) -> None:
+                log.debug(format % args)
+
+            def __send(self, status_code: int, body: dict[str, Any] | bytes) -> None:
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/octet-stream" if isinstance(body, bytes) else "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def __read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def __before_request(self) -> None:
+                with server._lock:
+                    server.requests += 1
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+            def do_POST(self) -> None:
+                self.__before_request()
+                if self.path == "/v1/chat/completions":
+                    self.__send(*server.create_completion(json.loads(self.__read_body())))
+                elif self.path == "/v1/files":
+                    # multipart form with the purpose & the jsonl file
+                    message = email.message_from_bytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.__read_body()
+                    )
+                    fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True) for part in message.get_payload()}
+                    self.__send(200, server.create_file(fields.get("file", b""), (fields.get("purpose") or b"batch").decode()))
+                elif self.path == "/v1/batches":
+                    self.__send(*server.create_batch(json.loads(self.__read_body())))
+                else:
+                    self.__send(404, {"error": {"message": f"unknown endpoint {self.path}", "type": "invalid_request_error"}})
+
+            def do_GET(self) -> None:
+                self.__before_request()
+                parts = self.path.strip("/").split("/")
+                if (len(parts) == 3) and (parts[:2] == ["v1", "batches"]):
+                    self.__send(*server.get_batch(parts[2]))
+                elif (len(parts) == 4) and (parts[:2] == ["v1", "files"]) and (parts[3] == "content"):
+                    content = server.files.get(parts[2])
+                    if content is None:
+                        self.__send(404, {"error": {"message": f"file {parts[2]} not found", "type": "invalid_request_error"}})
+                    else:
+                        self.__send(200, content)
+                else:
+                    self.__send(404, {"error": {"message": f"unknown endpoint {self.path}", "type": "invalid_request_error"}})
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="run a local OpenAI compatible server that replays the mock responses")
+    parser.add_argument("--directory", default="tests", help="directory containing the mock_*_response.txt files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds waited before answering each request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a completion failing")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="seconds before a batch is completed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = StubOpenAIServer(args.directory, args.host, args.port, args.latency, args.error_rate, args.batch_delay)
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
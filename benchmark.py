@@ -0,0 +1,185 @@
+"""
+Benchmarks of the hot paths of the game, run on synthetic worlds of different sizes.
+
+usage:
+    python benchmark.py --save baseline.json                     # run & store the results as the baseline
+    python benchmark.py --compare baseline.json --threshold 0.2  # fail if something got more than 20% slower
+
+Each world size runs in its own process & directory (see loadtest.py), worlds are generated the first time & reused
+by the following runs.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from datetime import timedelta
+
+from loadtest import prepare_directory
+
+DEFAULT_SIZES: tuple[int, ...] = (1000, 10000, 100000)
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests")  # mock AI responses
+UPDATE_INTERVAL = timedelta(hours=2, minutes=30)
+
+
+def measure(func: Callable[[], object], rounds: int, number: int = 1, setup: Callable[[], object] | None = None) -> dict[str, float]:
+    """ call func number times per round & return the median & min time per call in seconds, setup is not timed """
+    timings: list[float] = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(timings), "min": min(timings), "rounds": rounds}
+
+
+def run_benchmarks(players: int, rounds: int) -> dict[str, dict[str, float]]:
+    """ run all benchmarks on the synthetic world in the current directory, generating it if needed """
+    from AI.chatgpt import ChatGPTAPI, ChatGPTGenerator
+    from AI.stub_server import StubOpenAIServer
+    from orm.db import (
+        PilgramORMDatabase,
+        decode_essences,
+        decode_modifiers,
+        decode_progress,
+        decode_satchel,
+        decode_vocation_progress,
+        encode_essences,
+        encode_modifiers,
+        encode_progress,
+        encode_satchel,
+        encode_vocation_progress,
+    )
+    from orm.models import PlayerModel
+    from orm.synthetic import populate_world
+    from pilgram.classes import Enemy, EnemyMeta, Player, QuickTimeEvent, Vocation, Zone
+    from pilgram.combat_classes import CombatContainer, Damage
+    from pilgram.equipment import ConsumableItem, Equipment, EquipmentType
+    from pilgram.listables import load_from_json
+    from pilgram.modifiers import get_modifier_from_name
+    from ui.functions import USER_COMMANDS, USER_PROCESSES
+    from ui.interpreter import CLIInterpreter
+
+    PilgramORMDatabase.instance()
+    if PlayerModel.select().count() == 0:
+        populate_world(players, update_interval=UPDATE_INTERVAL)
+    rng = random.Random(0)
+
+    def db() -> PilgramORMDatabase:
+        return PilgramORMDatabase.instance()
+
+    results: dict[str, dict[str, float]] = {}
+    # database
+    results["get_player_data cold"] = measure(
+        lambda: db().get_player_data(rng.randint(1, players)), rounds, setup=db().reset_caches
+    )
+    player = db().get_player_data(1)
+    results["get_player_data warm"] = measure(lambda: db().get_player_data(1), rounds, number=100)
+    results["update_player_data"] = measure(lambda: db().update_player_data(player), rounds)
+    results["get_all_pending_updates"] = measure(lambda: db().get_all_pending_updates(UPDATE_INTERVAL), max(1, rounds // 10))
+    # blob encoders & decoders
+    progress = {zone_id: zone_id * 7 for zone_id in range(1, 11)}
+    modifiers = [get_modifier_from_name("Chaos Brand", 150), get_modifier_from_name("Vampiric", 2), get_modifier_from_name("True Strike", 10)]
+    satchel = [ConsumableItem.get(i) for i in range(5)]
+    vocation_progress = {1: 2, 3: 4}
+    essences = {zone_id: zone_id * 11 for zone_id in range(1, 11)}
+    for name, encoder, decoder, value in (
+        ("progress", encode_progress, decode_progress, progress),
+        ("modifiers", encode_modifiers, decode_modifiers, modifiers),
+        ("satchel", encode_satchel, decode_satchel, satchel),
+        ("vocation_progress", encode_vocation_progress, decode_vocation_progress, vocation_progress),
+        ("essences", encode_essences, decode_essences, essences),
+    ):
+        encoded = encoder(value)
+        results[f"encode {name}"] = measure(lambda e=encoder, v=value: e(v), rounds, number=100)
+        results[f"decode {name}"] = measure(lambda d=decoder, v=encoded: d(v), rounds, number=100)
+    # game logic
+    zone = Zone(1, "zone name", 10, "AAAA", Damage(5, 5, 1, 0, 5, 0, 0, 0), Damage(3, 3, 3, 3, 3, 1, 0, 0), {})
+    combatants: list = []
+
+    def create_combatants():
+        fighter = Player.create_default(0, "Ombro", "")
+        fighter.level = 10
+        fighter.gear_level = 10
+        enemy = Enemy(EnemyMeta(0, zone, "Cock monger", "AAAAA", "WIN", "LOSS"), modifiers, 0, rng=random.Random(0))
+        combatants[:] = [fighter, enemy]
+
+    results["CombatContainer.fight"] = measure(
+        lambda: CombatContainer(combatants, {c: None for c in combatants}, seed=0).fight(), rounds, setup=create_combatants
+    )
+    equipment_type = EquipmentType.get(0)
+    results["Equipment.generate"] = measure(lambda: Equipment.generate(20, equipment_type, 3), rounds, number=10)
+    interpreter = CLIInterpreter(USER_COMMANDS, USER_PROCESSES)
+    results["CLIInterpreter.parse_command"] = measure(lambda: interpreter.parse_command("check player Synth1"), rounds, number=100)
+    vocations = [v for v in Vocation.ALL_ITEMS[1:] if v.level == 1][:2]
+    results["Vocation.__add__"] = measure(lambda: Vocation.empty() + vocations[0] + vocations[1], rounds, number=100)
+    results["Vocation.combine"] = measure(lambda: Vocation.combine(vocations), rounds, number=100)
+    # startup, the content files are parsed & built every time the game starts
+    listables = ((QuickTimeEvent, "qtes"), (Vocation, "vocations"), (EquipmentType, "items"), (ConsumableItem, "consumables"))
+    results["load content"] = measure(lambda: [load_from_json(cls, f"content/{name}.json") for cls, name in listables], rounds)
+    # generator, request + parsing against a local server replaying the mock responses
+    with StubOpenAIServer(FIXTURES_DIRECTORY) as stub_server:
+        generator = ChatGPTGenerator(ChatGPTAPI("token", "stub", base_url=stub_server.url))
+        results["generate zone events"] = measure(lambda: generator.generate_zone_events(zone), rounds)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """ return a line for each benchmark that got slower than the baseline by more than threshold (0.2 = 20%) """
+    regressions: list[str] = []
+    for size, benchmarks in current.items():
+        for name, result in benchmarks.items():
+            base = baseline.get(size, {}).get(name)
+            if (not base) or (base["median"] <= 0):
+                continue
+            change = (result["median"] / base["median"]) - 1
+            line = f"{size} players | {name}: {base['median'] * 1e6:.2f}us -> {result['median'] * 1e6:.2f}us ({change:+.1%})"
+            print(line)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the game on synthetic worlds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="number of players of each world")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--directory", default="benchmark", help="directory containing a sub directory for each world")
+    parser.add_argument("--save", default=None, help="save the results to this json file")
+    parser.add_argument("--compare", default=None, help="compare the results with this baseline json file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="maximum allowed slowdown when comparing")
+    parser.add_argument("--world", type=int, default=None, help=argparse.SUPPRESS)  # used by the per world processes
+    args = parser.parse_args()
+    if args.world is not None:
+        prepare_directory(os.path.join(args.directory, str(args.world)))
+        print(json.dumps(run_benchmarks(args.world, args.rounds)))
+        return
+    results: dict[str, dict] = {}
+    for size in args.sizes:
+        print(f"benchmarking world with {size} players...", file=sys.stderr)
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--world", str(size), "--rounds", str(args.rounds), "--directory", os.path.abspath(args.directory)],
+            capture_output=True, text=True, check=True
+        )
+        results[str(size)] = json.loads(process.stdout.strip().splitlines()[-1])
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.threshold:.0%}:\n" + "\n".join(regressions))
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Load test harness: populates a fresh database with a synthetic world & drives the managers & the user interpreter
+with it, then reports throughput & latencies.
+
+usage: python loadtest.py [directory] --players 10000
+
+The game reads its files (database, settings & content) from the working directory, so the harness runs in its own
+directory, which is created & filled with a copy of the content the first time it's used.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from collections.abc import Callable
+from datetime import timedelta
+
+COPIED_FILES: tuple[str, ...] = ("content_meta.json", "intro.txt", "mechanics.txt", "privacy.txt", "words.txt")
+COMMANDS: tuple[str, ...] = (
+    "check player",
+    "check board",
+    "check quest",
+    "check guild",
+    "check auctions",
+    "check market",
+    "check prices",
+    "rank players",
+    "rank guilds",
+    "check player Synth{other}",
+)
+
+
+class StubNotifier:
+    """ notifier that doesn't send anything, it only counts the notifications """
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    def notify(self, notification) -> dict:
+        self.sent += 1
+        return {"ok": True}
+
+
+def prepare_directory(directory: str) -> None:
+    """ create the working directory with a copy of the files the game needs & move into it """
+    source = os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.isdir(os.path.join(directory, "content")):
+        shutil.copytree(os.path.join(source, "content"), os.path.join(directory, "content"))
+    for filename in COPIED_FILES:
+        if not os.path.isfile(os.path.join(directory, filename)):
+            shutil.copy(os.path.join(source, filename), directory)
+    if not os.path.isfile(os.path.join(directory, "settings.json")):
+        shutil.copy(os.path.join(source, "settings_template.json"), os.path.join(directory, "settings.json"))
+    os.makedirs(os.path.join(directory, "bank_logs"), exist_ok=True)
+    os.chdir(directory)
+    sys.path.insert(0, source)
+
+
+def get_latency_stats(latencies: list[float]) -> dict[str, float]:
+    """ return count, throughput & percentiles (in milliseconds) of the given latencies (in seconds) """
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "per second": round(len(ordered) / total, 2) if total > 0 else 0,
+        "p50 ms": percentile(0.5),
+        "p95 ms": percentile(0.95),
+        "p99 ms": percentile(0.99),
+        "max ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def _time(func: Callable, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run(args: argparse.Namespace) -> dict:
+    # the game modules load their files when imported, so they can only be imported once in the right directory
+    from orm.db import PilgramORMDatabase
+    from orm.synthetic import populate_world
+    from pilgram.manager import NotificationsManager, QuestManager, TimedUpdatesManager
+    from pilgram.profiling import get_last_spans
+    from pilgram.utils import read_update_interval
+    from ui.functions import USER_COMMANDS, USER_PROCESSES
+    from ui.interpreter import CLIInterpreter
+    from ui.utils import UserContext
+
+    update_interval: timedelta = read_update_interval(args.update_interval)
+    database = PilgramORMDatabase.instance()
+    report: dict = {"players": args.players, "seed": args.seed}
+    start = time.perf_counter()
+    report["world"] = populate_world(args.players, seed=args.seed, update_interval=update_interval)
+    report["world"]["seconds"] = round(time.perf_counter() - start, 3)
+    # quest manager ticks, every container processed in a tick counts as one operation for the throughput
+    quest_manager = QuestManager(database, update_interval, combat_workers=args.combat_workers, seed=args.seed)
+    tick_latencies: list[float] = []
+    ticks: list[dict] = []
+    for _ in range(args.ticks):
+        tick_latencies.append(_time(quest_manager.run))
+        ticks.append(get_last_spans()["quest manager"])
+    processed = sum(span["counters"].get("containers", 0) for span in ticks)
+    report["quest manager"] = get_latency_stats(tick_latencies)
+    report["quest manager"]["containers"] = processed
+    report["quest manager"]["containers per second"] = round(processed / sum(tick_latencies), 2) if processed else 0
+    report["quest manager"]["ticks"] = ticks
+    # timed updates (expired auctions)
+    report["updates manager"] = get_latency_stats([_time(TimedUpdatesManager(database).run)])
+    report["updates manager"]["last tick"] = get_last_spans()["updates manager"]
+    # notifications, sent through the stub without the delay between messages
+    notifier = StubNotifier()
+    notifications_manager = NotificationsManager(notifier, database)
+    notification_latencies: list[float] = []
+    for notification in database.get_pending_notifications():
+        notification_latencies.append(_time(notifications_manager.send_notification, notification, 0))
+    report["notifications"] = get_latency_stats(notification_latencies)
+    # user commands from random players
+    rng = random.Random(args.seed)
+    interpreter = CLIInterpreter(USER_COMMANDS, USER_PROCESSES)
+    command_latencies: dict[str, list[float]] = {}
+    for _ in range(args.commands):
+        player_id = rng.randint(1, args.players)
+        other = rng.randint(1, args.players)
+        command = rng.choice(COMMANDS)
+        context = UserContext({"id": player_id, "username": f"Synth{player_id}"})
+        command_latencies.setdefault(command, []).append(
+            _time(interpreter.context_aware_execute, context, command.format(other=other))
+        )
+    report["commands"] = get_latency_stats([x for latencies in command_latencies.values() for x in latencies])
+    report["commands by type"] = {command: get_latency_stats(x) for command, x in command_latencies.items()}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Populate a synthetic world & load test the game with it")
+    parser.add_argument("directory", nargs="?", default="loadtest", help="working directory, its database must be empty")
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ticks", type=int, default=3, help="number of quest manager ticks")
+    parser.add_argument("--commands", type=int, default=2000, help="number of user commands")
+    parser.add_argument("--combat-workers", type=int, default=0)
+    parser.add_argument("--update-interval", default="2h 30m 0s")
+    parser.add_argument("--output", default=None, help="also write the report to this json file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_directory(args.directory)
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
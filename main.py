@@ -2,6 +2,7 @@ import asyncio
 import logging
 import sys
 import threading
+from datetime import timedelta
 
 from AI.chatgpt import ChatGPTAPI, ChatGPTGenerator
 from orm.db import PilgramORMDatabase
@@ -10,8 +11,11 @@ from pilgram.globals import GlobalSettings
 from pilgram.manager import (
     GeneratorManager,
     QuestManager,
+    QuestScheduler,
     TimedUpdatesManager,
     TourneyManager, NotificationsManager,
+    collect_forwarded_notifications,
+    start_quest_workers,
 )
 from pilgram.utils import read_update_interval
 from ui.admin_cli import ADMIN_INTERPRETER
@@ -20,6 +24,8 @@ from ui.utils import UserContext
 
 INTERVAL = GlobalSettings.get("thread interval")
 UPDATE_INTERVAL = read_update_interval(GlobalSettings.get("update interval"))
+COMBAT_WORKERS = GlobalSettings.get("combat workers", default=0)
+QUEST_WORKERS = GlobalSettings.get("quest workers", default=0)
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -39,19 +45,28 @@ def kill_all_threads():
 
 def run_quest_manager(database: PilgramDatabase):
     log.info("Running quest manager")
-    quest_manager = QuestManager(database, UPDATE_INTERVAL)
-    # offset the starting of the process by half the interval so that the threads don't run at the same time.
-    if is_killed(INTERVAL / 2):
-        return
+    quest_manager = QuestManager(database, UPDATE_INTERVAL, combat_workers=COMBAT_WORKERS)
+    # updates are fired when each player is due, players are still allowed to meet once every interval
+    scheduler = QuestScheduler(quest_manager, INTERVAL, INTERVAL)
     while True:
-        log.info("Quest manager update")
         try:
-            quest_manager.run()
-            if is_killed(INTERVAL):
+            sleep_interval = scheduler.run()
+            if is_killed(sleep_interval):
                 return
         except Exception as e:
             log.exception(f"error in quest manager thread: {e}")
-            if is_killed(INTERVAL):
+            if is_killed(QuestScheduler.MAX_SLEEP):
+                return
+
+
+def run_notifications_collector(database: PilgramDatabase, notifications_queue):
+    log.info("Running notifications collector")
+    while not kill_signal.is_set():
+        try:
+            collect_forwarded_notifications(database.acquire(), notifications_queue, 5)
+        except Exception as e:
+            log.exception(f"error in notifications collector thread: {e}")
+            if is_killed(5):
                 return
 
 
@@ -61,8 +76,14 @@ def run_generator_manager(database: PilgramDatabase):
         database,
         ChatGPTGenerator(ChatGPTAPI(
             GlobalSettings.get("ChatGPT token"),
-            "gpt-4o-mini"
-        ))
+            "gpt-4o-mini",
+            base_url=GlobalSettings.get("ChatGPT base url", default=ChatGPTAPI.BASE_URL)
+        )),
+        use_batches=GlobalSettings.get("ChatGPT batches", default=False),
+        concurrency=GlobalSettings.get("ChatGPT concurrency", default=1),
+        # plan for the next run & a failed one
+        planning_horizon=timedelta(seconds=INTERVAL * 2) if GlobalSettings.get("predictive generation", default=False) else None,
+        kill_event=kill_signal
     )
     while True:
         try:
@@ -103,7 +124,7 @@ def run_updates_manager(database: PilgramDatabase):
         try:
             log.info("updates manager update")
             updates_manager.run()
-            if is_killed(INTERVAL):
+            if is_killed(updates_manager.get_sleep_interval(INTERVAL)):
                 return
         except Exception as e:
             log.exception(f"error in updates manager thread: {e}")
@@ -155,8 +176,17 @@ def main():
     bot = PilgramBot(GlobalSettings.get("Telegram bot token"))
     asyncio.run_coroutine_threadsafe(bot.set_bot_commands(), asyncio.get_event_loop())  # this seems to work, even if it's being deprecated, so whatever, it's fine
     database = PilgramORMDatabase
+    quest_workers = []
+    if QUEST_WORKERS > 0:
+        # sharded mode: quest updates are split by player id between worker processes, this process coordinates
+        quest_workers, notifications_queue, workers_kill_event = start_quest_workers(
+            database, UPDATE_INTERVAL, INTERVAL, QUEST_WORKERS, COMBAT_WORKERS
+        )
+        quest_thread = threading.Thread(target=lambda: run_notifications_collector(database, notifications_queue), name="notifications-collector")
+    else:
+        quest_thread = threading.Thread(target=lambda: run_quest_manager(database), name="quest-manager")
     threads = [
-        threading.Thread(target=lambda: run_quest_manager(database), name="quest-manager"),
+        quest_thread,
         threading.Thread(target=lambda: run_generator_manager(database), name="generator-manager"),
         threading.Thread(target=lambda: run_tourney_manager(database), name="tourney-manager"),
         threading.Thread(target=lambda: run_updates_manager(database), name="updates-manager"),
@@ -173,6 +203,10 @@ def main():
     kill_all_threads()
     for thread in threads:
         thread.join()
+    if quest_workers:
+        workers_kill_event.set()
+        for process in quest_workers:
+            process.join()
 
 
 if __name__ == '__main__':
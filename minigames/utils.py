@@ -1,8 +1,8 @@
-import itertools
 import re
 from collections.abc import Callable
-from random import choice, randint, randrange, shuffle
+from random import choice, randint, shuffle
 
+from minigames.words import WORDS
 from pilgram.globals import POSITIVE_INTEGER_REGEX
 
 DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
@@ -29,11 +29,6 @@ TILE_REPRESENTATIONS: dict[int, str] = {
 }
 
 
-WORDS_FILE_SIZE: int
-with open("words.txt", "rb") as f:
-    WORDS_FILE_SIZE = sum(1 for _ in f)
-
-
 def roll(dice_faces: int) -> int:
     return randint(1, dice_faces)
 
@@ -60,10 +55,11 @@ def get_positive_integer_from_string(
     return result
 
 
-def get_random_word() -> str:
-    index: int = randrange(0, WORDS_FILE_SIZE)
-    with open("words.txt") as f:
-        return next(itertools.islice(f, index, index + 1), None).rstrip()
+def get_random_word(difficulty: tuple[int, int] | None = None) -> str:
+    """ return a random word, if difficulty (see WordDifficulty) is given the word length will be within it """
+    if difficulty is None:
+        return WORDS.get_random_word()
+    return WORDS.get_random_word(*difficulty)
 
 
 def get_word_letters(word: str) -> list[str]:
@@ -0,0 +1,53 @@
+from bisect import bisect_left, bisect_right
+from random import randrange
+
+WORDS_FILENAME = "words.txt"
+
+
+class WordDifficulty:
+    """ (min length, max length) of the words of each difficulty, longer words are harder to guess """
+    EASY = (1, 5)
+    NORMAL = (6, 8)
+    HARD = (9, 100)
+
+
+class WordStore:
+    """
+    the words of a words file, read once & sorted by length so that a random word (or a random word within a
+    length range) can be picked without reading the file again.
+    """
+
+    def __init__(self, filename: str = WORDS_FILENAME) -> None:
+        self.filename = filename
+        with open(filename) as f:
+            words = [line.strip() for line in f]
+        self.words: list[str] = sorted((word for word in words if word), key=len)
+        self.lengths: list[int] = [len(word) for word in self.words]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def count(self, min_length: int = 1, max_length: int | None = None) -> int:
+        """ return the number of words with a length within the given range (bounds included) """
+        start, end = self.__get_range(min_length, max_length)
+        return end - start
+
+    def get_random_word(self, min_length: int = 1, max_length: int | None = None) -> str:
+        """
+        return a random word with a length within the given range (bounds included), all words in the range have
+        the same chance of being picked.
+
+        :raises ValueError: if there are no words in the given range
+        """
+        start, end = self.__get_range(min_length, max_length)
+        if start >= end:
+            raise ValueError(f"No words with length between {min_length} and {max_length} in {self.filename}")
+        return self.words[randrange(start, end)]
+
+    def __get_range(self, min_length: int, max_length: int | None) -> tuple[int, int]:
+        start = bisect_left(self.lengths, min_length)
+        end = len(self.lengths) if max_length is None else bisect_right(self.lengths, max_length)
+        return start, end
+
+
+WORDS = WordStore()
@@ -1,19 +1,24 @@
 import json
 import logging
+import os
 import random
 import threading
+from collections.abc import Generator
+from contextlib import AbstractContextManager, contextmanager
 from copy import copy
 from datetime import datetime, timedelta
+from itertools import islice
 from time import sleep
 from typing import Any
 
 import numpy as np
-from peewee import JOIN, fn, ModelSelect
+from peewee import JOIN, Case, fn, chunked, ModelSelect
 
 from orm.migration import migrate_older_dbs
 from orm.models import (
     ArtifactModel,
     AuctionModel,
+    BankLogModel,
     EnemyTypeModel,
     EquipmentModel,
     GuildModel,
@@ -23,6 +28,7 @@ from orm.models import (
     ZoneEventModel,
     ZoneModel,
     create_tables,
+    update_schema,
     PetModel,
     db,
 )
@@ -46,17 +52,21 @@ from pilgram.classes import (
 )
 from pilgram.combat_classes import Damage, Stats
 from pilgram.equipment import ConsumableItem, Equipment, EquipmentType
+from pilgram.flags import Raiding
 from pilgram.generics import AlreadyExists, PilgramDatabase
 from pilgram.globals import ContentMeta
 from pilgram.modifiers import Modifier, get_modifier
+from pilgram.profiling import current_span
 from pilgram.utils import save_json_to_file, read_json_file
 
 log = logging.getLogger(__name__)
 
-_LOCK = threading.Lock()
+_LOCK = threading.RLock()  # reentrant so that the functions that use it can be called inside transaction()
 _TOURNEY_LOCK = threading.Lock()
 _NOTIFICATION_LOCK = threading.Lock()
 _DUEL_LOCK = threading.Lock()
+_ROSTER_LOCK = threading.Lock()
+_POOLS_LOCK = threading.Lock()
 
 ENCODING = "cp437"  # we use this encoding since we are working with raw bytes & peewee doesn't seem to like raw bytes
 
@@ -65,8 +75,24 @@ NP_VP = np.dtype([('id', np.uint8), ('progress', np.uint8)])  # 'NumPy Vocations
 NP_ED = np.dtype([('id', np.uint8), ('amount', np.uint16)])  # 'NumPy Essence Data'
 
 _NOTIFICATIONS_LIST: list[Notification] = []
+# guild id -> player id -> (name, level, flags). Rosters are loaded once per guild & then kept up to date by the
+# functions that add, update or delete players & guilds, so members can be counted & filtered without queries.
+# Only writes made by this process are seen, so rosters are not kept when the database is shared.
+_GUILD_ROSTERS: dict[int, dict[int, tuple[str, int, int]]] = {}
+_SHARED = False  # other processes write to the database too (see set_shared), rosters & pools are not kept for long
+# (player ids, guild ids) written in the running transaction, their cached objects are evicted if it is rolled back
+_TRANSACTION_WRITES: tuple[set[int], set[int]] | None = None
+# zone id -> ids of the zone events / enemy metas of the zone, used to pick random content without ORDER BY RANDOM().
+# Pools are loaded once per zone & updated when new content is added. Content added by other processes is not seen,
+# so when the database is shared pools & player samplers are loaded again after SHARED_POOLS_TTL seconds.
+_ZONE_EVENT_POOLS: dict[int, list[int]] = {}
+_ENEMY_META_POOLS: dict[int, list[int]] = {}
+_POOLS_LOAD_TIMES: dict[tuple[str, int], datetime] = {}  # (model name, zone id) -> when the pool was loaded
+SHARED_POOLS_TTL = 60
+PLAYER_LEVEL_BAND = 10  # players are sampled by level in bands of this many levels
 
 MAX_MARKET_ITEMS = ContentMeta.get("market.max_items")
+BANK_LOGS_DIRECTORY = "bank_logs"
 
 
 def decode_progress(data: str | None) -> dict[int, int]:
@@ -210,7 +236,7 @@ def _load_json(json_string: str) -> dict:
         return {}
 
 
-def _thread_safe(lock: threading.Lock = _LOCK):
+def _thread_safe(lock: AbstractContextManager = _LOCK):
     def decorator(func):
         def wrapper(*args, **kwargs):
             with lock:
@@ -219,10 +245,131 @@ def _thread_safe(lock: threading.Lock = _LOCK):
     return decorator
 
 
+class _IdSampler:
+    """ set of ids with O(1) add, remove & uniform random choice """
+
+    def __init__(self) -> None:
+        self.ids: list[int] = []
+        self.positions: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, item_id: int) -> None:
+        if item_id not in self.positions:
+            self.positions[item_id] = len(self.ids)
+            self.ids.append(item_id)
+
+    def remove(self, item_id: int) -> None:
+        position = self.positions.pop(item_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if last != item_id:
+            # move the last id in the hole left by the removed one
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def choice(self) -> int:
+        return random.choice(self.ids)
+
+
+_PLAYERS_SAMPLER: _IdSampler | None = None
+_PLAYER_LEVEL_SAMPLERS: dict[int, _IdSampler] = {}  # level band -> ids of the players in that band
+_PLAYER_SAMPLERS_LOAD_TIME: datetime = datetime.min
+
+
+def _is_shared_pool_expired(load_time: datetime) -> bool:
+    return _SHARED and ((datetime.now() - load_time).total_seconds() > SHARED_POOLS_TTL)
+
+
+def _get_player_samplers() -> tuple[_IdSampler, dict[int, _IdSampler]]:
+    """ return the samplers of all the players & of each level band, loading them the first time """
+    global _PLAYERS_SAMPLER, _PLAYER_SAMPLERS_LOAD_TIME
+    with _POOLS_LOCK:
+        if (_PLAYERS_SAMPLER is None) or _is_shared_pool_expired(_PLAYER_SAMPLERS_LOAD_TIME):
+            sampler = _IdSampler()
+            _PLAYER_LEVEL_SAMPLERS.clear()
+            for x in PlayerModel.select(PlayerModel.id, PlayerModel.level).namedtuples():
+                sampler.add(x.id)
+                _PLAYER_LEVEL_SAMPLERS.setdefault(x.level // PLAYER_LEVEL_BAND, _IdSampler()).add(x.id)
+            _PLAYERS_SAMPLER = sampler
+            _PLAYER_SAMPLERS_LOAD_TIME = datetime.now()
+        return _PLAYERS_SAMPLER, _PLAYER_LEVEL_SAMPLERS
+
+
+def _update_player_samplers(player_id: int, old_level: int | None, new_level: int) -> None:
+    """ add a new player (old_level = None) or move a player to the band of their new level """
+    with _POOLS_LOCK:
+        if _PLAYERS_SAMPLER is None:
+            return  # not loaded yet, the player will be there once they are
+        _PLAYERS_SAMPLER.add(player_id)
+        if (old_level is not None) and ((old_level // PLAYER_LEVEL_BAND) == (new_level // PLAYER_LEVEL_BAND)):
+            return
+        if old_level is not None:
+            # if the level was changed by another process the player may not be in the band of old_level
+            for band in _PLAYER_LEVEL_SAMPLERS.values():
+                band.remove(player_id)
+        _PLAYER_LEVEL_SAMPLERS.setdefault(new_level // PLAYER_LEVEL_BAND, _IdSampler()).add(player_id)
+
+
+def _get_id_pool(pools: dict[int, list[int]], model: type[ZoneEventModel | EnemyTypeModel], zone_id: int) -> list[int]:
+    """ return the ids of the rows of model in the given zone, loading them from the db the first time """
+    with _POOLS_LOCK:
+        pool = pools.get(zone_id)
+        load_time_key = (model.__name__, zone_id)
+        expired = _is_shared_pool_expired(_POOLS_LOAD_TIMES.get(load_time_key, datetime.min))
+        if (pool is None) or (_SHARED and not pool) or expired:  # a zone may get its first content at any time
+            pool = [x.id for x in model.select(model.id).where(model.zone_id == zone_id).namedtuples()]
+            pools[zone_id] = pool
+            _POOLS_LOAD_TIMES[load_time_key] = datetime.now()
+        return pool
+
+
+def _add_to_id_pool(pools: dict[int, list[int]], zone_id: int, row_id: int) -> None:
+    with _POOLS_LOCK:
+        if zone_id in pools:
+            pools[zone_id].append(row_id)
+
+
+def _record_write(player_id: int | None = None, guild_id: int | None = None) -> None:
+    """ record the players & guilds written while a transaction is running, see PilgramORMDatabase.transaction """
+    if _TRANSACTION_WRITES is None:
+        return
+    if player_id is not None:
+        _TRANSACTION_WRITES[0].add(player_id)
+    if guild_id is not None:
+        _TRANSACTION_WRITES[1].add(guild_id)
+
+
 def _get_daily_seed():
     return (datetime.now() - datetime(1998, 10, 1)).days
 
 
+def _import_bank_log_files() -> None:
+    """ import the bank logs of the older versions (a json lines file per guild) in the database """
+    if not os.path.isdir(BANK_LOGS_DIRECTORY):
+        return
+    for filename in os.listdir(BANK_LOGS_DIRECTORY):
+        guild_id, extension = os.path.splitext(filename)
+        if (extension != ".txt") or (not guild_id.isdigit()):
+            continue
+        path = os.path.join(BANK_LOGS_DIRECTORY, filename)
+        rows: list[dict] = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                    rows.append({"guild": int(guild_id), "player": data["by"], "log_type": data["transaction"], "amount": data["amount"]})
+                except (json.JSONDecodeError, KeyError):
+                    log.warning(f"skipping invalid bank log in {path}: {line.strip()}")
+        with db.atomic():
+            for batch in chunked(rows, 100):
+                BankLogModel.insert_many(batch).execute()
+        os.rename(path, f"{path}.imported")
+        log.info(f"imported {len(rows)} bank logs from {path}")
+
+
 class PilgramORMDatabase(PilgramDatabase):
     """ Singleton object which contains the instance that handles connections to the database """
     _instance = None
@@ -243,6 +390,8 @@ class PilgramORMDatabase(PilgramDatabase):
                 create_tables()
                 sleep(0.1)
                 log.info("tables created")
+            update_schema()
+            _import_bank_log_files()
             cls._instance.is_connected = False
         return cls._instance
 
@@ -250,18 +399,61 @@ class PilgramORMDatabase(PilgramDatabase):
     def acquire(cls) -> "PilgramORMDatabase":
         return cls.instance()
 
+    @contextmanager
+    def transaction(self) -> Generator[None, None, None]:
+        global _TRANSACTION_WRITES
+        with _LOCK:
+            outermost = _TRANSACTION_WRITES is None
+            if outermost:
+                _TRANSACTION_WRITES = (set(), set())
+            try:
+                with db.atomic():
+                    yield
+            except Exception:
+                self.__evict_rolled_back_objects(*_TRANSACTION_WRITES)
+                raise
+            finally:
+                if outermost:
+                    _TRANSACTION_WRITES = None
+
+    @staticmethod
+    def __evict_rolled_back_objects(player_ids: set[int], guild_ids: set[int]) -> None:
+        """
+        drop the cached objects that may hold changes that were rolled back: the written players with their items,
+        artifacts & adventure containers, the written guilds & the guilds of the written players (with all the cached
+        players that reference them). Everything is loaded again from the database when needed.
+        """
+        global _PLAYERS_SAMPLER
+        players = PilgramORMDatabase.get_player_data.evict(lambda key, player: player.player_id in player_ids)
+        guild_ids = guild_ids | {player.guild.guild_id for player in players if player.guild}
+        PilgramORMDatabase.get_player_data.evict(
+            lambda key, player: (player.guild is not None) and (player.guild.guild_id in guild_ids)
+        )
+        PilgramORMDatabase.get_player_items.evict(lambda key, _: key[1] in player_ids)
+        PilgramORMDatabase.get_player_artifacts.evict(lambda key, _: key[1] in player_ids)
+        PilgramORMDatabase.get_player_adventure_container.evict(lambda key, _: key[1].player_id in player_ids)
+        PilgramORMDatabase.get_guild.evict(lambda key, _: key[1] in guild_ids)
+        PilgramORMDatabase.get_top_n_guilds_by_score.evict(lambda key, guilds: any(g.guild_id in guild_ids for g in guilds))
+        # rosters, samplers & pools may hold changes that were rolled back too, they are loaded again when needed
+        with _ROSTER_LOCK:
+            _GUILD_ROSTERS.clear()
+        with _POOLS_LOCK:
+            _PLAYERS_SAMPLER = None
+            _ZONE_EVENT_POOLS.clear()
+            _ENEMY_META_POOLS.clear()
+
     # player ----
 
     @cache_sized_ttl_quick(size_limit=2000, ttl=3600)
     def get_player_data(self, player_id) -> Player:
         # we are using a cache in front of this function since it's going to be called a lot, because of how the
         # function is structured the cache will store the Player objects which will always be updated in memory along
-        # with their database record; Thus making it always valid.
+        # with their database record; Thus making it always valid. This is only true if this process is the only one
+        # writing players, the cache is bypassed when the database is shared (see set_shared).
         try:
             pls: PlayerModel = PlayerModel.get(PlayerModel.id == player_id)
             guild = self.get_guild(pls.guild.id, calling_player_id=pls.id) if pls.guild else None
             artifacts = self.get_player_artifacts(player_id)
-            items = self.get_player_items(player_id)
             equipped_items_ids: list[int] = decode_equipped_items_ids(pls.equipped_items)
             equipped_items = {}
             # vocations
@@ -271,10 +463,9 @@ class PilgramORMDatabase(PilgramDatabase):
             for vocation_id in vocation_ids:
                 if vocation_id != 0:
                     vocations.append(Vocation.get_correct_vocation_tier_no_player(vocation_id, vocations_progress))
-            # items
-            for item in items:
-                if item.equipment_id in equipped_items_ids:
-                    equipped_items[item.equipment_type.slot] = item
+            # items, only the equipped ones are loaded, the inventory is loaded by get_player_items when needed
+            for item in self.__get_equipped_items(player_id, equipped_items_ids):
+                equipped_items[item.equipment_type.slot] = item
             # create actual object
             player = Player(
                 pls.id,
@@ -316,10 +507,15 @@ class PilgramORMDatabase(PilgramDatabase):
         except PlayerModel.DoesNotExist:
             raise KeyError(f'Player with id {player_id} not found')  # raising exceptions makes sure invalid queries aren't cached
 
-    def get_random_player_data(self) -> Player:
-        pls = PlayerModel.select(PlayerModel.id).order_by(fn.Random()).limit(1).namedtuples()
-        for p in pls:
-            return self.get_player_data(p.id)
+    def get_random_player_data(self, level: int | None = None) -> Player:
+        players, level_bands = _get_player_samplers()
+        with _POOLS_LOCK:
+            band = level_bands.get(level // PLAYER_LEVEL_BAND) if level is not None else None
+            sampler = band if (band and len(band) > 1) else players  # a band with one player is just the caller
+            if not sampler:
+                raise KeyError("Could not find any player")
+            player_id = sampler.choice()
+        return self.get_player_data(player_id)
 
     @cache_sized_ttl_quick(size_limit=200, ttl=3600)
     def get_player_id_from_name(self, name: str) -> int:
@@ -341,6 +537,8 @@ class PilgramORMDatabase(PilgramDatabase):
         try:
             with db.atomic():
                 pls: PlayerModel = PlayerModel.get(PlayerModel.id == player.player_id)
+                old_guild_id = pls.guild_id
+                old_level = pls.level
                 pls.name = player.name
                 pls.description = player.description
                 pls.guild = player.guild.guild_id if player.guild else None
@@ -375,6 +573,9 @@ class PilgramORMDatabase(PilgramDatabase):
                 pls.max_money_reached = player.max_money_reached
                 pls.max_renown_reached = player.max_renown_reached
                 pls.save()
+                _record_write(player_id=player.player_id)
+            self.__update_guild_roster(player, old_guild_id)
+            _update_player_samplers(player.player_id, old_level, player.level)
         except PlayerModel.DoesNotExist:
             raise KeyError(f'Player with id {player.player_id} not found')
 
@@ -397,6 +598,8 @@ class PilgramORMDatabase(PilgramDatabase):
                 QuestProgressModel.create(
                     player_id=player.player_id
                 )
+            self.__update_guild_roster(player, None)
+            _update_player_samplers(player.player_id, None, player.level)
         except Exception as e:  # catching the specific exception wasn't working so here we are
             log.error(e)
             raise AlreadyExists(f"Player with name {player.name} already exists")
@@ -463,18 +666,55 @@ class PilgramORMDatabase(PilgramDatabase):
         except GuildModel.DoesNotExist:
             raise KeyError(f'Guild founded by player with id {player.player_id} not found')
 
-    @cache_sized_ttl_quick(size_limit=50, ttl=300)
-    def __get_guild_members_data(self, guild_id: int) -> list[tuple[int, str, int]]:
-        """ cache based on the id should work a bit better """
-        gms = GuildModel.get(guild_id == GuildModel.id).members
-        return [(x.id, x.name, x.level) for x in gms]
+    @staticmethod
+    def __get_guild_roster(guild_id: int) -> dict[int, tuple[str, int, int]]:
+        """
+        return the roster of the guild, loading it from the db the first time it is requested. When the database is
+        shared the roster is loaded every time, since other processes can change the guild members & their flags.
+        """
+        with _ROSTER_LOCK:
+            roster = _GUILD_ROSTERS.get(guild_id)
+            if roster is None:
+                pls = PlayerModel.select(
+                    PlayerModel.id, PlayerModel.name, PlayerModel.level, PlayerModel.flags
+                ).where(PlayerModel.guild == guild_id).order_by(PlayerModel.id).namedtuples()
+                roster = {x.id: (x.name, x.level, x.flags) for x in pls}
+                if not _SHARED:
+                    _GUILD_ROSTERS[guild_id] = roster
+            return roster
+
+    @staticmethod
+    def __update_guild_roster(player: Player, old_guild_id: int | None) -> None:
+        """ move the player between the loaded rosters if they changed guild & refresh their roster entry """
+        new_guild_id = player.guild.guild_id if player.guild else None
+        with _ROSTER_LOCK:
+            if (old_guild_id != new_guild_id) and (old_guild_id in _GUILD_ROSTERS):
+                _GUILD_ROSTERS[old_guild_id].pop(player.player_id, None)
+            if new_guild_id in _GUILD_ROSTERS:
+                _GUILD_ROSTERS[new_guild_id][player.player_id] = (player.name, player.level, player.flags)
 
     def get_guild_members_data(self, guild: Guild) -> list[tuple[int, str, int]]:  # id, name, level
-        return self.__get_guild_members_data(guild.guild_id)
+        roster = self.__get_guild_roster(guild.guild_id)
+        with _ROSTER_LOCK:
+            return [(player_id, name, level) for player_id, (name, level, _) in roster.items()]
 
-    @cache_ttl_quick(ttl=60)
     def get_guild_members_number(self, guild: Guild) -> int:
-        return GuildModel.get(guild.guild_id == GuildModel.id).members.count()
+        return len(self.__get_guild_roster(guild.guild_id))
+
+    def get_avaible_players_for_raid(self, guild: Guild) -> list[Player]:
+        roster = self.__get_guild_roster(guild.guild_id)
+        with _ROSTER_LOCK:
+            member_ids = list(roster)
+        qps = QuestProgressModel.select(QuestProgressModel.player).where(
+            QuestProgressModel.player.in_(member_ids) & QuestProgressModel.quest.is_null()
+        ).order_by(QuestProgressModel.player).namedtuples()
+        return [self.get_player_data(x.player) for x in qps]
+
+    def get_raid_participants(self, guild: Guild) -> list[Player]:
+        roster = self.__get_guild_roster(guild.guild_id)
+        with _ROSTER_LOCK:
+            participant_ids = [player_id for player_id, (_, _, flags) in roster.items() if Raiding.is_set(flags)]
+        return [self.get_player_data(player_id) for player_id in participant_ids]
 
     @_thread_safe()
     def update_guild(self, guild: Guild):
@@ -491,6 +731,7 @@ class PilgramORMDatabase(PilgramDatabase):
             gs.bank = guild.bank
             gs.last_raid = guild.last_raid
             gs.save()
+            _record_write(guild_id=guild.guild_id)
 
     @_thread_safe()
     def add_guild(self, guild: Guild) -> int:
@@ -533,10 +774,39 @@ class PilgramORMDatabase(PilgramDatabase):
     def delete_guild(self, guild: Guild) -> None:
         try:
             GuildModel.get(GuildModel.id == guild.guild_id).delete_instance()
+            BankLogModel.delete().where(BankLogModel.guild == guild.guild_id).execute()
+            with _ROSTER_LOCK:
+                _GUILD_ROSTERS.pop(guild.guild_id, None)
             guild.deleted = True
         except GuildModel.DoesNotExist:
             raise KeyError(f'Guild with id {guild.guild_id} not found')
 
+    @_thread_safe()
+    def add_bank_log(self, guild: Guild, log_type: str, player_id: int, amount: int) -> None:
+        BankLogModel.create(guild=guild.guild_id, player=player_id, log_type=log_type, amount=amount)
+
+    def get_bank_logs(self, guild: Guild, log_type: str, limit: int = 10) -> list[tuple[str, int]]:
+        query = (
+            BankLogModel.select(PlayerModel.name, BankLogModel.amount)
+            .join(PlayerModel, JOIN.LEFT_OUTER, on=(BankLogModel.player == PlayerModel.id))
+            .where((BankLogModel.guild == guild.guild_id) & (BankLogModel.log_type == log_type))
+            .order_by(BankLogModel.id.desc())
+            .limit(limit)
+        )
+        return [(name or "?", amount) for name, amount in reversed(list(query.tuples()))]
+
+    def get_bank_log_totals(self, guild: Guild) -> dict[str, tuple[int, int]]:
+        deposited = fn.SUM(Case(None, [(BankLogModel.log_type == "deposit", BankLogModel.amount)], 0))
+        withdrawn = fn.SUM(Case(None, [(BankLogModel.log_type == "withdrawal", BankLogModel.amount)], 0))
+        query = (
+            BankLogModel.select(PlayerModel.name, deposited, withdrawn)
+            .join(PlayerModel, JOIN.LEFT_OUTER, on=(BankLogModel.player == PlayerModel.id))
+            .where(BankLogModel.guild == guild.guild_id)
+            .group_by(BankLogModel.player)
+            .order_by(deposited.desc())
+        )
+        return {(name or "?"): (deposits, withdrawals) for name, deposits, withdrawals in query.tuples()}
+
     # zones ----
 
     @staticmethod
@@ -589,9 +859,11 @@ class PilgramORMDatabase(PilgramDatabase):
                 level=zone.level,
                 description=zone.zone_description,
                 damage_json=json.dumps(zone.damage_modifiers.__dict__),
-                resist_jsonn=json.dumps(zone.resist_modifiers.__dict__),
+                resist_json=json.dumps(zone.resist_modifiers.__dict__),
                 extra_data_json=json.dumps(zone.extra_data)
             )
+        PilgramORMDatabase.get_all_zones.expire()
+        PilgramORMDatabase.get_quests_counts.expire()
 
     # zone events ----
 
@@ -602,29 +874,32 @@ class PilgramORMDatabase(PilgramDatabase):
             zes.event_text
         )
 
-    def get_zone_event(self, event_id: int) -> ZoneEvent:  # this is unlikely to ever be used
+    @cache_sized_ttl_quick(size_limit=500, ttl=300)
+    def get_zone_event(self, event_id: int) -> ZoneEvent:
         try:
             zes = ZoneEventModel.get(ZoneEventModel.id == event_id)
             return self.build_zone_event_object(zes)
         except ZoneEventModel.DoesNotExist:
             raise KeyError(f"Could not find zone event with id {event_id}")
 
-    @cache_ttl_quick(ttl=10)
     def get_random_zone_event(self, zone: Zone | None) -> ZoneEvent:
-        # cache lasts only 10 seconds to optimize the most frequent use case
-        try:
-            if zone:
-                zes = ZoneEventModel.select(
-                    ZoneEventModel.id, ZoneEventModel.zone_id, ZoneEventModel.event_text
-                ).where(ZoneEventModel.zone_id == zone.zone_id).order_by(fn.Random()).limit(1).namedtuples()
-            else:
-                zes = ZoneEventModel.select(
-                    ZoneEventModel.id, ZoneEventModel.zone_id, ZoneEventModel.event_text
-                ).where(ZoneEventModel.zone_id == 0).order_by(fn.Random()).limit(1).namedtuples()
-            for ze in zes:
-                return self.build_zone_event_object(ze)
-        except ZoneEventModel.DoesNotExist:
-            raise KeyError(f"Could not find any zone events within zone {zone.zone_id}")
+        zone_id = zone.zone_id if zone else 0
+        pool = _get_id_pool(_ZONE_EVENT_POOLS, ZoneEventModel, zone_id)
+        if not pool:
+            raise KeyError(f"Could not find any zone events within zone {zone_id}")
+        return self.get_zone_event(random.choice(pool))
+
+    def get_random_zone_events(self, zone: Zone | None, amount: int) -> list[ZoneEvent]:
+        zone_id = zone.zone_id if zone else 0
+        pool = _get_id_pool(_ZONE_EVENT_POOLS, ZoneEventModel, zone_id)
+        if not pool:
+            raise KeyError(f"Could not find any zone events within zone {zone_id}")
+        event_ids = random.choices(pool, k=amount)
+        zes = ZoneEventModel.select(
+            ZoneEventModel.id, ZoneEventModel.zone_id, ZoneEventModel.event_text
+        ).where(ZoneEventModel.id.in_(list(set(event_ids)))).namedtuples()
+        events = {ze.id: self.build_zone_event_object(ze) for ze in zes}
+        return [events[event_id] for event_id in event_ids]
 
     @_thread_safe()
     def update_zone_event(self, event: ZoneEvent):
@@ -639,16 +914,21 @@ class PilgramORMDatabase(PilgramDatabase):
     @_thread_safe()
     def add_zone_event(self, event: ZoneEvent):
         with db.atomic():
-            ZoneEventModel.create(
+            zes = ZoneEventModel.create(
                 zone_id=event.zone.zone_id,
                 event_text=event.event_text
             )
+        _add_to_id_pool(_ZONE_EVENT_POOLS, event.zone.zone_id, zes.id)
 
     @_thread_safe()
     def add_zone_events(self, events: list[ZoneEvent]):
         data_to_insert = [{"zone_id": e.zone.zone_id if e.zone else 0, "event_text": e.event_text} for e in events]
         with db.atomic():
             ZoneEventModel.insert_many(data_to_insert).execute()
+        # insert_many doesn't return the new ids, the pools of the zones are loaded again when needed
+        with _POOLS_LOCK:
+            for data in data_to_insert:
+                _ZONE_EVENT_POOLS.pop(data["zone_id"], None)
 
     # quests ----
 
@@ -731,6 +1011,15 @@ class PilgramORMDatabase(PilgramDatabase):
                  order_by(ZoneModel.id.asc()))
         return [x.quest_count for x in query]
 
+    def get_active_quest_numbers(self) -> dict[int, list[int]]:
+        query = QuestModel.select(QuestModel.zone, QuestModel.number).join(
+            QuestProgressModel, on=(QuestProgressModel.quest == QuestModel.id)
+        ).namedtuples()
+        result: dict[int, list[int]] = {}
+        for row in query:
+            result.setdefault(row.zone, []).append(row.number)
+        return result
+
     # in progress quest management ----
 
     def build_adventure_container(self, qps: QuestProgressModel, owner: Player | None = None) -> AdventureContainer:
@@ -757,6 +1046,25 @@ class PilgramORMDatabase(PilgramDatabase):
         except QuestProgressModel.DoesNotExist:
             return []
 
+    def get_update_schedule(
+        self, player_ids: list[int] | None = None
+    ) -> list[tuple[int, datetime, datetime | None]]:
+        qps: ModelSelect = QuestProgressModel.select(
+            QuestProgressModel.player, QuestProgressModel.quest, QuestProgressModel.end_time, QuestProgressModel.last_update
+        )
+        if player_ids is not None:
+            qps = qps.where(QuestProgressModel.player.in_(player_ids))
+        return [(int(x.player_id), x.last_update, x.end_time if x.is_on_a_quest() else None) for x in qps]
+
+    def get_adventure_containers(self, player_ids: list[int]) -> list[AdventureContainer]:
+        qps: ModelSelect = QuestProgressModel.select().where(QuestProgressModel.player.in_(player_ids))
+        return [self.build_adventure_container(x) for x in qps]
+
+    def get_players_adventure_containers(self, players: list[Player]) -> dict[int, AdventureContainer]:
+        owners = {player.player_id: player for player in players}
+        qps: ModelSelect = QuestProgressModel.select().where(QuestProgressModel.player.in_(list(owners)))
+        return {int(x.player_id): self.build_adventure_container(x, owner=owners[int(x.player_id)]) for x in qps}
+
     @_thread_safe()
     def update_quest_progress(self, adventure_container: AdventureContainer, last_update: datetime | None = None):
         try:
@@ -767,6 +1075,11 @@ class PilgramORMDatabase(PilgramDatabase):
                 qps.last_update = (datetime.now() + timedelta(minutes=random.randint(0, 40))) if last_update is None else last_update
                 qps.end_time = adventure_container.finish_time
                 qps.save()
+                _record_write(player_id=adventure_container.player_id())
+            # the containers built by get_adventure_containers are not the cached ones, which would still show the old quest
+            PilgramORMDatabase.get_player_adventure_container.evict(
+                lambda key, _: key[1].player_id == adventure_container.player_id()
+            )
         except QuestProgressModel.DoesNotExist:
             raise KeyError(f"Could not find quest progress for player with id {adventure_container.player_id()}")
 
@@ -866,7 +1179,7 @@ class PilgramORMDatabase(PilgramDatabase):
             ems.lose_text
         )
 
-    @cache_sized_ttl_quick(size_limit=100, ttl=300)
+    @cache_sized_ttl_quick(size_limit=500, ttl=300)
     def get_enemy_meta(self, enemy_meta_id: int) -> EnemyMeta:
         try:
             ems = EnemyTypeModel.get(EnemyTypeModel.id == enemy_meta_id)
@@ -875,18 +1188,10 @@ class PilgramORMDatabase(PilgramDatabase):
             raise KeyError(f"Enemey meta with id {enemy_meta_id} does not exist")
 
     def get_random_enemy_meta(self, zone: Zone) -> EnemyMeta:
-        ems = EnemyTypeModel.select(
-            EnemyTypeModel.id,
-            EnemyTypeModel.zone_id,
-            EnemyTypeModel.name,
-            EnemyTypeModel.description,
-            EnemyTypeModel.win_text,
-            EnemyTypeModel.lose_text
-        ).where(
-            EnemyTypeModel.zone_id == zone.zone_id
-        ).order_by(fn.Random()).limit(1).namedtuples()
-        for em in ems:
-            return self.__build_enemy_meta(em)
+        pool = _get_id_pool(_ENEMY_META_POOLS, EnemyTypeModel, zone.zone_id)
+        if not pool:
+            raise KeyError(f"Could not find any enemy metas within zone {zone.zone_id}")
+        return self.get_enemy_meta(random.choice(pool))
 
     @cache_sized_ttl_quick(size_limit=20, ttl=300)
     def get_all_zone_enemies(self, zone: Zone) -> list[EnemyMeta]:
@@ -921,31 +1226,37 @@ class PilgramORMDatabase(PilgramDatabase):
     @_thread_safe()
     def add_enemy_meta(self, enemy_meta: EnemyMeta):
         with db.atomic():
-            EnemyTypeModel.create(
+            ems = EnemyTypeModel.create(
                 zone_id=enemy_meta.zone.zone_id,
                 name=enemy_meta.name,
                 description=enemy_meta.description,
                 win_text=enemy_meta.win_text,
                 lose_text=enemy_meta.lose_text
             )
+        _add_to_id_pool(_ENEMY_META_POOLS, enemy_meta.zone.zone_id, ems.id)
 
     # items ----
 
     def __build_item(self, its: EquipmentModel) -> Equipment:
         equipment_type = EquipmentType.get(its.equipment_type)
-        _, damage, resist = Equipment.generate_dmg_and_resist_values(its.level, its.damage_seed, equipment_type.is_weapon)
         return Equipment(
             its.id,
             its.level,
             equipment_type,
             its.name,
             its.damage_seed,
-            damage,
-            resist,
+            None,  # damage & resist are derived from the seed when they are first needed
+            None,
             decode_modifiers(its.modifiers),
             its.rerolls
         )
 
+    def __get_equipped_items(self, player_id: int, item_ids: list[int]) -> list[Equipment]:
+        if not item_ids:
+            return []
+        query = EquipmentModel.select().where(EquipmentModel.id.in_(item_ids), EquipmentModel.owner == player_id)
+        return [self.__build_item(x) for x in query]
+
     def get_item(self, item_id: int) -> Equipment:
         try:
             its = EquipmentModel.get(EquipmentModel.id == item_id)
@@ -975,6 +1286,7 @@ class PilgramORMDatabase(PilgramDatabase):
                 its.level = item.level
                 its.rerolls = item.rerolls
                 its.save()
+                _record_write(player_id=owner.player_id)
         except EquipmentModel.DoesNotExist:
             raise KeyError(f"Could not find item with id {item.equipment_id}")
 
@@ -989,6 +1301,7 @@ class PilgramORMDatabase(PilgramDatabase):
                 damage_seed=item.seed,
                 modifiers=encode_modifiers(item.modifiers)
             )
+            _record_write(player_id=owner.player_id)
             return item.id
 
     @_thread_safe()
@@ -1040,14 +1353,6 @@ class PilgramORMDatabase(PilgramDatabase):
         except AuctionModel.DoesNotExist:
             raise KeyError(f"Could not find auction id associated with item {item.equipment_id}")
 
-    @cache_ttl_single_value(ttl=600)
-    def get_auctions(self) -> list[Auction]:
-        try:
-            ass = AuctionModel.select()
-            return [self.__build_auction(x) for x in ass]
-        except AuctionModel.DoesNotExist:
-            return []
-
     @cache_sized_ttl_quick()
     def get_player_auctions(self, player: Player) -> list[Auction]:
         try:
@@ -1056,6 +1361,46 @@ class PilgramORMDatabase(PilgramDatabase):
         except AuctionModel.DoesNotExist:
             return []
 
+    def search_auctions(
+            self,
+            slot: int | None = None,
+            rarity: int | None = None,
+            min_level: int | None = None,
+            max_level: int | None = None,
+            max_price: int | None = None,
+            sort: str = "ending",
+            page: int = 1,
+            page_size: int = Auction.PAGE_SIZE
+    ) -> list[Auction]:
+        query = (
+            AuctionModel.select(AuctionModel.id, EquipmentModel.modifiers)
+            .join(EquipmentModel, on=(AuctionModel.item == EquipmentModel.id))
+            .where(AuctionModel.creation_date > (datetime.now() - Auction.DURATION))
+        )
+        if slot is not None:
+            query = query.where(EquipmentModel.equipment_type.in_([x.equipment_type_id for x in EquipmentType.ALL_ITEMS if x.slot == slot]))
+        if min_level is not None:
+            query = query.where(EquipmentModel.level >= min_level)
+        if max_level is not None:
+            query = query.where(EquipmentModel.level <= max_level)
+        if max_price is not None:
+            query = query.where(AuctionModel.best_bid <= max_price)
+        query = query.order_by(*{
+            "ending": (AuctionModel.creation_date,),
+            "price": (AuctionModel.best_bid, AuctionModel.creation_date),
+            "level": (EquipmentModel.level.desc(), AuctionModel.creation_date),
+        }[sort])
+        page = max(1, page)
+        if rarity is None:
+            rows = query.paginate(page, page_size).namedtuples()
+        else:
+            # modifiers are stored as one fixed size record each (see encode_modifiers), they can't be counted in sql
+            # since the encoded strings contain null characters, which sqlite string functions stop at
+            rows = (x for x in query.namedtuples() if len(bytes(x.modifiers, ENCODING)) == (rarity * NP_MD.itemsize))
+            rows = islice(rows, (page - 1) * page_size, page * page_size)
+        # the auctions are shared with get_auction_from_id, so bids placed on them are always up to date
+        return [self.get_auction_from_id(x.id) for x in rows]
+
     def get_expired_auctions(self):
         try:
             ass = AuctionModel.select().where(AuctionModel.creation_date < (datetime.now() - Auction.DURATION))
@@ -1063,6 +1408,10 @@ class PilgramORMDatabase(PilgramDatabase):
         except AuctionModel.DoesNotExist:
             return []
 
+    def get_next_auction_expiry(self) -> datetime | None:
+        creation_date = AuctionModel.select(fn.MIN(AuctionModel.creation_date)).scalar()
+        return None if creation_date is None else creation_date + Auction.DURATION
+
     @_thread_safe()
     def update_auction(self, auction: Auction):
         try:
@@ -1102,6 +1451,12 @@ class PilgramORMDatabase(PilgramDatabase):
     @_thread_safe(lock=_NOTIFICATION_LOCK)
     def add_notification(self, notification: Notification) -> None:
         _NOTIFICATIONS_LIST.append(notification)
+        current_span().count("notifications")
+
+    @_thread_safe(lock=_NOTIFICATION_LOCK)
+    def add_notifications(self, notifications: list[Notification]) -> None:
+        _NOTIFICATIONS_LIST.extend(notifications)
+        current_span().count("notifications", len(notifications))
 
     # duels ----
 
@@ -1251,3 +1606,23 @@ class PilgramORMDatabase(PilgramDatabase):
         self.__class__._instance = self.__class__.__new__(self.__class__)
         self.__class__._instance.is_connected = False
         log.info("DB Instance recreated successfully")
+
+    def set_shared(self, shared: bool) -> None:
+        global _SHARED, _PLAYERS_SAMPLER
+        log.info(f"database shared with other processes: {shared}")
+        with _ROSTER_LOCK:
+            _SHARED = shared
+            _GUILD_ROSTERS.clear()
+        with _POOLS_LOCK:
+            _ZONE_EVENT_POOLS.clear()
+            _ENEMY_META_POOLS.clear()
+            _PLAYERS_SAMPLER = None
+        for cached_function in (
+            PilgramORMDatabase.get_player_data,
+            PilgramORMDatabase.get_player_items,
+            PilgramORMDatabase.get_player_artifacts,
+            PilgramORMDatabase.get_player_adventure_container,
+            PilgramORMDatabase.get_guild,
+            PilgramORMDatabase.get_top_n_guilds_by_score,
+        ):
+            cached_function.bypass = shared
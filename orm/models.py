@@ -1,4 +1,5 @@
 import logging
+import time
 from datetime import datetime, timedelta
 
 from peewee import (
@@ -14,9 +15,34 @@ from peewee import (
     SqliteDatabase,
 )
 
+from pilgram.profiling import current_span
+
 DB_FILENAME: str = "pilgram_v14.db"  # yes, I'm encoding the DB version in the filename, problem? :)
+_WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class _ImmediateSqliteDatabase(SqliteDatabase):
+    """ takes the write lock when a transaction begins, so concurrent processes wait on busy_timeout instead of
+    failing when a read transaction gets upgraded to a write """
+
+    def begin(self, lock_type=None):
+        return super().begin(lock_type or "IMMEDIATE")
+
+    def execute_sql(self, sql, *args, **kwargs):
+        # queries are timed & counted in the span of the manager tick that issued them (if any)
+        span = current_span()
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, *args, **kwargs)
+        finally:
+            span.add_time("db", time.perf_counter() - start)
+            span.count("queries")
+            if sql.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+                span.count("writes")
 
-db = SqliteDatabase(DB_FILENAME)
+
+# WAL lets the sharded quest workers (separate processes) read while another process is writing
+db = _ImmediateSqliteDatabase(DB_FILENAME, pragmas={"journal_mode": "wal", "busy_timeout": 10000})
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -165,7 +191,7 @@ class AuctionModel(BaseModel):
     item = ForeignKeyField(EquipmentModel, null=False)
     best_bidder = ForeignKeyField(PlayerModel, index=True, null=True, default=None)
     best_bid = IntegerField(null=False, default=0)
-    creation_date = DateTimeField(default=datetime.now)
+    creation_date = DateTimeField(default=datetime.now, index=True)  # used to find expired auctions & to sort them
 
 
 class PetModel(BaseModel):
@@ -181,6 +207,21 @@ class PetModel(BaseModel):
     modifiers = CharField(null=False, default="")  # modifiers are stored as a 16bit int for the modifier id + a 32bit int for the strength of the modifier
 
 
+class BankLogModel(BaseModel):
+    """ Append only table that contains all the deposits & withdrawals of the guild banks """
+    id = AutoField(primary_key=True)
+    guild = ForeignKeyField(GuildModel, backref="bank_logs", index=False, null=False)
+    player = ForeignKeyField(PlayerModel, backref="+", index=False, null=False)
+    log_type = CharField(null=False, max_length=10)  # 'deposit' or 'withdrawal'
+    amount = IntegerField(null=False)
+    date = DateTimeField(default=datetime.now)
+
+    class Meta:
+        indexes = (
+            (("guild", "log_type", "id"), False),  # last n transactions of a type
+        )
+
+
 def db_connect():
     log.info("Connecting to database")
     db.connect(reuse_if_open=True)
@@ -204,7 +245,19 @@ def create_tables():
         ArtifactModel,
         EquipmentModel,
         EnemyTypeModel,
-        AuctionModel
+        AuctionModel,
+        BankLogModel
     ], safe=True)
     log.info("All tables created")
     db_disconnect()
+
+
+def update_schema():
+    """
+    create the tables & indexes added after the tables of an existing database were created, they don't change the
+    existing data so they don't need a migration.
+    """
+    db_connect()
+    db.create_tables([BankLogModel], safe=True)
+    AuctionModel._schema.create_indexes(safe=True)
+    db_disconnect()
@@ -0,0 +1,237 @@
+import logging
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from peewee import chunked
+
+from orm.db import (
+    ENCODING,
+    PilgramORMDatabase,
+    encode_modifiers,
+    encode_progress,
+    encode_satchel,
+    encode_vocation_ids,
+    encode_vocation_progress,
+)
+from orm.models import (
+    AuctionModel,
+    EnemyTypeModel,
+    EquipmentModel,
+    GuildModel,
+    PlayerModel,
+    QuestModel,
+    QuestProgressModel,
+    ZoneEventModel,
+    ZoneModel,
+    db,
+)
+from pilgram.classes import Auction, Guild, Vocation
+from pilgram.equipment import ConsumableItem, Equipment, EquipmentType
+from pilgram.listables import DEFAULT_TAG
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+ZONE_LEVELS: tuple[int, ...] = (1, 5, 10, 15, 20, 30, 40, 50, 60, 75)
+MAX_PLAYER_LEVEL = 100
+INSERT_BATCH_SIZE = 100  # keeps the number of variables per insert well under sqlite's limit
+
+
+def _insert(model, rows: list[dict]) -> None:
+    with db.atomic():
+        for batch in chunked(rows, INSERT_BATCH_SIZE):
+            model.insert_many(batch).execute()
+
+
+def _encode_ids(ids: list[int]) -> str:
+    """ same format as orm.db.encode_equipped_items, without needing the Equipment objects """
+    return np.array(ids, np.uint32).tobytes().decode(encoding=ENCODING)
+
+
+def _get_level(rng: random.Random) -> int:
+    # most players are low level, few make it to the end game
+    return min(MAX_PLAYER_LEVEL, 1 + int(rng.expovariate(1 / 15)))
+
+
+def _get_rarity(rng: random.Random) -> int:
+    return rng.choices((0, 1, 2, 3), weights=(60, 25, 10, 5))[0]
+
+
+def _create_zones(rng: random.Random, quests_per_zone: int, events_per_zone: int, enemies_per_zone: int) -> None:
+    zones, quests, events, enemies = [], [], [], []
+    for zone_id, level in enumerate(ZONE_LEVELS, start=1):
+        zones.append({"id": zone_id, "name": f"Synthetic zone {zone_id}", "level": level, "description": "A zone."})
+        for number in range(quests_per_zone):
+            quests.append({
+                "id": ((zone_id - 1) * quests_per_zone) + number + 1,
+                "zone": zone_id,
+                "number": number,
+                "name": f"Quest {number} of zone {zone_id}",
+                "description": "Do the thing.",
+                "success_text": "You did the thing.",
+                "failure_text": "You did not do the thing."
+            })
+        for i in range(enemies_per_zone):
+            enemies.append({
+                "zone": zone_id,
+                "name": f"Synthetic enemy {zone_id}-{i}",
+                "description": "It's hostile.",
+                "win_text": "You won.",
+                "lose_text": "You lost."
+            })
+    for zone_id in range(len(ZONE_LEVELS) + 1):  # zone 0 is the town
+        events.extend({"zone_id": zone_id, "event_text": f"Something happens ({rng.random():.4f})."} for _ in range(events_per_zone))
+    _insert(ZoneModel, zones)
+    _insert(QuestModel, quests)
+    _insert(ZoneEventModel, events)
+    _insert(EnemyTypeModel, enemies)
+
+
+def populate_world(
+        players: int,
+        seed: int = 0,
+        first_player_id: int = 1,
+        update_interval: timedelta = timedelta(hours=2, minutes=30),
+        guild_ratio: float = 0.05,
+        items_per_player: int = 3,
+        auction_ratio: float = 0.02,
+        quests_per_zone: int = 50,
+        events_per_zone: int = 20,
+        enemies_per_zone: int = 5
+) -> dict[str, int]:
+    """
+    populate an empty database with a synthetic world, used to load test & benchmark the game at scale.
+
+    :param players: number of players to create, their ids start from first_player_id
+    :param seed: seed of the world, the same seed always generates the same players, guilds, auctions & quests
+    :param first_player_id: id of the first player
+    :param update_interval: update interval of the quest manager, last updates are spread over 1.5 intervals
+    :param guild_ratio: guilds created per player, members are distributed with a long tail
+    :param items_per_player: average number of items per player
+    :param auction_ratio: fraction of the items on auction, some are old enough to be expired
+    :param quests_per_zone: number of quests created for each zone
+    :param events_per_zone: number of zone events created for each zone (town included)
+    :param enemies_per_zone: number of enemy metas created for each zone
+    :return: the number of created rows by type
+    """
+    PilgramORMDatabase.instance()  # creates the tables if needed
+    if PlayerModel.select().count() > 0:
+        raise ValueError("the database already contains players, synthetic worlds need an empty database")
+    rng = random.Random(seed)
+    now = datetime.now()
+    _create_zones(rng, quests_per_zone, events_per_zone, enemies_per_zone)
+    tier_one_vocations = [v for v in Vocation.ALL_ITEMS[1:] if v.level == 1]
+    player_ids = list(range(first_player_id, first_player_id + players))
+    levels = {player_id: _get_level(rng) for player_id in player_ids}
+    # guilds, founders are always members of their own guild
+    guild_rows, guild_of_player = [], {}
+    founders = rng.sample(player_ids, int(players * guild_ratio))
+    for guild_id, founder_id in enumerate(founders, start=1):
+        guild_level = rng.randint(1, Guild.MAX_LEVEL)
+        guild_rows.append({
+            "id": guild_id,
+            "name": f"Synthetic guild {guild_id}",
+            "level": guild_level,
+            "description": "A guild.",
+            "founder": founder_id,
+            "prestige": int(rng.expovariate(1 / 500)),
+            "tourney_score": int(rng.expovariate(1 / 200)),
+            "bank": int(rng.expovariate(1 / 5000)),
+        })
+        guild_of_player[founder_id] = guild_id
+    if guild_rows:
+        capacity = {row["id"]: min(Guild.MAX_PLAYERS, row["level"] * Guild.PLAYERS_PER_LEVEL) - 1 for row in guild_rows}
+        weights = [1 / rank for rank in range(1, len(guild_rows) + 1)]  # a few big guilds & a lot of small ones
+        for player_id in player_ids:
+            if (player_id in guild_of_player) or (rng.random() > 0.5):
+                continue
+            guild_id = rng.choices(guild_rows, weights=weights)[0]["id"]
+            if capacity[guild_id] > 0:
+                capacity[guild_id] -= 1
+                guild_of_player[player_id] = guild_id
+    # items, the first item of each slot is equipped
+    item_rows, auction_rows, equipped_items = [], [], {}
+    for player_id in player_ids:
+        equipped_slots: dict[int, int] = {}
+        for _ in range(rng.randint(0, items_per_player * 2)):
+            equipment_type = rng.choice(EquipmentType.LISTS[DEFAULT_TAG])
+            item = Equipment.generate(max(1, levels[player_id] - rng.randint(0, 5)), equipment_type, _get_rarity(rng))
+            item_id = len(item_rows) + 1
+            item_rows.append({
+                "id": item_id,
+                "name": item.name[:50],
+                "level": item.level,
+                "equipment_type": equipment_type.equipment_type_id,
+                "owner": player_id,
+                "damage_seed": item.seed,
+                "modifiers": encode_modifiers(item.modifiers),
+            })
+            if equipment_type.slot not in equipped_slots:
+                equipped_slots[equipment_type.slot] = item_id
+            elif rng.random() < auction_ratio:
+                has_bidder = rng.random() < 0.5
+                auction_rows.append({
+                    "auctioneer": player_id,
+                    "item": item_id,
+                    "best_bidder": rng.choice(player_ids) if has_bidder else None,
+                    "best_bid": rng.randint(100, 10000) if has_bidder else 0,
+                    "creation_date": now - (Auction.DURATION * rng.uniform(0, 1.2)),
+                })
+        equipped_items[player_id] = list(equipped_slots.values())
+    # players & their quest progress
+    player_rows, progress_rows = [], []
+    for player_id in player_ids:
+        level = levels[player_id]
+        unlocked_zones = [zone_id for zone_id, zone_level in enumerate(ZONE_LEVELS, start=1) if zone_level <= level + 5]
+        zone_progress = {zone_id: rng.randint(0, quests_per_zone - 1) for zone_id in unlocked_zones}
+        vocations = rng.sample(tier_one_vocations, 2 if level >= 20 else (1 if level >= 5 else 0))
+        vocations_progress = {v.vocation_id: rng.randint(1, 5) for v in vocations}
+        player_rows.append({
+            "id": player_id,
+            "name": f"Synth{player_id}",
+            "description": "A synthetic player.",
+            "guild": guild_of_player.get(player_id),
+            "money": int(rng.lognormvariate(7, 1.5)),
+            "level": level,
+            "xp": rng.randint(0, level * 100),
+            "gear_level": max(0, level - rng.randint(0, 10)),
+            "progress": encode_progress(zone_progress),
+            "home_level": rng.randint(0, level // 5),
+            "renown": int(rng.expovariate(1 / (level * 10))),
+            "vocations": encode_vocation_ids(vocations),
+            "vocation_progress": encode_vocation_progress(vocations_progress),
+            "hp_percent": rng.uniform(0.2, 1.0),
+            "satchel": encode_satchel([ConsumableItem.get(rng.randint(0, len(ConsumableItem.ALL_ITEMS) - 1)) for _ in range(rng.randint(0, 5))]),
+            "equipped_items": _encode_ids(equipped_items[player_id]),
+            "completed_quests": rng.randint(0, level * 3),
+            "sanity": rng.randint(0, 100),
+            "max_level_reached": level,
+        })
+        # updates are spread over 1.5 intervals, so roughly a third of the players is due when the world is created
+        last_update = now - (update_interval * rng.uniform(0, 1.5))
+        if unlocked_zones and (rng.random() < 0.6):
+            zone_id = rng.choice(unlocked_zones)
+            progress_rows.append({
+                "player": player_id,
+                "quest": ((zone_id - 1) * quests_per_zone) + zone_progress[zone_id] + 1,
+                "end_time": now + timedelta(hours=rng.uniform(-2, 48)),
+                "last_update": last_update,
+            })
+        else:
+            progress_rows.append({"player": player_id, "quest": None, "end_time": now, "last_update": last_update})
+    _insert(PlayerModel, player_rows)
+    _insert(GuildModel, guild_rows)
+    _insert(QuestProgressModel, progress_rows)
+    _insert(EquipmentModel, item_rows)
+    _insert(AuctionModel, auction_rows)
+    PilgramORMDatabase.instance().reset_caches()
+    result = {
+        "players": len(player_rows),
+        "guilds": len(guild_rows),
+        "items": len(item_rows),
+        "auctions": len(auction_rows),
+        "quests": len(ZONE_LEVELS) * quests_per_zone,
+    }
+    log.info(f"synthetic world created: {result}")
+    return result
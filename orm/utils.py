@@ -1,17 +1,75 @@
 import logging
 import time
+from collections.abc import Callable
 from typing import Any
 
+from pilgram.profiling import find_reference_cycles, get_memory_usage
+
 __VALUE, __TTL = (0, 1)
 
 log = logging.getLogger(__name__)
 
+_CACHES: dict[str, Callable[[], list[Any]]] = {}  # cache name -> function that returns the cached values
+
+
+def _register_cache(func: Callable, get_values: Callable[[], list[Any]]) -> None:
+    _CACHES[func.__qualname__] = get_values
+
+
+def get_cached_values() -> dict[str, list[Any]]:
+    """ return the values currently stored in each cache, expired values included """
+    return {name: get_values() for name, get_values in _CACHES.items()}
+
+
+def get_caches_memory_report(top_types: int = 15) -> dict[str, Any]:
+    """
+    return the memory retained by each cache & by object type, plus the reference cycles between the cached objects.
+    Objects reachable from more than one cache (e.g. the founder of a cached guild) are counted in the first cache
+    that reaches them, caches are walked in the order they were defined.
+    """
+    seen: set[int] = set()
+    caches: dict[str, dict[str, int]] = {}
+    types: dict[str, list[int]] = {}
+    all_values: list[Any] = []
+    for name, values in get_cached_values().items():
+        size, cache_types = get_memory_usage(values, seen)
+        caches[name] = {"entries": len(values), "bytes": size}
+        for type_name, (count, type_size) in cache_types.items():
+            record = types.setdefault(type_name, [0, 0])
+            record[0] += count
+            record[1] += type_size
+        all_values.extend(values)
+    return {
+        "total bytes": sum(cache["bytes"] for cache in caches.values()),
+        "caches": caches,
+        "types": dict(sorted(types.items(), key=lambda x: x[1][1], reverse=True)[:top_types]),
+        "cycles": find_reference_cycles(all_values)
+    }
+
+
+def _add_cache_controls(wrapper: Callable, storage: dict[Any, tuple[Any, float]]) -> None:
+    """
+    add to the wrapper of a keyed cache:
+        bypass: if True the wrapped function is always called & nothing is cached (e.g. when other processes write
+            the same records, so cached values can't be trusted)
+        evict(matches): remove & return the values for which matches(key, value) is True, the key is the call arguments
+    """
+    def evict(matches: Callable[[tuple, Any], bool]) -> list[Any]:
+        keys = [key for key, record in list(storage.items()) if matches(key, record[__VALUE])]
+        return [record[__VALUE] for record in (storage.pop(key, None) for key in keys) if record is not None]
+
+    wrapper.bypass = False
+    wrapper.evict = evict
+
 
 def cache_ttl_quick(ttl=3600):
     def decorator(func):
         storage: dict[Any, tuple[Any, float]] = {}
+        _register_cache(func, lambda: [record[__VALUE] for record in list(storage.values())])
 
         def wrapper(*args, **kwargs):
+            if wrapper.bypass:
+                return func(*args, **kwargs)
             # Generate a key based on arguments being passed
             key = args
             # if value is cached and isn't expired then return
@@ -28,6 +86,7 @@ def cache_ttl_quick(ttl=3600):
             # add value to storage and return the resulting value
             storage[key] = (result, time.time() + ttl)
             return result
+        _add_cache_controls(wrapper, storage)
         return wrapper
     return decorator
 
@@ -49,8 +108,11 @@ def __get_oldest_key(storage: dict, ttl: float):
 def cache_sized_ttl_quick(size_limit=256, ttl=3600):
     def decorator(func):
         storage: dict[Any, tuple[Any, float]] = {}
+        _register_cache(func, lambda: [record[__VALUE] for record in list(storage.values())])
 
         def wrapper(*args, **kwargs):
+            if wrapper.bypass:
+                return func(*args, **kwargs)
             # Generate a key based on arguments being passed
             key = args
             # if value is cached and isn't expired then return
@@ -73,6 +135,7 @@ def cache_sized_ttl_quick(size_limit=256, ttl=3600):
             # add value to storage and return the resulting value
             storage[key] = (result, time.time() + ttl)
             return result
+        _add_cache_controls(wrapper, storage)
         return wrapper
     return decorator
 
@@ -81,6 +144,7 @@ def cache_ttl_single_value(ttl=3600):
     def decorator(func):
         value = None
         time_to_live = time.time()
+        _register_cache(func, lambda: [] if value is None else [value])
 
         def wrapper(*args, **kwargs):
             nonlocal value, time_to_live
@@ -89,5 +153,13 @@ def cache_ttl_single_value(ttl=3600):
             value = func(*args, **kwargs)
             time_to_live = time.time() + ttl
             return value
+
+        def expire() -> None:
+            """ compute the value again on the next call """
+            nonlocal value, time_to_live
+            value = None
+            time_to_live = time.time()
+
+        wrapper.expire = expire
         return wrapper
     return decorator
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import logging
 import math
 import os
@@ -12,7 +11,6 @@ from copy import copy
 from datetime import datetime, timedelta
 from typing import Any
 
-import numpy as np
 
 import pilgram.modifiers as m
 from pilgram.combat_classes import CombatActions, CombatActor, Damage, Stats
@@ -44,11 +42,10 @@ from pilgram.listables import Listable
 from pilgram.strings import MONEY, Strings
 from pilgram.utils import (
     FuncWithParam,
+    get_rng,
     print_bonus,
-    read_text_file,
     read_json_file,
     read_update_interval,
-    save_text_to_file,
     save_json_to_file,
 )
 
@@ -275,11 +272,11 @@ class Quest:
         return value_to_beat
 
     def finish_quest(
-        self, player: Player
+        self, player: Player, rng: random.Random | None = None
     ) -> tuple[bool, int, int]:  # win/lose, roll, roll to beat
         """return true if the player has successfully finished the quest"""
         value_to_beat = self.get_value_to_beat(player)
-        roll = player.roll(20)
+        roll = player.roll(20, rng)
         if roll == 1:
             log.info(f"{player.name} rolled a critical failure on quest {self.name}")
             return False, 1, value_to_beat  # you can still get a critical failure
@@ -288,17 +285,17 @@ class Quest:
             return True, 20, value_to_beat  # you can also get a critical success
         if (roll - value_to_beat) == -1:
             # if the player missed the roll by 1 have an 80% chance of gracing them
-            if random.randint(1, 10) > 2:
+            if get_rng(rng).randint(1, 10) > 2:
                 roll += 1
         log.info(f"{self.name}: to beat: {value_to_beat}, {player.name} rolled: {roll}")
         return roll >= value_to_beat, roll, value_to_beat
 
-    def get_rewards(self, player: Player) -> tuple[int, int]:
+    def get_rewards(self, player: Player, rng: random.Random | None = None) -> tuple[int, int]:
         """return the amount of xp & money the completion of the quest rewards"""
         guild_level = player.guild_level()
         multiplier = self.zone.level + self.number
         guild_level_bonus = guild_level * (5000 if guild_level < 10 else 10000)
-        bonus = random.randint(0, 50) + guild_level_bonus
+        bonus = get_rng(rng).randint(0, 50) + guild_level_bonus
         return (
             int(
                 ((self.BASE_XP_REWARD * multiplier) + bonus) * player.vocation.quest_xp_mult
@@ -437,6 +434,7 @@ class Player(CombatActor):
     MAX_HOME_LEVEL = 10
 
     FIST_DAMAGE = Damage(0, 0, 1, 0, 0, 0, 0, 0)
+    COMBAT_STATE = CombatActor.COMBAT_STATE + ("satchel", "flags", "sanity")
 
     def __init__(
         self,
@@ -453,7 +451,7 @@ class Player(CombatActor):
         artifact_pieces: int,
         last_cast: datetime,
         artifacts: list[Artifact],
-        flags: np.uint32,
+        flags: int,
         renown: int,
         vocations: list[Vocation],
         satchel: list[ConsumableItem],
@@ -485,7 +483,7 @@ class Player(CombatActor):
         :param home_level(int): current level of the home owned by the player, potentially unlimited
         :param artifact_pieces (int): number of artifact pieces of the player. Use 10 to build a new artifact.
         :param last_cast (datetime): last spell cast datetime.
-        :param flags (np.uint32): flags of the player, can be used for anything
+        :param flags (int): flags of the player, can be used for anything
         :param renown (int): renown of the player, used for ranking
         :param vocations: the player's vocations
         :param satchel: the player's satchel which holds consumable items
@@ -537,9 +535,7 @@ class Player(CombatActor):
         self.pet = pet
 
     def equip_vocations(self, vocations: list[Vocation]) -> None:
-        self.vocation: Vocation = Vocation.empty()
-        for v in vocations:
-            self.vocation += v
+        self.vocation: Vocation = Vocation.combine(vocations)
 
     def get_name(self) -> str:
         return self.name
@@ -626,18 +622,19 @@ class Player(CombatActor):
     def add_artifact_pieces(self, amount: int) -> None:
         self.artifact_pieces += amount
 
-    def roll(self, dice_faces: int) -> int:
+    def roll(self, dice_faces: int, rng: random.Random | None = None) -> int:
         """roll a dice and apply all advantages / disadvantages"""
-        roll = random.randint(1, dice_faces) + self.vocation.roll_bonus
+        rng = get_rng(rng)
+        roll = rng.randint(1, dice_faces) + self.vocation.roll_bonus
         for modifier, flag in zip(
             (-1, -1, 1, 2), (HexedFlag, CursedFlag, LuckFlag1, LuckFlag2), strict=False
         ):
             if flag.is_set(self.flags):
                 roll += modifier
                 self.unset_flag(flag)
-        if random.randint(1, 10) > 5:
+        if rng.randint(1, 10) > 5:
             # skew the roll to avoid players failing too much
-            roll += random.randint(1, 5)
+            roll += rng.randint(1, 5)
         if roll < 1:
             return 1
         if roll > dice_faces:
@@ -824,7 +821,7 @@ class Player(CombatActor):
     def get_stance(self) -> str:
         return self.stance
 
-    def get_delay(self) -> int:
+    def get_delay(self, rng: random.Random | None = None) -> int:
         value = 0
         for item in self.equipped_items.values():
             value += item.equipment_type.delay
@@ -880,7 +877,7 @@ class Player(CombatActor):
         "a": (CombatActions.attack, CombatActions.attack),
     }
 
-    def choose_action(self, opponent: CombatActor) -> int:
+    def choose_action(self, opponent: CombatActor, rng: random.Random | None = None) -> int:
         main_pool = (
             self.STANCE_POOL
             if (self.satchel and (self.hp_percent < 0.55))
@@ -891,7 +888,7 @@ class Player(CombatActor):
         )
         if self.vocation.lick_wounds:
             selected_pool += (CombatActions.lick_wounds,)
-        selection = random.choice(selected_pool)
+        selection = get_rng(rng).choice(selected_pool)
         return selection
 
     def get_vocation_limit(self) -> int:
@@ -992,7 +989,7 @@ class Player(CombatActor):
             0,
             datetime.now(),
             [],
-            np.uint32(0),
+            0,
             0,
             [],
             [],
@@ -1013,6 +1010,65 @@ class Player(CombatActor):
         )
 
 
+class Shade(Player):
+    """
+    lightweight combat snapshot of a player, fought by other players when they meet it.
+    Only holds what a fight needs, vocation, equipped items & artifacts are shared with the original player.
+    """
+
+    def __init__(
+            self,
+            player: Player,
+            equipped_items: dict[int, Equipment],
+            satchel: list[ConsumableItem],
+            suffix: str
+    ) -> None:
+        """
+        :param player: the player the shade is a snapshot of
+        :param equipped_items: the items equipped by the shade, a subset of the items equipped by the player
+        :param satchel: the consumables the shade can use during the fight
+        :param suffix: added to the name of the player to get the name of the shade
+        """
+        self.player_id = player.player_id
+        self.name = player.name + suffix
+        self.level = player.level
+        self.gear_level = player.gear_level
+        self.flags = player.flags
+        self.sanity = player.sanity
+        self.stance = player.stance
+        self.vocation = player.vocation
+        self.artifacts = player.artifacts
+        self.equipped_items = equipped_items
+        self.satchel = satchel
+        self.guild = None
+        self.pet = None
+        CombatActor.__init__(self, 1.0, 1, copy(player.stats))
+
+    @classmethod
+    def create(
+            cls,
+            player: Player,
+            max_equipped_items: int = 3,
+            empty_satchel: bool = True,
+            suffix: str = "'s Shade",
+            rng: random.Random | None = None
+    ) -> Shade:
+        """create a shade keeping at most max_equipped_items random items of the ones equipped by the player"""
+        equipped_items = dict(player.equipped_items)
+        while len(equipped_items) > max_equipped_items:
+            del equipped_items[get_rng(rng).choice(list(equipped_items.keys()))]
+        return cls(player, equipped_items, [] if empty_satchel else list(player.satchel), suffix)
+
+    def __str__(self) -> str:
+        return f"*{self.name}*\n{self.hp}/{self.get_base_max_hp()}"
+
+    def __hash__(self) -> int:
+        return id(self)
+
+    def __eq__(self, other: Any) -> bool:
+        return self is other
+
+
 class Guild:
     """Player created guilds that other players can join. Players get bonus xp & money from quests when in guilds"""
 
@@ -1065,31 +1121,6 @@ class Guild:
             return self.MAX_PLAYERS
         return value
 
-    def get_bank_logs_file_path(self):
-        # we should separate data layer & control layer but eh, it's fine for this for now.
-        return f"bank_logs/{self.guild_id}.txt"
-
-    def get_bank_logs_data(self) -> str:
-        file_path = self.get_bank_logs_file_path()
-        try:
-            data = read_text_file(file_path)
-            if data:
-                return data
-            else:
-                return Strings.no_logs
-        except FileNotFoundError:
-            save_text_to_file(file_path, '')  # create the file
-            return Strings.no_logs
-
-    def create_bank_log(self, log_type: str, player_id: int, amount: int):
-        file_path = self.get_bank_logs_file_path()
-        data = self.get_bank_logs_data()
-        if data == Strings.no_logs:
-            data = ''
-        new_data = data + json.dumps({"transaction": log_type, "by": player_id, "amount": amount}) + "\n"
-        save_text_to_file(file_path, new_data)
-        return new_data
-
     def can_add_member(self, current_members: int) -> bool:
         return current_members < self.get_max_members()
 
@@ -1494,6 +1525,8 @@ class Vocation(Listable["Vocation"], base_filename="vocations"):
     """a horrible way to implement modifiers but it works"""
 
     MAX_LEVEL = 5
+    _TIERS: dict[tuple[int, int], Vocation] = {}  # (vocation id, level) -> vocation, built on first use
+    _COMBINED: dict[tuple[int, ...], Vocation] = {}  # unique ids -> sum of the vocations
 
     def __init__(
         self,
@@ -1565,11 +1598,11 @@ class Vocation(Listable["Vocation"], base_filename="vocations"):
         }
 
     def __add__(self, other: Vocation) -> Vocation:
-        if other.vocation_id in self.original_vocations:
+        if any(v.vocation_id == other.vocation_id for v in self.original_vocations):
             return self
         result = Vocation(0, 0, f"{self.name} {other.name}", "", {}, 1)
         result.name = result.name.lstrip()
-        result.original_vocations = self.original_vocations
+        result.original_vocations = copy(self.original_vocations)
         if self.unique_id != 0:
             result.original_vocations.append(self)
         if other.unique_id != 0:
@@ -1671,19 +1704,40 @@ class Vocation(Listable["Vocation"], base_filename="vocations"):
     def empty(cls):
         return cls(0, 0, "", "", {}, 0)
 
+    @classmethod
+    def combine(cls, vocations: list[Vocation]) -> Vocation:
+        """
+        return the sum of the given vocations. Equal combinations share the same object (players with the same
+        vocations get the same one), so the result must never be modified.
+        """
+        key = tuple(v.unique_id for v in vocations)
+        result = cls._COMBINED.get(key)
+        if result is None:
+            result = cls.empty()
+            for vocation in vocations:
+                result += vocation
+            cls._COMBINED[key] = result
+        return result
+
+    @classmethod
+    def get_tier(cls, vocation_id: int, level: int) -> Vocation:
+        if not cls._TIERS:
+            for vocation in cls.ALL_ITEMS:
+                cls._TIERS.setdefault((vocation.vocation_id, vocation.level), vocation)
+        try:
+            return cls._TIERS[(vocation_id, level)]
+        except KeyError:
+            raise ValueError(f"Vocation with id {vocation_id} does not exist")
+
     @classmethod
     def get_correct_vocation_tier(cls, vocation_id: int, player: Player) -> Vocation:
-        for vocation in Vocation.ALL_ITEMS:
-            if (vocation.vocation_id == vocation_id) and (vocation.level == player.get_vocation_level(vocation_id)):
-                return vocation
-        raise ValueError(f"Vocation with id {vocation_id} does not exist")
+        return cls.get_tier(vocation_id, player.get_vocation_level(vocation_id))
 
     @classmethod
     def get_correct_vocation_tier_no_player(cls, vocation_id: int, vocation_progress: dict[int, int]) -> Vocation:
-        for vocation in Vocation.ALL_ITEMS[1:]:
-            if (vocation.vocation_id == vocation_id) and (vocation.level == vocation_progress.get(vocation_id, 1)):
-                return vocation
-        raise ValueError(f"Vocation with id {vocation_id} does not exist")
+        if vocation_id == 0:
+            raise ValueError(f"Vocation with id {vocation_id} does not exist")
+        return cls.get_tier(vocation_id, vocation_progress.get(vocation_id, 1))
 
     def get_upgrade_cost(self) -> int:
         value = {
@@ -1782,15 +1836,17 @@ class Enemy(CombatActor):
         meta: EnemyMeta,
         modifiers: list[m.Modifier],
         level_modifier: int,
-        name_prefix: str = ""
+        name_prefix: str = "",
+        rng: random.Random | None = None
     ) -> None:
+        rng = get_rng(rng)
         self.meta = meta
         self.modifiers = modifiers
-        self.level_modifier = level_modifier + random.randint(-5, 2)
-        self.delay = 7 + meta.zone.extra_data.get("delay", 0) + random.randint(-5, 5)
+        self.level_modifier = level_modifier + rng.randint(-5, 2)
+        self.delay = 7 + meta.zone.extra_data.get("delay", 0) + rng.randint(-5, 5)
         self.stance = self.meta.zone.extra_data.get("stance", "r")
         self.name_prefix = name_prefix
-        super().__init__(1.0, 1, Stats.generate_random(0, self.get_level()))
+        super().__init__(1.0, 1, Stats.generate_random(0, self.get_level(), seed=rng.random()))
 
     def get_name(self) -> str:
         return "the " + self.name_prefix + self.meta.name.rstrip().lstrip("The ")
@@ -1819,8 +1875,8 @@ class Enemy(CombatActor):
                 result.append(modifier)
         return result
 
-    def get_delay(self) -> int:
-        value = self.delay + random.randint(-3, 3)
+    def get_delay(self, rng: random.Random | None = None) -> int:
+        value = self.delay + get_rng(rng).randint(-3, 3)
         return max(value, 0)
 
     def get_stance(self) -> str:
@@ -1892,8 +1948,8 @@ class Pet(CombatActor):
                 result.append(modifier)
         return result
 
-    def get_delay(self) -> int:
-        value = self.delay + random.randint(-3, 3)
+    def get_delay(self, rng: random.Random | None = None) -> int:
+        value = self.delay + get_rng(rng).randint(-3, 3)
         return max(value, 0)
 
     def __str__(self) -> str:
@@ -1902,6 +1958,8 @@ class Pet(CombatActor):
 
 class Auction:
     DURATION = timedelta(weeks=1)
+    PAGE_SIZE = 10
+    SORTS = ("ending", "price", "level")
 
     def __init__(
         self,
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 import random
 from abc import ABC
 from copy import copy
@@ -8,6 +9,10 @@ from typing import Any
 
 import pilgram.classes as c
 import pilgram.modifiers as m
+from pilgram.utils import get_rng
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
 
 
 class CombatActions:
@@ -60,6 +65,7 @@ class Damage:
                         "supplier": supplier,
                         "other": other,
                         "context": combat_context,
+                        "rng": combat_context.rng if combat_context else None,
                     }
                 )
             )
@@ -362,6 +368,8 @@ class Stats:
 
 
 class CombatActor(ABC):
+    # attributes that a fight can change, used to bring back the results of fights simulated on copies of the actor
+    COMBAT_STATE: tuple[str, ...] = ("hp", "hp_percent", "timed_modifiers")
 
     def __init__(self, hp_percent: float, team: int, stats: Stats) -> None:
         self.hp_percent = hp_percent  # used out of fights
@@ -395,11 +403,11 @@ class CombatActor(ABC):
         """generic method that should return an (optionally filtered) list of modifiers. (args are the filters)"""
         raise NotImplementedError
 
-    def roll(self, dice_faces: int):
+    def roll(self, dice_faces: int, rng: random.Random | None = None):
         """generic method used to roll dices for entities, default implementation provided."""
-        return random.randint(1, dice_faces)
+        return get_rng(rng).randint(1, dice_faces)
 
-    def get_delay(self) -> int:
+    def get_delay(self, rng: random.Random | None = None) -> int:
         """returns the delay of the actor, which is a factor that determines who goes first in the combat turn"""
         raise NotImplementedError
 
@@ -409,12 +417,13 @@ class CombatActor(ABC):
         """
         return "b"
 
-    def choose_action(self, opponent: CombatActor) -> int:
+    def choose_action(self, opponent: CombatActor, rng: random.Random | None = None) -> int:
         """
         return what the entity wants to do (possible actions defined in CombatActions), default implementation provided.
         """
+        rng = get_rng(rng)
         if self.hp_percent > 0.5:
-            return random.choice(
+            return rng.choice(
                 (
                     CombatActions.attack,
                     CombatActions.attack,
@@ -423,7 +432,7 @@ class CombatActor(ABC):
                     CombatActions.dodge,
                 )
             )
-        return random.choice(
+        return rng.choice(
             (
                 CombatActions.attack,
                 CombatActions.attack,
@@ -448,6 +457,13 @@ class CombatActor(ABC):
         modifiers.sort(key=lambda x: x.OP_ORDERING)
         return modifiers
 
+    def copy_combat_state(self, other: CombatActor) -> None:
+        """copy the state changed by a fight from another copy of the same actor"""
+        if other is self:
+            return
+        for attribute in self.COMBAT_STATE:
+            self.__dict__[attribute] = other.__dict__[attribute]
+
     def start_fight(self) -> None:
         self.hp = int(self.get_max_hp() * self.hp_percent)
 
@@ -504,9 +520,9 @@ class CombatActor(ABC):
         damage_received = -damage.get_total_damage()
         return self.modify_hp(damage_received)
 
-    def get_initiative(self) -> int:
+    def get_initiative(self, rng: random.Random | None = None) -> int:
         """returns the initiative of the actor, which determines who goes first in the combat turn"""
-        value = self.get_delay() - random.randint(1, 20)
+        value = self.get_delay(rng) - get_rng(rng).randint(1, 20)
         if self.get_stance() == "r":
             value -= 1
         elif self.get_stance() == "s":
@@ -524,8 +540,8 @@ class CombatActor(ABC):
         return multiplier * level, multiplier * level
 
     @staticmethod
-    def get_stamina_regeneration() -> float:
-        return 0.2 + random.choice((-0.02, -0.01, 0.0, 0.01, 0.02))
+    def get_stamina_regeneration(rng: random.Random | None = None) -> float:
+        return 0.2 + get_rng(rng).choice((-0.02, -0.01, 0.0, 0.01, 0.02))
 
     def get_prestige(self, zone_level: int) -> int:
         """Returns the prestige given by killing this actor"""
@@ -539,7 +555,13 @@ class CombatContainer:
         self,
         participants: list[CombatActor],
         helpers: dict[CombatActor, CombatActor | None],
+        seed: int | None = None
     ) -> None:
+        """
+        :param participants: the actors taking part in the fight
+        :param helpers: the actors helping each participant (if any)
+        :param seed: seed of the fight rng, pass the same seed to replay the exact same fight. Random if None.
+        """
         self.participants = participants
         self.helpers = helpers
         self.combat_log: str = ""
@@ -549,6 +571,8 @@ class CombatContainer:
         self._reset_damage_and_resist_scales()
         self.turn = 0
         self.death_was_notified: list[CombatActor] = []
+        self.seed: int = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
 
     def _reset_damage_and_resist_scales(self) -> None:
         for actor in self.participants:
@@ -566,6 +590,7 @@ class CombatContainer:
 
     def get_mod_context(self, context: dict[str, Any]) -> m.ModifierContext:
         context["context"] = self
+        context["rng"] = self.rng
         return m.ModifierContext(context)
 
     def _start_combat(self) -> None:
@@ -581,6 +606,7 @@ class CombatContainer:
             )
             + "*"
         )
+        log.info(f"combat seed {self.seed}: {self.combat_log.strip('*')}")
         for participant in self.participants:
             participant.hp = int(participant.get_max_hp() * participant.hp_percent)
             for modifier in participant.get_entity_modifiers(
@@ -589,7 +615,7 @@ class CombatContainer:
                 modifier.apply(self.get_mod_context({"entity": participant}))
 
     def regenerate_stamina(self, actor: CombatActor, opponent: CombatActor) -> None:
-        amount = actor.get_stamina_regeneration()
+        amount = actor.get_stamina_regeneration(self.rng)
         for modifier in actor.get_modifiers(m.ModifierType.STAMINA_REGEN):
             amount *= modifier.apply(self.get_mod_context({"entity": actor, "opponent": opponent, "turn": self.turn}))
         self.stamina[actor] += amount
@@ -599,7 +625,7 @@ class CombatContainer:
     def _attack(self, attacker: CombatActor, target: CombatActor) -> None:
         self.write_to_log(f"{attacker.get_name()} attacks.")
         # deplete stamina
-        self.stamina[attacker] -= (attacker.get_delay() / 100)
+        self.stamina[attacker] -= (attacker.get_delay(self.rng) / 100)
         if self.stamina[attacker] < 0.0:
             self.stamina[attacker] = 0.0
         # get total damage inflicted
@@ -681,7 +707,7 @@ class CombatContainer:
 
     def choose_attack_target(self, attacker: CombatActor) -> CombatActor | None:
         temp_participants = self.get_alive_actors()
-        random.shuffle(temp_participants)
+        self.rng.shuffle(temp_participants)
         for participant in temp_participants:
             if participant.team != attacker.team:
                 return participant
@@ -707,7 +733,7 @@ class CombatContainer:
                     self.write_to_log(f"SUDDEN DEATH! {participant.get_name()} loses {amount} HP ({participant.get_hp_string()})")
             self.write_to_log("")
             # sort participants based on what they rolled on initiative
-            self.participants.sort(key=lambda a: a.get_initiative())
+            self.participants.sort(key=lambda a: a.get_initiative(self.rng))
             # choose & perform actions
             for actor in self.participants:
                 # lose dodge over time
@@ -734,7 +760,7 @@ class CombatContainer:
                 if not self.stamina[actor] >= 1.0:
                     action_id = CombatActions.catch_breath
                 else:
-                    action_id = actor.choose_action(opponent)
+                    action_id = actor.choose_action(opponent, self.rng)
                 # actually do stuff
                 if action_id == CombatActions.attack:
                     self._attack(actor, opponent)
@@ -744,7 +770,7 @@ class CombatContainer:
                         self._attack(actor, opponent)
                     else:
                         # if actor isn't already dodging then dodge
-                        factor = actor.get_delay() / 100
+                        factor = actor.get_delay(self.rng) / 100
                         if factor > 0.9:
                             factor = 0.9
                         self.resist_scale[actor] = factor
@@ -774,9 +800,9 @@ class CombatContainer:
                 elif action_id == CombatActions.catch_breath:
                     self.write_to_log(f"{actor.get_name()} is recovering ({int(self.stamina[actor] * 100)}%)")
                 # use helpers
-                if (actor in self.helpers) and self.helpers[actor] and (random.randint(1, 5) == 1):  # 20% chance of helper intervention
+                if (actor in self.helpers) and self.helpers[actor] and (self.rng.randint(1, 5) == 1):  # 20% chance of helper intervention
                     helper = self.helpers[actor]
-                    damage = int(helper.get_level() * (1 + random.random()))
+                    damage = int(helper.get_level() * (1 + self.rng.random()))
                     opponent.modify_hp(-damage)
                     self.write_to_log(
                         f"{helper.get_name()} helps {actor.get_name()} by dealing {damage} dmg to {opponent.get_name()}."
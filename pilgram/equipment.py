@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import time
+from functools import lru_cache
 from random import Random, choice
 from typing import Any
 
@@ -23,6 +24,7 @@ from pilgram.strings import Strings
 
 MONEY = ContentMeta.get("money.name")
 REROLL_MULT: int = ContentMeta.get("crafting.reroll_mult")
+ITEM_DAMAGE_CACHE_SIZE: int = 20000
 
 
 def _get_slot(value: str | int) -> int:
@@ -103,21 +105,48 @@ class Equipment:
             equipment_type: EquipmentType,
             name: str,
             seed: float,
-            damage: Damage,
-            resist: Damage,
+            damage: Damage | None,
+            resist: Damage | None,
             modifiers: list[m.Modifier],
             rerolls: int
     ) -> None:
+        """ if damage & resist are None they are derived from the seed the first time they are needed """
         self.equipment_id = equipment_id
         self.level = level
         self.name = name
         self.seed = seed
         self.equipment_type = equipment_type
-        self.damage = damage + self.equipment_type.damage.scale(level)
-        self.resist = resist + self.equipment_type.resist.scale(level)
+        self._damage: Damage | None = None
+        self._resist: Damage | None = None
+        if (damage is not None) and (resist is not None):
+            self._damage = damage + self.equipment_type.damage.scale(level)
+            self._resist = resist + self.equipment_type.resist.scale(level)
         self.modifiers = modifiers
         self.rerolls = rerolls
 
+    def __materialize_damage(self) -> None:
+        self._damage, self._resist = _get_item_damage(self.equipment_type.equipment_type_id, self.level, self.seed)
+
+    @property
+    def damage(self) -> Damage:
+        if self._damage is None:
+            self.__materialize_damage()
+        return self._damage
+
+    @damage.setter
+    def damage(self, value: Damage) -> None:
+        self._damage = value
+
+    @property
+    def resist(self) -> Damage:
+        if self._resist is None:
+            self.__materialize_damage()
+        return self._resist
+
+    @resist.setter
+    def resist(self, value: Damage) -> None:
+        self._resist = value
+
     def get_modifiers(self, type_filters: tuple[int, ...] | None) -> list[m.Modifier]:
         if not type_filters:
             return self.modifiers
@@ -157,11 +186,7 @@ class Equipment:
 
     def temper(self):
         self.level += 1
-        _, damage, resist = self.generate_dmg_and_resist_values(
-            self.level, self.seed, self.equipment_type.is_weapon
-        )
-        self.damage = self.equipment_type.damage.scale(self.level) + damage
-        self.resist = self.equipment_type.resist.scale(self.level) + resist
+        self.__materialize_damage()
         self.rerolls += 1
 
 
@@ -272,6 +297,17 @@ class Equipment:
         )
 
 
+@lru_cache(maxsize=ITEM_DAMAGE_CACHE_SIZE)
+def _get_item_damage(equipment_type_id: int, level: int, seed: float) -> tuple[Damage, Damage]:
+    """
+    return the damage & resist of an item, which only depend on its type, level & seed. The results are shared by all
+    the items with the same values, Damage objects are never modified in place so that is safe.
+    """
+    equipment_type = EquipmentType.get(equipment_type_id)
+    _, damage, resist = Equipment.generate_dmg_and_resist_values(level, seed, equipment_type.is_weapon)
+    return damage + equipment_type.damage.scale(level), resist + equipment_type.resist.scale(level)
+
+
 class ConsumableItem(Listable, base_filename="consumables"):
     """ consumables that can be used by the player or are used automatically in combat. """
 
@@ -1,39 +1,58 @@
 from abc import ABC
+from collections.abc import Iterable
 
-import numpy as np
-
-_NEXT_FLAG: np.uint32 = np.uint32(1)  # we can have a maximum of 32 flags
+MAX_FLAGS = 32  # flags are stored as a 32 bit int
+_NEXT_FLAG: int = 1
 
 
 class Flag(ABC):
-    FLAG: np.uint32
+    """ flags are bits of a plain int, numpy scalars were slower to operate on since these checks run every turn """
+    FLAG: int
 
     def __init_subclass__(cls, **kwargs) -> None:
         global _NEXT_FLAG
         super().__init_subclass__()
+        if _NEXT_FLAG >= (1 << MAX_FLAGS):
+            raise ValueError(f"Cannot define flag {cls.__name__}, there can be at most {MAX_FLAGS} flags")
         cls.FLAG = _NEXT_FLAG
-        _NEXT_FLAG = np.left_shift(_NEXT_FLAG, 1)
+        _NEXT_FLAG <<= 1
 
     @classmethod
-    def set(cls, target: np.uint32) -> np.uint32:
-        """returns the target flag container (a 64 bit int) with the current flag set"""
-        return np.bitwise_or(cls.FLAG, target)
+    def set(cls, target: int) -> int:
+        """returns the target flag container (a 32 bit int) with the current flag set"""
+        return target | cls.FLAG
 
     @classmethod
-    def unset(cls, target: np.uint32) -> np.uint32:
-        return np.bitwise_xor(cls.FLAG, target)
+    def unset(cls, target: int) -> int:
+        return target & ~cls.FLAG
 
     @classmethod
-    def is_set(cls, target: np.uint32) -> bool:
-        return np.bitwise_and(cls.FLAG, target) == cls.FLAG
+    def is_set(cls, target: int) -> bool:
+        return (target & cls.FLAG) != 0
 
     @classmethod
-    def get(cls) -> np.uint32:
+    def get(cls) -> int:
         return cls.FLAG
 
     @classmethod
-    def get_empty(cls) -> np.uint32:
-        return np.uint32(0)
+    def get_empty(cls) -> int:
+        return 0
+
+
+def get_mask(flags: Iterable[type[Flag]]) -> int:
+    """ return an int with all the given flags set, used to set or unset a group of flags at once """
+    mask = 0
+    for flag in flags:
+        mask |= flag.FLAG
+    return mask
+
+
+def set_flags(target: int, mask: int) -> int:
+    return target | mask
+
+
+def unset_flags(target: int, mask: int) -> int:
+    return target & ~mask
 
 
 class HexedFlag(Flag):
@@ -189,3 +208,6 @@ PITY_FLAGS: tuple[type[Flag], ...] = (
     Pity4,
     Pity5
 )
+
+BUFF_FLAGS_MASK: int = get_mask(BUFF_FLAGS)
+PITY_FLAGS_MASK: int = get_mask(PITY_FLAGS)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 from abc import ABC
+from contextlib import AbstractContextManager
 from datetime import datetime, timedelta
 from typing import Any
 
@@ -32,11 +33,23 @@ class NoArtifactsError(Exception):
     pass
 
 
+class GenerationBatchError(Exception):
+    """ raised when a generation batch failed, expired or was cancelled & will never produce results """
+    pass
+
+
 class PilgramDatabase(ABC):
     def acquire(self) -> PilgramDatabase:
         """generic method to get self, used to make the pilgram package implementation agnostic"""
         raise NotImplementedError
 
+    def transaction(self) -> AbstractContextManager:
+        """
+        return a context manager that groups all the writes made in its with block in a single transaction,
+        either all of them are saved or none are. Other threads wait for the transaction to end before writing.
+        """
+        raise NotImplementedError
+
     # players ----------------------------------
 
     def get_player_data(self, player_id) -> Player:
@@ -47,8 +60,13 @@ class PilgramDatabase(ABC):
         """
         raise NotImplementedError
 
-    def get_random_player_data(self) -> Player:
-        """ returns a random complete player object """
+    def get_random_player_data(self, level: int | None = None) -> Player:
+        """
+        returns a random complete player object. If level is given the player is picked between the players with a
+        similar level (if there are any).
+
+        :raises KeyError: if there are no players
+        """
         raise NotImplementedError
 
     def get_player_id_from_name(self, player_name) -> int:
@@ -172,6 +190,18 @@ class PilgramDatabase(ABC):
         """ delete the guild with the given id """
         raise NotImplementedError
 
+    def add_bank_log(self, guild: Guild, log_type: str, player_id: int, amount: int) -> None:
+        """ record a deposit or withdrawal (log_type) in the guild bank """
+        raise NotImplementedError
+
+    def get_bank_logs(self, guild: Guild, log_type: str, limit: int = 10) -> list[tuple[str, int]]:
+        """ get the player name & amount of the last limit transactions of the given type, oldest first """
+        raise NotImplementedError
+
+    def get_bank_log_totals(self, guild: Guild) -> dict[str, tuple[int, int]]:
+        """ get the total deposited & withdrawn by each player in the guild bank, biggest depositors first """
+        raise NotImplementedError
+
     def get_avaible_players_for_raid(self, guild: Guild) -> list[Player]:
         guild_members_data = self.get_guild_members_data(guild)
         available_members: list[Player] = []
@@ -215,9 +245,21 @@ class PilgramDatabase(ABC):
         raise NotImplementedError
 
     def get_random_zone_event(self, zone: Zone | None) -> ZoneEvent:
-        """get a random zone event given a zone. If zone is None then it's implied to be the town"""
+        """
+        get a random zone event given a zone. If zone is None then it's implied to be the town
+
+        :raises KeyError: if the zone has no events
+        """
         raise NotImplementedError
 
+    def get_random_zone_events(self, zone: Zone | None, amount: int) -> list[ZoneEvent]:
+        """
+        get amount random zone events given a zone (events can repeat), used to pick the events of a batch of updates
+
+        :raises KeyError: if the zone has no events
+        """
+        return [self.get_random_zone_event(zone) for _ in range(amount)]
+
     def add_zone_event(self, event: ZoneEvent) -> None:
         """add a single zone event, generally used by the generator or manually by the admin"""
         raise NotImplementedError
@@ -276,6 +318,10 @@ class PilgramDatabase(ABC):
         """returns a list of quest amounts per zone, position in the list is determined by zone id"""
         raise NotImplementedError
 
+    def get_active_quest_numbers(self) -> dict[int, list[int]]:
+        """returns the numbers of the quests players are currently on (raids excluded), grouped by zone id"""
+        raise NotImplementedError
+
     # in progress quests management ----------------------------------
 
     def get_player_adventure_container(self, player: Player) -> AdventureContainer:
@@ -302,6 +348,23 @@ class PilgramDatabase(ABC):
         """get all quest progress that was last updated timedelta hours ago or more"""
         raise NotImplementedError
 
+    def get_update_schedule(
+        self, player_ids: list[int] | None = None
+    ) -> list[tuple[int, datetime, datetime | None]]:
+        """
+        get (player id, last update, quest end time) for the given players (or for all players if None).
+        The quest end time is None if the player is not on a quest.
+        """
+        raise NotImplementedError
+
+    def get_adventure_containers(self, player_ids: list[int]) -> list[AdventureContainer]:
+        """get the up-to-date adventure containers of the given players"""
+        raise NotImplementedError
+
+    def get_players_adventure_containers(self, players: list[Player]) -> dict[int, AdventureContainer]:
+        """get the up-to-date adventure containers of the given player objects, indexed by player id"""
+        raise NotImplementedError
+
     def update_quest_progress(
         self,
         adventure_container: AdventureContainer,
@@ -375,7 +438,11 @@ class PilgramDatabase(ABC):
         raise NotImplementedError
 
     def get_random_enemy_meta(self, zone: Zone) -> EnemyMeta:
-        """get a random enemy meta from the specified zone"""
+        """
+        get a random enemy meta from the specified zone
+
+        :raises KeyError: if the zone has no enemy metas
+        """
         raise NotImplementedError
 
     def update_enemy_meta(self, enemy_meta: EnemyMeta) -> None:
@@ -420,10 +487,6 @@ class PilgramDatabase(ABC):
 
     # auctions ----------------------------------
 
-    def get_auctions(self) -> list[Auction]:
-        """gets all auctions"""
-        raise NotImplementedError
-
     def get_auction_from_id(self, auction_id: int) -> Auction:
         """get the auction that has the given id"""
         raise NotImplementedError
@@ -443,10 +506,31 @@ class PilgramDatabase(ABC):
         """gets auctions started by the given player"""
         raise NotImplementedError
 
+    def search_auctions(
+            self,
+            slot: int | None = None,
+            rarity: int | None = None,
+            min_level: int | None = None,
+            max_level: int | None = None,
+            max_price: int | None = None,
+            sort: str = "ending",
+            page: int = 1,
+            page_size: int = Auction.PAGE_SIZE
+    ) -> list[Auction]:
+        """
+        gets a page of the auctions that are not expired & match all the given filters, rarity is the number of perks
+        of the item & max_price applies to the current best bid. sort is one of Auction.SORTS.
+        """
+        raise NotImplementedError
+
     def get_expired_auctions(self) -> list[Auction]:
         """gets all expired auctions"""
         raise NotImplementedError
 
+    def get_next_auction_expiry(self) -> datetime | None:
+        """gets when the next auction expires, None if there are no auctions"""
+        raise NotImplementedError
+
     def update_auction(self, auction: Auction) -> None:
         """update the auction db row"""
         raise NotImplementedError
@@ -469,6 +553,11 @@ class PilgramDatabase(ABC):
         """add a new notification"""
         raise NotImplementedError
 
+    def add_notifications(self, notifications: list[Notification]) -> None:
+        """add a group of notifications at once"""
+        for notification in notifications:
+            self.add_notification(notification)
+
     def create_and_add_notification(
             self,
             player: Player,
@@ -542,6 +631,25 @@ class PilgramDatabase(ABC):
         """ resets all caches """
         raise NotImplementedError
 
+    def set_shared(self, shared: bool) -> None:
+        """
+        set whether other processes write to the database too (sharded quest workers). When shared, the objects other
+        processes can change (players, their items, artifacts & adventure containers, guilds) are read from the
+        database every time instead of being cached, so that stale objects don't overwrite newer records. The ids used
+        to pick random content & players are loaded again periodically, so that the ones added by other processes are
+        used.
+        """
+        raise NotImplementedError
+
+
+class GeneratedContent:
+    """ the content generated for multiple zones at once """
+
+    def __init__(self) -> None:
+        self.quests: list[Quest] = []
+        self.zone_events: list[ZoneEvent] = []
+        self.enemy_metas: list[EnemyMeta] = []
+
 
 class PilgramGenerator(ABC):
     def generate_quests(self, zone: Zone, quest_data: Any) -> list[Quest]:
@@ -559,6 +667,35 @@ class PilgramGenerator(ABC):
     def generate_anomaly(self, zone: Zone) -> Anomaly:
         raise NotImplementedError
 
+    def generate_content(
+            self,
+            quest_zones: list[Zone],
+            quest_numbers: list[int],
+            event_zones: list[Zone],
+            concurrency: int = 4
+    ) -> GeneratedContent:
+        """
+        generate the quests of quest_zones and the zone events & enemy metas of event_zones (the town only gets zone
+        events), making at most concurrency requests at the same time. Failed requests are skipped.
+        """
+        raise NotImplementedError
+
+    def start_batch(self, quest_zones: list[Zone], quest_numbers: list[int], event_zones: list[Zone]) -> str:
+        """
+        start generating in a single batch the quests of quest_zones and the zone events & enemy metas of
+        event_zones (the town only gets zone events). Returns the id of the batch.
+        """
+        raise NotImplementedError
+
+    def get_batch_results(self, batch_id: str, zones: dict[int, Zone]) -> GeneratedContent | None:
+        """
+        return the content generated by the given batch, None if the batch is not done yet.
+        zones maps the ids of the zones the batch generated content for to their objects.
+
+        :raises GenerationBatchError: if the batch will never be completed
+        """
+        raise NotImplementedError
+
 
 class PilgramNotifier(ABC):
     def notify(self, notification: Notification) -> dict:
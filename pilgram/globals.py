@@ -1,6 +1,10 @@
 import json
 import logging
+import os
+import threading
+import time
 from abc import ABC
+from copy import deepcopy
 from typing import Any, Self
 
 from pilgram.utils import PathDict
@@ -67,26 +71,65 @@ class __GenericGlobalSettings(ABC):
             raise e
 
 
-class __GenericGlobalSettingsLazyLoaded(ABC):
+class __GenericGlobalSettingsWatched(ABC):
     """
-    global settings which only loads a file in memory when it is needed. Useful to avoid using up too much memory.
+    global settings which are parsed once & reloaded when the file changes (checked at most once every
+    CHECK_INTERVAL seconds) or when reload() is called, so that values can be tuned while the game is running.
     """
 
     FILENAME: str
+    CHECK_INTERVAL: float = 1.0
+    _lock = threading.Lock()
+    _state: tuple[float, PathDict, dict[tuple[str, str], Any]] | None = None  # (file mtime, settings, resolved paths)
+    _last_check: float = 0
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._state = None
+        cls._last_check = 0
 
     @classmethod
-    def get(cls, path: str, separator: str = ".", default: Any = None) -> Any:
-        try:
+    def reload(cls) -> None:
+        """ parse the file again, the old values are used until the new ones are completely loaded """
+        with cls._lock:
+            mtime = os.path.getmtime(cls.FILENAME)
             with open(cls.FILENAME) as file:
                 dictionary = PathDict(json.load(file))
-                return dictionary.path_get(path, separator)
-        except KeyError as e:
-            if default is not None:
-                return default
-            raise e
+            cls._state = (mtime, dictionary, {})
+            cls._last_check = time.monotonic()
+        log.info(f"Loaded {cls.__name__} from {cls.FILENAME}")
 
+    @classmethod
+    def __get_state(cls) -> tuple[float, PathDict, dict[tuple[str, str], Any]]:
+        if cls._state is None:
+            cls.reload()
+        elif (time.monotonic() - cls._last_check) > cls.CHECK_INTERVAL:
+            cls._last_check = time.monotonic()
+            try:
+                if os.path.getmtime(cls.FILENAME) != cls._state[0]:
+                    cls.reload()
+            except (OSError, ValueError) as e:
+                # the file is probably being edited, try again at the next check
+                log.error(f"Could not reload {cls.FILENAME}, keeping the old values: {e}")
+        return cls._state
 
-class ContentMeta(__GenericGlobalSettingsLazyLoaded):
+    @classmethod
+    def get(cls, path: str, separator: str = ".", default: Any = None) -> Any:
+        _, dictionary, resolved_paths = cls.__get_state()
+        key = (path, separator)
+        if key not in resolved_paths:
+            try:
+                resolved_paths[key] = dictionary.path_get(path, separator)
+            except KeyError as e:
+                if default is not None:
+                    return default
+                raise e
+        value = resolved_paths[key]
+        # containers are copied so that callers can't modify the cached values
+        return deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+class ContentMeta(__GenericGlobalSettingsWatched):
     """Contains all info about the world, like default values for players, world name, etc."""
 
     FILENAME = "content_meta.json"
@@ -3,13 +3,22 @@ from __future__ import annotations
 import json
 from abc import ABC
 from random import Random, randint
-from typing import Generic, TypeVar
+from typing import Any, Generic, TypeVar
 
 
 T = TypeVar("T")
 DEFAULT_TAG: str = "default"
 
 
+def load_from_json(cls: type, filename: str) -> list[tuple[str, Any]]:
+    """ build the (tag, item) list of a listable from its content file """
+    with open(filename) as f:
+        items = json.load(f).get("items", None)
+    if not items:
+        raise ValueError(f"No items found in {filename}")
+    return [(listable_json.get("tag", DEFAULT_TAG), cls.create_from_json(listable_json)) for listable_json in items]
+
+
 class Listable(Generic[T], ABC):
     ALL_ITEMS: list[T]
     LISTS: dict[str, list[T]]
@@ -22,15 +31,10 @@ class Listable(Generic[T], ABC):
             tags_counter: int = 0
             cls.LISTS = {}
             cls.ALL_ITEMS = []
-            items = json.load(open(filename)).get("items", None)
-            if not items:
-                raise ValueError(f"No items found in {filename}")
-            for listable_json in items:
-                tag: str = listable_json.get("tag", DEFAULT_TAG)
+            for tag, item in load_from_json(cls, filename):
                 if tag not in cls.LISTS:
                     cls.LISTS[tag] = []
                     tags_counter += 1
-                item: T = cls.create_from_json(listable_json)
                 cls.LISTS[tag].append(item)
                 cls.ALL_ITEMS.append(item)
                 items_counter += 1
@@ -1,33 +1,53 @@
+import fcntl
+import heapq
 import json
 import logging
+import math
+import multiprocessing
 import os
+import queue
 import random
+import threading
 import time
 from abc import ABC
-from copy import deepcopy, copy
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Event as ProcessEvent
+from copy import copy
 from datetime import datetime, timedelta
 from time import sleep
 from typing import Self
 
 from pilgram.classes import (
+    BASE_QUEST_DURATION,
+    DURATION_PER_QUEST_NUMBER,
+    DURATION_PER_ZONE_LEVEL,
     QTE_CACHE,
+    RANDOM_DURATION,
     TOWN_ZONE,
     AdventureContainer,
+    Anomaly,
     Auction,
     Enemy,
+    Guild,
     Player,
     Quest,
     QuickTimeEvent,
-    Zone, InternalEventBus, Event, Notification,
+    Shade,
+    Zone, ZoneEvent, InternalEventBus, Event, Notification,
 )
 from pilgram.combat_classes import CombatContainer, CombatActor
 from pilgram.equipment import Equipment, EquipmentType
-from pilgram.flags import BUFF_FLAGS, ForcedCombat, Ritual1, Ritual2, Pity1, Pity2, Pity3, Pity4, PITY_FLAGS, Pity5, \
-    QuestCanceled, Explore, InCrypt, Raiding, DeathwishMode
-from pilgram.generics import PilgramDatabase, PilgramGenerator, PilgramNotifier
+from pilgram.flags import BUFF_FLAGS_MASK, ForcedCombat, Ritual1, Ritual2, Pity1, Pity2, Pity3, Pity4, PITY_FLAGS_MASK, \
+    Pity5, QuestCanceled, Explore, InCrypt, Raiding, DeathwishMode, unset_flags
+from pilgram.generics import GeneratedContent, GenerationBatchError, PilgramDatabase, PilgramGenerator, PilgramNotifier
 from pilgram.globals import ContentMeta
 from pilgram.listables import DEFAULT_TAG
 from pilgram.modifiers import get_modifiers_by_rarity, Rarity, Modifier
+from pilgram.profiling import current_span, tick, ticked
 from pilgram.strings import Strings, rewards_string
 from pilgram.utils import generate_random_eldritch_name
 
@@ -38,6 +58,7 @@ log.setLevel(logging.INFO)
 MONEY = ContentMeta.get("money.name")
 QUEST_THRESHOLD = 3
 ARTIFACTS_THRESHOLD = 15
+MAX_SHADES_PER_ZONE = 50
 
 MAX_QUESTS_FOR_EVENTS = 600  # * 25 = 3000
 MAX_QUESTS_FOR_TOWN_EVENTS = MAX_QUESTS_FOR_EVENTS * 2
@@ -76,19 +97,92 @@ class _HighestQuests:
         return _HighestQuests({})
 
     def save(self):
-        with open(self.FILENAME, "w") as f:
-            json.dump(self.__data, f)
+        """
+        merge the data with the one saved by the other processes (sharded quest workers) & save it atomically.
+        The file is locked while merging, otherwise a process could overwrite the progress saved by another one.
+        """
+        with open(self.FILENAME + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                saved = _HighestQuests.load_from_file()
+                for zone_index, progress in saved.__data.items():
+                    if self.__data.get(zone_index, 0) < progress:
+                        self.__data[zone_index] = progress
+                temp_filename = f"{self.FILENAME}.{os.getpid()}.tmp"
+                with open(temp_filename, "w") as f:
+                    json.dump(self.__data, f)
+                os.replace(temp_filename, self.FILENAME)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
     def update(self, zone_id: int, progress: int) -> None:
         if self.__data.get(zone_id - 1, 0) < progress:
             self.__data[zone_id - 1] = progress
             self.save()
 
-    def is_quest_number_too_low(self, zone: Zone, number_of_quests: int) -> bool:
-        return number_of_quests < (
-            self.__data.get(zone.zone_id - 1, 0) + QUEST_THRESHOLD
+    def get(self, zone: Zone) -> int:
+        return self.__data.get(zone.zone_id - 1, 0)
+
+    def is_quest_number_too_low(self, zone: Zone, number_of_quests: int, buffer: int = QUEST_THRESHOLD) -> bool:
+        return number_of_quests < (self.get(zone) + buffer)
+
+
+class _GenerationPlanner:
+    """
+    forecasts how many quests each zone needs to not run out before the generator runs again.
+    Quests are shared by all players of a zone & done in order, so the demand of a zone is set by how far the players
+    on the quests closest to the last one (the frontier) get during the planning horizon, the number of those players
+    only decides which zones are generated first.
+    """
+
+    FRONTIER_DISTANCE = 10  # players on a quest this close to the last quest of the zone are near the frontier
+
+    def __init__(self, horizon: timedelta) -> None:
+        """
+        :param horizon: how far ahead to plan, generally the time between generator runs plus the generation time
+        """
+        self.horizon = horizon
+
+    @staticmethod
+    def get_expected_quest_duration(zone: Zone, quest_number: int) -> timedelta:
+        """return the average duration of a quest without player modifiers (see Quest.get_duration)"""
+        return (
+            BASE_QUEST_DURATION
+            + (DURATION_PER_ZONE_LEVEL * zone.level)
+            + (DURATION_PER_QUEST_NUMBER * quest_number)
+            + (RANDOM_DURATION * (zone.level / 2))
         )
 
+    def get_frontier(self, quest_count: int, active_quest_numbers: list[int]) -> list[int]:
+        return [x for x in active_quest_numbers if x >= (quest_count - self.FRONTIER_DISTANCE)]
+
+    def get_buffer(self, zone: Zone, quest_count: int, active_quest_numbers: list[int]) -> int:
+        """return how many quests must be left past the furthest player for the zone to last until the next run"""
+        if not self.get_frontier(quest_count, active_quest_numbers):
+            return QUEST_THRESHOLD
+        duration = self.get_expected_quest_duration(zone, quest_count)
+        return QUEST_THRESHOLD + math.ceil(self.horizon / duration)
+
+    def plan(
+            self,
+            zones: list[Zone],
+            quest_counts: list[int],
+            active_quests: dict[int, list[int]],
+            hq: _HighestQuests,
+            biases: dict[int, int]
+    ) -> list[Zone]:
+        """return the zones that need quests, the zones with the most players near the frontier first"""
+        result: list[tuple[int, Zone]] = []
+        for zone, count in zip(zones, quest_counts, strict=False):
+            active_quest_numbers = active_quests.get(zone.zone_id, [])
+            # the players on the last quests may not have finished one yet, so they are not in the highest quests
+            highest = max([hq.get(zone)] + [x + 1 for x in active_quest_numbers])
+            buffer = self.get_buffer(zone, count, active_quest_numbers)
+            if (count - biases.get(zone.zone_id, 0)) < (highest + buffer):
+                result.append((len(self.get_frontier(count, active_quest_numbers)), zone))
+        result.sort(key=lambda x: x[0], reverse=True)
+        return [zone for _, zone in result]
+
 
 def add_to_zones_players_map(
     zones_player_map: dict[int, list[Player]], adventure_container: AdventureContainer
@@ -111,6 +205,79 @@ class Manager(ABC):
         return self.database.acquire()
 
 
+class _ShadePools:
+    """bounded per-zone pools of shades, when a pool is full the oldest shade in it gets evicted"""
+
+    def __init__(self, max_shades_per_zone: int) -> None:
+        self.max_shades_per_zone = max_shades_per_zone
+        self.__pools: dict[int, deque[Shade]] = {}
+        self.created: int = 0
+        self.evicted: int = 0
+        self.fought: int = 0
+
+    def add(self, zone_id: int, shade: Shade) -> None:
+        pool = self.__pools.get(zone_id, None)
+        if pool is None:
+            pool = deque(maxlen=self.max_shades_per_zone)
+            self.__pools[zone_id] = pool
+        if len(pool) == self.max_shades_per_zone:
+            self.evicted += 1
+        pool.append(shade)
+        self.created += 1
+
+    def pop(self, zone_id: int) -> Shade | None:
+        """return the oldest shade in the given zone or None if there are none"""
+        pool = self.__pools.get(zone_id, None)
+        if not pool:
+            return None
+        self.fought += 1
+        return pool.popleft()
+
+    def has_shades(self, zone_id: int) -> bool:
+        return bool(self.__pools.get(zone_id, None))
+
+    def __len__(self) -> int:
+        return sum(len(pool) for pool in self.__pools.values())
+
+    def get_metrics(self) -> dict[str, int]:
+        return {
+            "shades": len(self),
+            "created": self.created,
+            "evicted": self.evicted,
+            "fought": self.fought
+        }
+
+
+class _CombatJob:
+    """a fight prepared by the quest manager, it gets simulated (possibly in another process) & then applied"""
+
+    def __init__(
+            self,
+            participants: list[CombatActor],
+            helpers: list[CombatActor | None],
+            seed: int,
+            on_finish: Callable[[str], None]
+    ) -> None:
+        """
+        :param participants: the actors taking part in the fight
+        :param helpers: the helper of each participant, in the same order as the participants
+        :param seed: seed of the fight
+        :param on_finish: applies the results of the fight, gets called with the combat log
+        """
+        self.participants = participants
+        self.helpers = helpers
+        self.seed = seed
+        self.on_finish = on_finish
+
+
+def _simulate_combat(
+        participants: list[CombatActor], helpers: list[CombatActor | None], seed: int
+) -> tuple[str, list[CombatActor]]:
+    """simulate a fight, return the combat log & the participants in their original order. Runs in worker processes."""
+    combat = CombatContainer(copy(participants), dict(zip(participants, helpers, strict=True)), seed=seed)
+    return combat.fight(), participants
+
+
 class QuestManager(Manager):
     """helper class to neatly manage zone events & quests"""
 
@@ -119,47 +286,31 @@ class QuestManager(Manager):
         database: PilgramDatabase,
         update_interval: timedelta,
         updates_per_second: int = 10,
+        seed: int | None = None,
+        combat_workers: int = 0
     ) -> None:
         """
         :param database: database adapter to use to get & set data
         :param update_interval: the amount of time that has to pass since the last update before another update
         :param updates_per_second: the amount of time in seconds between notifications
+        :param seed: seed of the manager rng, every fight gets its own seed drawn from it. Random if None.
+        :param combat_workers: number of processes used to simulate the fights of an update, 0 to fight in-process
         """
         super().__init__(database)
         self.update_interval = update_interval
         self.highest_quests = _HighestQuests.load_from_file()
         self.updates_per_second = 1 / updates_per_second
-        self.player_shades: dict[int, list[Player]] = {}
-
-    @staticmethod
-    def _create_shade(
-            player: Player,
-            max_equipped_items: int = 3,
-            empty_satchel: bool = True,
-            suffix: str = "'s Shade"
-    ) -> Player:
-        # deepcopy a player
-        shade: Player = deepcopy(player)
-        shade.name = player.name + suffix
-        shade.hp_percent = 1.0
-        shade.team = 1
-        # remove some equipped items if necessary
-        while len(list(shade.equipped_items.values())) > max_equipped_items:
-            key = random.choice(list(shade.equipped_items.keys()))
-            del shade.equipped_items[key]
-        # empty satchel
-        if empty_satchel:
-            shade.satchel = []
-        return shade
+        self.player_shades = _ShadePools(MAX_SHADES_PER_ZONE)
+        self.rng = random.Random(seed)
+        self.combat_workers = combat_workers
+        self.__pool: ProcessPoolExecutor | None = None
+        self.__prefetched_events: dict[int, list[ZoneEvent]] = {}  # zone id (0 for town) -> events for this batch
 
     def create_shade(self, player: Player, zone: Zone | None) -> None:
         if zone is None:
             return
         log.info(f"creating shade of player {player.name} in {zone.zone_name}")
-        if self.player_shades.get(zone.zone_id, None) is None:
-            self.player_shades[zone.zone_id] = []
-        shade: Player = self._create_shade(player)
-        self.player_shades[zone.zone_id].append(shade)
+        self.player_shades.add(zone.zone_id, Shade.create(player, rng=self.rng))
 
     def _complete_quest(self, ac: AdventureContainer) -> None:
         quest: Quest = ac.quest
@@ -168,7 +319,7 @@ class QuestManager(Manager):
         )  # get the most up to date object
         ac.player = player
         tax: float = 0
-        quest_finished, roll, value_to_beat = quest.finish_quest(player)
+        quest_finished, roll, value_to_beat = quest.finish_quest(player, self.rng)
         anomaly = self.db().get_current_anomaly()
         # pity
         if (not quest_finished) and Pity5.is_set(player.flags):
@@ -176,11 +327,9 @@ class QuestManager(Manager):
         # give quest rewards
         if quest_finished:
             # reset pity flags
-            for flag in PITY_FLAGS:
-                if flag.is_set(player.flags):
-                    player.unset_flag(flag)
+            player.flags = unset_flags(player.flags, PITY_FLAGS_MASK)
             # get rewards
-            xp, money = quest.get_rewards(player)
+            xp, money = quest.get_rewards(player, self.rng)
             if ac.zone() == anomaly.zone:
                 xp = int(xp * anomaly.xp_mult)
                 money = int(money * anomaly.money_mult)
@@ -195,12 +344,12 @@ class QuestManager(Manager):
                 amount = int(money_am * tax)
                 guild.bank += amount
                 player.money -= amount
-                guild_members = len(self.db().get_guild_members_data(guild))
+                guild_members = self.db().get_guild_members_number(guild)
                 mult = _get_tourney_score_multiplier(guild_members)
                 guild.tourney_score += int(renown * mult)
                 self.db().update_guild(guild)
                 # create a log
-                guild.create_bank_log("deposit", player.player_id, amount)
+                self.db().add_bank_log(guild, "deposit", player.player_id, amount)
             # add to completed quests & add renown
             player.completed_quests += 1
             player.add_renown(renown)
@@ -208,7 +357,7 @@ class QuestManager(Manager):
             player.add_essence(quest.zone.zone_id, 1)
             # get artifact piece if lucky
             piece: bool = False
-            if random.randint(1, 10) < (
+            if self.rng.randint(1, 10) < (
                 3 + player.vocation.artifact_drop_bonus + (anomaly.artifact_drop_bonus if ac.zone() == anomaly.zone else 0)
             ):  # 30% base chance to gain a piece of an artifact
                 player.artifact_pieces += 1
@@ -227,7 +376,7 @@ class QuestManager(Manager):
             failure_text = quest.failure_text + Strings.quest_fail.format(name=quest.name) + f"\n\n{Strings.quest_roll.format(roll=roll, target=value_to_beat)}"
             # give rewards anyway if vocation permits it
             if player.vocation.quest_fail_rewards_multiplier > 0:
-                xp, money = quest.get_rewards(player)
+                xp, money = quest.get_rewards(player, self.rng)
                 xp_am = player.add_xp(xp)  # am = after modifiers
                 money_am = player.add_money(money)  # am = after modifiers
                 failure_text + rewards_string(xp_am, money_am, 0)
@@ -265,9 +414,26 @@ class QuestManager(Manager):
         player.modify_hp(regenerated_hp)
         return f"You regenerate {regenerated_hp} HP ({player.get_hp_string()})."
 
+    def _prefetch_zone_events(self, updates: list[AdventureContainer]) -> None:
+        """ pick the random events for a batch of updates, one query per zone instead of one per update """
+        zones: dict[int, Zone | None] = {}
+        amounts: dict[int, int] = {}
+        for update in updates:
+            zone = update.zone()
+            zone_id = zone.zone_id if zone else 0
+            zones[zone_id] = zone
+            amounts[zone_id] = amounts.get(zone_id, 0) + 1
+        self.__prefetched_events = {}
+        for zone_id, amount in amounts.items():
+            try:
+                self.__prefetched_events[zone_id] = self.db().get_random_zone_events(zones[zone_id], amount)
+            except KeyError as e:
+                log.error(e)
+
     def _process_event(self, ac: AdventureContainer) -> None:
         zone = ac.zone()
-        event = self.db().get_random_zone_event(zone)
+        prefetched_events = self.__prefetched_events.get(zone.zone_id if zone else 0)
+        event = prefetched_events.pop() if prefetched_events else self.db().get_random_zone_event(zone)
         anomaly = self.db().get_current_anomaly()
         player: Player = self.db().get_player_data(
             ac.player.player_id
@@ -291,22 +457,22 @@ class QuestManager(Manager):
                 text = Strings.qte_failed + "\n\n" + text
                 if Explore.is_set(player.flags):
                     player.unset_flag(Explore)
-            elif Explore.is_set(player.flags) or (random.randint(1, 10) <= (1 + player.vocation.qte_frequency_bonus)):
+            elif Explore.is_set(player.flags) or (self.rng.randint(1, 10) <= (1 + player.vocation.qte_frequency_bonus)):
                 # log.info(f"Player '{player.name}' encountered a QTE.")
-                qte = random.choice(QuickTimeEvent.LISTS[DEFAULT_TAG])
+                qte = self.rng.choice(QuickTimeEvent.LISTS[DEFAULT_TAG])
                 QTE_CACHE[player.player_id] = qte
                 text += f"*QTE*\n\n{qte}\n\n"
                 if Explore.is_set(player.flags):
                     player.unset_flag(Explore)
-            elif random.randint(1, 10) <= (
+            elif self.rng.randint(1, 10) <= (
                 1 + player.vocation.discovery_bonus + (anomaly.item_drop_bonus if ac.zone() == anomaly.zone else 0)
             ):  # 10% base change of finding an item
                 items = self.db().get_player_items(player.player_id)
                 if len(items) < player.get_inventory_size():
                     item = Equipment.generate(
-                        player.level + random.randint(0, 5),
+                        player.level + self.rng.randint(0, 5),
                         EquipmentType.get_random(),
-                        random.randint(0, 3),
+                        self.rng.randint(0, 3),
                     )
                     # log.info(f"Player '{player.name}' found item: '{item.name}'.")
                     item_id = self.db().add_item(item, player)
@@ -321,7 +487,7 @@ class QuestManager(Manager):
         self.db().create_and_add_notification(ac.player, text)
 
     @staticmethod
-    def _buff_enemy(player: Player, enemy: Enemy | Player):
+    def _buff_enemy(player: Player, enemy: Enemy | Shade):
         if Ritual1.is_set(player.flags):
             if isinstance(enemy, Player):
                 enemy.level += 5
@@ -333,9 +499,15 @@ class QuestManager(Manager):
             else:
                 enemy.level_modifier += 5
 
-    def _process_combat_death(self, player: Player, ac: AdventureContainer) -> str:
-        """ either revive the player or respawn them in town """
-        if (player.vocation.revive_chance > 0) and (random.random() < player.vocation.revive_chance):
+    def _process_combat_death(
+            self, player: Player, ac: AdventureContainer, notifications: list[Notification] | None = None
+    ) -> str:
+        """
+        either revive the player or respawn them in town
+
+        :param notifications: if given the notifications for the player are added to it instead of being sent
+        """
+        if (player.vocation.revive_chance > 0) and (self.rng.random() < player.vocation.revive_chance):
             player.hp_percent = 0.25
             return Strings.post_combat_revive
         else:
@@ -347,7 +519,11 @@ class QuestManager(Manager):
                 player.money = 0
                 player.essences = {}
                 player.equipped_items = {}
-                self.db().create_and_add_notification(player, "You died while Deathwish mode was active! You lost all of your levels, BA & essences. Also all of your items have been unequipped.")
+                text = "You died while Deathwish mode was active! You lost all of your levels, BA & essences. Also all of your items have been unequipped."
+                if notifications is None:
+                    self.db().create_and_add_notification(player, text)
+                else:
+                    notifications.append(Notification(player, text))
             else:
                 player.money -= lost_money  # lose 10% of money on death
             player.hp_percent = 1.0
@@ -362,19 +538,20 @@ class QuestManager(Manager):
         if ac.zone() == anomaly.zone:
             enemy_level_modifier += anomaly.level_bonus
         for _ in range(modifiers_amount):
-            choice_list = get_modifiers_by_rarity(random.randint(Rarity.UNCOMMON, Rarity.LEGENDARY))
-            modifier_type: type[Modifier] = random.choice(choice_list)
+            choice_list = get_modifiers_by_rarity(self.rng.randint(Rarity.UNCOMMON, Rarity.LEGENDARY))
+            modifier_type: type[Modifier] = self.rng.choice(choice_list)
             modifiers.append(modifier_type.generate(ac.quest.zone.level + enemy_level_modifier))
         return Enemy(
             self.db().get_random_enemy_meta(ac.quest.zone),
             modifiers,
             int(enemy_level_modifier),
-            name_prefix=prefix
+            name_prefix=prefix,
+            rng=self.rng
         )
 
-    def _process_combat(
+    def _prepare_combat(
         self, ac: AdventureContainer, updates: list[AdventureContainer]
-    ) -> None:
+    ) -> _CombatJob:
         player: Player = self.db().get_player_data(ac.player.player_id)
         anomaly = self.db().get_current_anomaly()
         self.__player_regenerate_hp(ac, player)
@@ -396,7 +573,7 @@ class QuestManager(Manager):
             ):
                 helper = update.player
                 break
-        if not self.player_shades.get(ac.zone().zone_id, None):
+        if not self.player_shades.has_shades(ac.zone().zone_id):
             # if there are no shades to fight then generate an enemy
             enemy_level_modifier: int = ac.quest.number
             if ForcedCombat.is_set(player.flags):
@@ -411,32 +588,45 @@ class QuestManager(Manager):
                     enemy_level_modifier += 5 + ((player.get_max_sanity() - player.sanity)/5)
                 if player.sanity <= 0:
                     modifiers_amount += int((-player.sanity) / 20)
-                    if random.randint(0, -player.sanity) > 145:
+                    if self.rng.randint(0, -player.sanity) > 145:
                         self.db().create_and_add_notification(player, Strings.insanity_meet_yourself)
-                        enemy = self._create_shade(
+                        enemy = Shade.create(
                             player,
                             max_equipped_items=7,
                             empty_satchel=False,
-                            suffix="'s Nightmare"
+                            suffix="'s Nightmare",
+                            rng=self.rng
                         )
                     else:
                         enemy = self._create_enemy(ac, modifiers_amount, enemy_level_modifier)
                 else:
                     enemy = self._create_enemy(ac, modifiers_amount, enemy_level_modifier)
-            elif random.randint(1, 100) < 20:
+            elif self.rng.randint(1, 100) < 20:
                 # 20% chance of randomly getting a monster with a modifier
                 enemy = self._create_enemy(ac, 1, enemy_level_modifier)
             else:
                 enemy = self._create_enemy(ac, 0, enemy_level_modifier)
         else:
             # fight a shade
-            enemy = self.player_shades[ac.zone().zone_id].pop(0)
+            enemy = self.player_shades.pop(ac.zone().zone_id)
         # buff enemy with ritual
         self._buff_enemy(player, enemy)
-        # do combat
-        combat = CombatContainer([player, enemy], {player: helper, enemy: None})
-        text = "Combat starts!\n\n" + combat.fight()
-        # finish combat
+        return _CombatJob(
+            [player, enemy],
+            [helper, None],
+            self.rng.getrandbits(32),
+            lambda combat_log: self._finish_combat(ac, player, enemy, anomaly, combat_log)
+        )
+
+    def _finish_combat(
+            self,
+            ac: AdventureContainer,
+            player: Player,
+            enemy: Enemy | Shade,
+            anomaly: Anomaly,
+            combat_log: str
+    ) -> None:
+        text = "Combat starts!\n\n" + combat_log
         if player.is_dead():
             if isinstance(enemy, Enemy):
                 text += f"\n\n{enemy.meta.lose_text}"
@@ -466,7 +656,7 @@ class QuestManager(Manager):
                 player.sanity += 50
             # more rewards if combat was forced
             if ForcedCombat.is_set(player.flags) and (
-                random.random() <= 0.5
+                self.rng.random() <= 0.5
             ):  # 40% change to get an artifact piece if combat was forced
                 if (player.level - enemy.get_level()) < 5:
                     log.info(f"Artifact piece drop for {player.name}")
@@ -480,23 +670,26 @@ class QuestManager(Manager):
                 guild.prestige += max(1, prestige)
                 self.db().update_guild(guild)
         # unset player flags
-        for flag in BUFF_FLAGS:
-            if flag.is_set(player.flags):
-                player.flags = flag.unset(player.flags)
-        if ForcedCombat.is_set(player.flags):
-            player.flags = ForcedCombat.unset(player.flags)
+        player.flags = unset_flags(player.flags, BUFF_FLAGS_MASK | ForcedCombat.FLAG)
         # save data to db
         self.db().update_player_data(player)
         self.db().update_quest_progress(ac)
         # notify player
         self.db().create_and_add_notification(ac.player, text, notification_type="Combat Log")
 
-    def _process_crypt_update(self, ac: AdventureContainer):
+    def _prepare_crypt_combat(self, ac: AdventureContainer) -> _CombatJob:
         player: Player = self.db().get_player_data(ac.player.player_id)
-        shade = self._create_shade(self.db().get_random_player_data())
+        shade = Shade.create(self.db().get_random_player_data(player.level), rng=self.rng)
         self._buff_enemy(player, shade)
-        combat = CombatContainer([player, shade], {player: None, shade: None})
-        text = "Combat starts!\n\n" + combat.fight()
+        return _CombatJob(
+            [player, shade],
+            [None, None],
+            self.rng.getrandbits(32),
+            lambda combat_log: self._finish_crypt_combat(ac, player, shade, combat_log)
+        )
+
+    def _finish_crypt_combat(self, ac: AdventureContainer, player: Player, shade: Shade, combat_log: str) -> None:
+        text = "Combat starts!\n\n" + combat_log
         if player.is_dead():
             player.unset_flag(InCrypt)
             text += f"\n\n{Strings.shade_loss}"
@@ -510,99 +703,174 @@ class QuestManager(Manager):
             player.add_renown(renown)
             money_am = player.add_money(money)
             text += f"\n\n{Strings.shade_win}{rewards_string(xp_am, money_am, renown)}"
-        for flag in BUFF_FLAGS:
-            if flag.is_set(player.flags):
-                player.flags = flag.unset(player.flags)
+        player.flags = unset_flags(player.flags, BUFF_FLAGS_MASK)
         self.db().update_player_data(player)
         self.db().update_quest_progress(ac)
         self.db().create_and_add_notification(ac.player, text, notification_type="Combat Log")
 
-    def process_raid_combat(self, ac: AdventureContainer, is_boss: bool):
+    def _prepare_raid_combat(self, ac: AdventureContainer, is_boss: bool) -> _CombatJob:
         leader = self.db().get_player_data(ac.player.player_id)
         guild = self.db().get_owned_guild(leader)
         party = self.db().get_raid_participants(guild)
         mult = _get_tourney_score_multiplier(len(party))
         # get combat participants
-        participants: list[CombatActor] = party + [self._create_enemy(ac, random.randint(0, 2), int(x.level / 3)) for x in party]
+        participants: list[CombatActor] = party + [self._create_enemy(ac, self.rng.randint(0, 2), int(x.level / 3)) for x in party]
         if is_boss:
             guild.last_raid = datetime.now()
             participants.append(self._create_enemy(ac, 5, int(leader.level * 1.5), prefix="Legendary "))
-        # process combat
-        combat = CombatContainer(participants, {})
-        combat_log = "Combat starts!\n\n" + combat.fight()
-        # give rewards to members that are still alive & return dead members to town
-        for member in party:
-            if member.is_dead():
-                member_ac = self.db().get_player_adventure_container(member)
-                text = self._process_combat_death(member, member_ac)
-                if not member_ac.is_on_a_quest():
-                    member.unset_flag(Raiding)
-                    self.db().update_player_data(member)
-                    self.db().update_quest_progress(member_ac)
-                    self.db().create_and_add_notification(member, combat_log + text)
-                    continue
-            xp, money = member.get_rewards(member)
-            if is_boss:
-                # finish quest
-                member_ac = self.db().get_player_adventure_container(member)
-                member_ac.quest = None
-                member.unset_flag(Raiding)
-                member.hp_percent = 1.0
-                # add money, xp & renown (x4)
-                xp_am = member.add_xp(xp * 4)
-                money_am = member.add_money(money * 4)
-                renown = member.get_prestige(ac.quest.zone.level) * 4
-                member.add_renown(renown)
-                guild.prestige += renown
-                guild.tourney_score += int(renown * mult)
-                # add relic
-                item = Equipment.generate(member.level, EquipmentType.get_random("relic"), 3)
-                items = self.db().get_player_items(member.player_id)
-                item_id = self.db().add_item(item, member)
-                item.equipment_id = item_id
-                items.append(item)
-                # notify player
-                self.db().create_and_add_notification(
-                    member,
-                    combat_log + "\n\n" + Strings.raid_finished + rewards_string(xp_am, money_am, renown)
-                )
-                self.db().update_quest_progress(member_ac)
-            else:
-                # add money, xp & renown
-                xp_am = member.add_xp(xp)
-                money_am = member.add_money(money)
-                renown = member.get_prestige(ac.quest.zone.level)
-                member.add_renown(renown)
-                guild.prestige += renown
-                # notify player
-                self.db().create_and_add_notification(
-                    member,
-                    combat_log + "\n\n" + Strings.raid_win + rewards_string(xp_am, money_am, renown)
-                )
-            self.db().update_player_data(member)
-        # if leader is dead then abort the raid
-        if leader.is_dead():
+        return _CombatJob(
+            participants,
+            [None] * len(participants),
+            self.rng.getrandbits(32),
+            lambda combat_log: self._finish_raid_combat(ac, is_boss, leader, guild, party, mult, combat_log)
+        )
+
+    def _finish_raid_combat(
+            self,
+            ac: AdventureContainer,
+            is_boss: bool,
+            leader: Player,
+            guild: Guild,
+            party: list[Player],
+            mult: int,
+            combat_log: str
+    ) -> None:
+        """ apply the results of a raid, all the members are saved in a single transaction """
+        span = current_span()
+        span.count("raid members", len(party))
+        combat_log = "Combat starts!\n\n" + combat_log
+        notifications: list[Notification] = []
+        with span.phase("raid results"), self.db().transaction():
+            containers = self.db().get_players_adventure_containers(party)
+            # give rewards to members that are still alive & return dead members to town
             for member in party:
-                if not member.is_dead():
-                    member_ac = self.db().get_player_adventure_container(member)
-                    self.db().create_and_add_notification(member, Strings.raid_leader_died)
+                member_ac = containers[member.player_id]
+                if member.is_dead():
+                    text = self._process_combat_death(member, member_ac, notifications)
+                    if not member_ac.is_on_a_quest():
+                        member.unset_flag(Raiding)
+                        self.db().update_player_data(member)
+                        self.db().update_quest_progress(member_ac)
+                        notifications.append(Notification(member, combat_log + text))
+                        continue
+                xp, money = member.get_rewards(member)
+                if is_boss:
+                    # finish quest
+                    member_ac.quest = None
                     member.unset_flag(Raiding)
                     member.hp_percent = 1.0
-                    self.db().update_player_data(member)
+                    # add money, xp & renown (x4)
+                    xp_am = member.add_xp(xp * 4)
+                    money_am = member.add_money(money * 4)
+                    renown = member.get_prestige(ac.quest.zone.level) * 4
+                    member.add_renown(renown)
+                    guild.prestige += renown
+                    guild.tourney_score += int(renown * mult)
+                    # add relic
+                    item = Equipment.generate(member.level, EquipmentType.get_random("relic"), 3)
+                    items = self.db().get_player_items(member.player_id)
+                    item_id = self.db().add_item(item, member)
+                    item.equipment_id = item_id
+                    items.append(item)
+                    notifications.append(Notification(
+                        member,
+                        combat_log + "\n\n" + Strings.raid_finished + rewards_string(xp_am, money_am, renown)
+                    ))
                     self.db().update_quest_progress(member_ac)
-        # update guild & leader adventure container
-        self.db().update_guild(guild)
-        self.db().update_quest_progress(ac)
+                else:
+                    # add money, xp & renown
+                    xp_am = member.add_xp(xp)
+                    money_am = member.add_money(money)
+                    renown = member.get_prestige(ac.quest.zone.level)
+                    member.add_renown(renown)
+                    guild.prestige += renown
+                    notifications.append(Notification(
+                        member,
+                        combat_log + "\n\n" + Strings.raid_win + rewards_string(xp_am, money_am, renown)
+                    ))
+                self.db().update_player_data(member)
+            # if leader is dead then abort the raid
+            if leader.is_dead():
+                for member in party:
+                    if not member.is_dead():
+                        notifications.append(Notification(member, Strings.raid_leader_died))
+                        member.unset_flag(Raiding)
+                        member.hp_percent = 1.0
+                        self.db().update_player_data(member)
+                        self.db().update_quest_progress(containers[member.player_id])
+            # update guild & leader adventure container
+            self.db().update_guild(guild)
+            self.db().update_quest_progress(ac)
+        # players are only notified once the results are saved
+        self.db().add_notifications(notifications)
+
+    def _process_combat(self, ac: AdventureContainer, updates: list[AdventureContainer]) -> None:
+        self.resolve_combat_jobs([self._prepare_combat(ac, updates)])
+
+    def _process_crypt_update(self, ac: AdventureContainer) -> None:
+        self.resolve_combat_jobs([self._prepare_crypt_combat(ac)])
+
+    def process_raid_combat(self, ac: AdventureContainer, is_boss: bool) -> None:
+        self.resolve_combat_jobs([self._prepare_raid_combat(ac, is_boss)])
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(
+                max_workers=self.combat_workers,
+                mp_context=multiprocessing.get_context("spawn")  # forking a multithreaded process is unsafe
+            )
+        return self.__pool
+
+    def resolve_combat_jobs(self, jobs: list[_CombatJob]) -> None:
+        """
+        simulate the given fights (in the worker processes if there are any) & then apply their results.
+
+        Workers fight on pickled copies of the actors, so the state changed by the fight is copied back to the
+        original objects before the results are applied.
+        """
+        if not jobs:
+            return
+        span = current_span()
+        span.count("fights", len(jobs))
+        results: list[tuple[str, list[CombatActor]]] | None = None
+        with span.phase("combat"):
+            if (self.combat_workers > 0) and (len(jobs) > 1):
+                try:
+                    results = list(self.__get_pool().map(
+                        _simulate_combat,
+                        [job.participants for job in jobs],
+                        [job.helpers for job in jobs],
+                        [job.seed for job in jobs],
+                        chunksize=max(1, len(jobs) // (self.combat_workers * 4))
+                    ))
+                except Exception as e:
+                    log.exception(f"error while simulating fights in worker processes, falling back to serial: {e}")
+            if results is None:
+                results = [_simulate_combat(job.participants, job.helpers, job.seed) for job in jobs]
+        with span.phase("combat results"):
+            for job, (combat_log, participants) in zip(jobs, results, strict=True):
+                for actor, simulated_actor in zip(job.participants, participants, strict=True):
+                    actor.copy_combat_state(simulated_actor)
+                try:
+                    job.on_finish(combat_log)
+                except Exception as e:
+                    log.exception(f"error while applying the results of fight {job.seed}: {e}")
 
     def process_update(
-        self, ac: AdventureContainer, updates: list[AdventureContainer]
+        self,
+        ac: AdventureContainer,
+        updates: list[AdventureContainer],
+        combat_jobs: list[_CombatJob] | None = None
     ) -> bool:
-        """ Process a player update & return whether the player can meet other players """
+        """
+        Process a player update & return whether the player can meet other players.
+        If combat_jobs is given then fights are only prepared & added to it, otherwise they are resolved immediately.
+        """
         if ac.is_on_a_quest():
             player: Player = self.db().get_player_data(ac.player.player_id)
             if Raiding.is_set(ac.player.flags):
                 try:
-                    self.process_raid_combat(ac, ac.is_quest_finished())
+                    self.__queue_combat(self._prepare_raid_combat(ac, ac.is_quest_finished()), combat_jobs)
                     return False
                 except Exception as e:
                     log.error(f"an error occurred while processing raid for player {player.name}: {e}")
@@ -619,19 +887,25 @@ class QuestManager(Manager):
                 self.db().create_and_add_notification(player, Strings.quest_abandoned)
                 return False
             elif ForcedCombat.is_set(player.flags) or (
-                (random.randint(1, 100) + player.vocation.combat_frequency) >= 85
+                (self.rng.randint(1, 100) + player.vocation.combat_frequency) >= 85
             ):  # 10% base chance of combat
-                self._process_combat(ac, updates)
+                self.__queue_combat(self._prepare_combat(ac, updates), combat_jobs)
                 return False
             else:
                 self._process_event(ac)
         elif InCrypt.is_set(ac.player.flags):
-            self._process_crypt_update(ac)
+            self.__queue_combat(self._prepare_crypt_combat(ac), combat_jobs)
             return False
         else:
             self._process_event(ac)
         return True
 
+    def __queue_combat(self, job: _CombatJob, combat_jobs: list[_CombatJob] | None) -> None:
+        if combat_jobs is None:
+            self.resolve_combat_jobs([job])
+            return
+        combat_jobs.append(job)
+
     def get_updates(self) -> list[AdventureContainer]:
         return self.db().get_all_pending_updates(self.update_interval)
 
@@ -649,14 +923,14 @@ class QuestManager(Manager):
                 if len(zones_players_map[zone_id]) < 2:
                     # if there's only one player then skip
                     continue
-                if random.randint(1, 20) < 15:
+                if self.rng.randint(1, 20) < 15:
                     # if there's less than 4 but more than one, have a very low chance of an encounter
                     continue
             # choose randomly the players that will meet
             players: list[Player] = zones_players_map[zone_id]
-            player1: Player = random.choice(players)
+            player1: Player = self.rng.choice(players)
             players.remove(player1)
-            player2: Player = random.choice(players)
+            player2: Player = self.rng.choice(players)
             # get the most up-to-date objects
             player1 = self.db().get_player_data(player1.player_id)
             player2 = self.db().get_player_data(player2.player_id)
@@ -672,7 +946,7 @@ class QuestManager(Manager):
             for player, other_player in zip([player1, player2], [player2, player1]):
                 xp_am = player.add_xp(reward_value)
                 mn_am = player.add_money(reward_value) if player.vocation.gain_money_on_player_meet else 0
-                text = f"{string} {random.choice(actions)}" + rewards_string(xp_am, mn_am, 0)
+                text = f"{string} {self.rng.choice(actions)}" + rewards_string(xp_am, mn_am, 0)
                 self.db().update_player_data(player)
                 self.db().create_and_add_notification(
                     player,
@@ -680,38 +954,303 @@ class QuestManager(Manager):
                     notification_type="Meeting"
                 )
 
-    def run(self) -> None:
+    def process_updates(self, updates: list[AdventureContainer]) -> dict[int, list[Player]]:
+        """process the given updates & return which zones the players that can meet other players are in"""
+        span = current_span()
+        span.count("containers", len(updates))
         zones_players_map: dict[int, list[Player]] = {}
-        updates = self.get_updates()
-        for update in updates:
-            if self.process_update(update, updates) and update.player.vocation.can_meet_players:
-                add_to_zones_players_map(zones_players_map, update)
-        self.handle_players_meeting(zones_players_map)
+        combat_jobs: list[_CombatJob] = []
+        with span.phase("prefetch"):
+            self._prefetch_zone_events(updates)
+        with span.phase("updates"):
+            for update in updates:
+                if self.process_update(update, updates, combat_jobs) and update.player.vocation.can_meet_players:
+                    add_to_zones_players_map(zones_players_map, update)
+        self.__prefetched_events = {}
+        self.resolve_combat_jobs(combat_jobs)
+        return zones_players_map
+
+    def run(self) -> None:
+        with tick("quest manager") as span:
+            with span.phase("fetch"):
+                updates = self.get_updates()
+            zones_players_map = self.process_updates(updates)
+            with span.phase("meetings"):
+                self.handle_players_meeting(zones_players_map)
+            span.counters.update(self.player_shades.get_metrics())
+
+
+def get_next_update_time(last_update: datetime, end_time: datetime | None, update_interval: timedelta) -> datetime:
+    """return when a player is due for an update, which is either after the update interval or when the quest ends"""
+    next_update = last_update + update_interval
+    if (end_time is not None) and (end_time < next_update):
+        return max(end_time, last_update)
+    return next_update
+
+
+class QuestScheduler:
+    """
+    Drives the quest manager using a priority queue of the times at which each player is due for an update, so that
+    players get updated close to their due time instead of all at once every thread interval.
+    The queue is rebuilt from the database at startup & re-synced every resync interval to pick up new players.
+    """
+
+    MAX_SLEEP: float = 60
+    MIN_SLEEP: float = 1
+    RETRY_DELAY: timedelta = timedelta(minutes=1)
+
+    def __init__(
+            self,
+            quest_manager: QuestManager,
+            resync_interval: float,
+            meeting_interval: float,
+            max_batch_size: int = 1000,
+            shard: tuple[int, int] | None = None
+    ) -> None:
+        """
+        :param quest_manager: the quest manager used to process the updates
+        :param resync_interval: seconds between syncs of the queue with the database
+        :param meeting_interval: seconds between each time players that were updated are allowed to meet
+        :param max_batch_size: maximum number of updates processed in a single run
+        :param shard: (shard index, number of shards), only schedule players with player_id % shards == index
+        """
+        self.quest_manager = quest_manager
+        self.shard = shard
+        self.resync_interval = resync_interval
+        self.meeting_interval = meeting_interval
+        self.max_batch_size = max_batch_size
+        self.__queue: list[tuple[datetime, int]] = []
+        self.__due_times: dict[int, datetime] = {}
+        self.__zones_players_map: dict[int, dict[int, Player]] = {}
+        self.__last_resync: float = 0
+        self.__last_meeting: float = time.time()
+
+    def __len__(self) -> int:
+        return len(self.__due_times)
+
+    def schedule(self, player_id: int, due_time: datetime) -> None:
+        """(re)schedule the update of a player, replaces the previously scheduled update if there was one"""
+        self.__due_times[player_id] = due_time
+        heapq.heappush(self.__queue, (due_time, player_id))
+
+    def pop_due(self, now: datetime, limit: int | None = None) -> list[int]:
+        """remove from the queue & return the ids of the players that are due for an update"""
+        result: list[int] = []
+        while self.__queue and (self.__queue[0][0] <= now) and ((limit is None) or (len(result) < limit)):
+            due_time, player_id = heapq.heappop(self.__queue)
+            if self.__due_times.get(player_id, None) != due_time:
+                continue  # the player was rescheduled, this entry is stale
+            del self.__due_times[player_id]
+            result.append(player_id)
+        return result
+
+    def get_seconds_to_next_update(self, now: datetime) -> float:
+        while self.__queue and (self.__due_times.get(self.__queue[0][1], None) != self.__queue[0][0]):
+            heapq.heappop(self.__queue)
+        if not self.__queue:
+            return self.MAX_SLEEP
+        return (self.__queue[0][0] - now).total_seconds()
+
+    def __schedule_from_db(self, player_ids: list[int] | None, minimum_due_time: datetime | None = None) -> None:
+        update_interval = self.quest_manager.update_interval
+        for player_id, last_update, end_time in self.quest_manager.db().get_update_schedule(player_ids):
+            if (self.shard is not None) and ((player_id % self.shard[1]) != self.shard[0]):
+                continue
+            due_time = get_next_update_time(last_update, end_time, update_interval)
+            if (minimum_due_time is not None) and (due_time < minimum_due_time):
+                due_time = minimum_due_time
+            self.schedule(player_id, due_time)
+
+    def rebuild(self) -> None:
+        """rebuild the whole queue from the database"""
+        self.__queue = []
+        self.__due_times = {}
+        self.__schedule_from_db(None)
+        self.__last_resync = time.time()
+        log.info(f"quest scheduler rebuilt with {len(self)} players")
+
+    def run(self) -> float:
+        """process all due updates & return how many seconds to wait before calling run again"""
+        tick_name = "quest scheduler" if self.shard is None else f"quest scheduler {self.shard[0]}"
+        with tick(tick_name) as span:
+            if (time.time() - self.__last_resync) >= self.resync_interval:
+                with span.phase("rebuild"):
+                    self.rebuild()
+            now = datetime.now()
+            player_ids = self.pop_due(now, limit=self.max_batch_size)
+            span.count("due", len(player_ids))
+            if player_ids:
+                # the queue may be out of date (players can be updated by the UI) so check again with the due times
+                due_player_ids: list[int] = []
+                with span.phase("fetch"):
+                    for player_id, last_update, end_time in self.quest_manager.db().get_update_schedule(player_ids):
+                        due_time = get_next_update_time(last_update, end_time, self.quest_manager.update_interval)
+                        if due_time <= now:
+                            due_player_ids.append(player_id)
+                        else:
+                            self.schedule(player_id, due_time)
+                    updates = self.quest_manager.db().get_adventure_containers(due_player_ids) if due_player_ids else []
+                if due_player_ids:
+                    zones_players_map = self.quest_manager.process_updates(updates)
+                    for zone_id, players in zones_players_map.items():
+                        self.__zones_players_map.setdefault(zone_id, {}).update({p.player_id: p for p in players})
+                    # an update that didn't get saved would be due again immediately, so wait a bit before retrying
+                    self.__schedule_from_db(due_player_ids, minimum_due_time=now + self.RETRY_DELAY)
+            if (time.time() - self.__last_meeting) >= self.meeting_interval:
+                with span.phase("meetings"):
+                    self.quest_manager.handle_players_meeting(
+                        {zone_id: list(players.values()) for zone_id, players in self.__zones_players_map.items()}
+                    )
+                self.__zones_players_map = {}
+                self.__last_meeting = time.time()
+                span.counters.update(self.quest_manager.player_shades.get_metrics())
+            span.count("scheduled", len(self))
+        return min(self.MAX_SLEEP, max(self.MIN_SLEEP, self.get_seconds_to_next_update(datetime.now())))
+
+
+def _forward_notifications(database: PilgramDatabase, notifications_queue: Queue) -> None:
+    """send the notifications & internal events created by a quest worker to the coordinator process"""
+    for notification in database.get_pending_notifications():
+        notifications_queue.put((notification.target.player_id, notification.text, notification.notification_type))
+    for event in InternalEventBus().consume_all():
+        text = NotificationsManager.get_internal_event_notification_text(event)
+        notifications_queue.put((event.recipient.player_id, text, "notification"))
+
+
+def run_quest_worker(
+        database: type[PilgramDatabase],
+        update_interval: timedelta,
+        interval: float,
+        shard: tuple[int, int],
+        notifications_queue: Queue,
+        kill_event: ProcessEvent,
+        combat_workers: int = 0
+) -> None:
+    """
+    Entry point of a sharded quest worker process. Updates the players with player_id % shards == shard index and
+    forwards the notifications it creates to the coordinator through notifications_queue until kill_event is set.
+
+    All the processes (the coordinator running the UI included) must use the database in shared mode, so that players
+    & guilds are never saved from stale cached copies.
+    """
+    log.info(f"Running quest worker {shard[0] + 1}/{shard[1]}")
+    quest_manager = QuestManager(database, update_interval, combat_workers=combat_workers)
+    quest_manager.db().set_shared(True)
+    scheduler = QuestScheduler(quest_manager, interval, interval, shard=shard)
+    while not kill_event.is_set():
+        try:
+            sleep_interval = scheduler.run()
+        except Exception as e:
+            log.exception(f"error in quest worker {shard[0]}: {e}")
+            sleep_interval = QuestScheduler.MAX_SLEEP
+        _forward_notifications(quest_manager.db(), notifications_queue)
+        kill_event.wait(sleep_interval)
+    _forward_notifications(quest_manager.db(), notifications_queue)
+
+
+def start_quest_workers(
+        database: type[PilgramDatabase],
+        update_interval: timedelta,
+        interval: float,
+        workers: int,
+        combat_workers: int = 0
+) -> tuple[list[BaseProcess], Queue, ProcessEvent]:
+    """
+    start the sharded quest worker processes, return the processes, their notifications queue & their kill event.
+    The database of this process is set as shared, since the workers write players from now on.
+    """
+    database.acquire().set_shared(True)
+    context = multiprocessing.get_context("spawn")
+    notifications_queue = context.Queue()
+    kill_event = context.Event()
+    processes: list[BaseProcess] = []
+    for i in range(workers):
+        process = context.Process(
+            target=run_quest_worker,
+            args=(database, update_interval, interval, (i, workers), notifications_queue, kill_event, combat_workers),
+            name=f"quest-worker-{i}"
+        )
+        process.start()
+        processes.append(process)
+    return processes, notifications_queue, kill_event
+
+
+def collect_forwarded_notifications(
+        database: PilgramDatabase, notifications_queue: Queue, timeout: float, limit: int = 1000
+) -> int:
+    """add the notifications forwarded by the quest workers to the pending notifications, return how many were added"""
+    added = 0
+    try:
+        while added < limit:
+            player_id, text, notification_type = notifications_queue.get(timeout=timeout if added == 0 else 0.01)
+            try:
+                target = database.get_player_data(player_id)
+            except KeyError:
+                target = Player.create_default(player_id, str(player_id), "")
+            database.add_notification(Notification(target, text, notification_type))
+            added += 1
+    except queue.Empty:
+        pass
+    return added
 
 
 class GeneratorManager(Manager):
     """helper class to manage the quest & zone event generator"""
 
-    def __init__(self, database: PilgramDatabase, generator: PilgramGenerator) -> None:
+    BATCH_CHECKPOINT_FILENAME = "generatorbatch.json"  # holds the batch in flight, so it is resumed after a restart
+    BATCH_POLL_MIN_DELAY: float = 5
+    BATCH_POLL_MAX_DELAY: float = 300
+
+    def __init__(
+            self,
+            database: PilgramDatabase,
+            generator: PilgramGenerator,
+            use_batches: bool = False,
+            max_batch_wait: float = 60,
+            concurrency: int = 1,
+            planning_horizon: timedelta | None = None,
+            kill_event: threading.Event | None = None
+    ) -> None:
         """
         :param database: database adapter to use to get & set data
         :param generator: generator adapter to used to generate quests & events
+        :param use_batches:
+            generate quests, events & enemies for all zones in a single batch (cheaper but slower) instead of
+            one call per zone & content type
+        :param max_batch_wait: seconds to wait for a batch to finish in a run before checking again on the next run
+        :param concurrency:
+            maximum number of generator calls made at the same time when not using batches, 1 makes the calls one
+            after the other waiting timeout_between_ai_calls between each of them
+        :param planning_horizon:
+            if set, generate quests for the zones that would run out of them within the horizon based on the quests
+            players are on, instead of only the zones that have less than QUEST_THRESHOLD quests left
+        :param kill_event: event set when the bot is shutting down, stops waiting for batches
         """
         super().__init__(database)
         self.generator = generator
+        self.use_batches = use_batches
+        self.max_batch_wait = max_batch_wait
+        self.concurrency = concurrency
+        self.planner = _GenerationPlanner(planning_horizon) if planning_horizon else None
+        self.kill_event = kill_event or threading.Event()
 
     def __get_zones_to_generate(
         self, biases: dict[int, int]
     ) -> tuple[list[Zone], list[int]]:
-        result: list[Zone] = []
         zones: list[Zone] = self.db().get_all_zones()
         hq = _HighestQuests.load_from_file()
         quest_counts = self.db().get_quests_counts()
-        for zone, count in zip(zones, quest_counts, strict=False):
-            if hq.is_quest_number_too_low(zone, count - biases.get(zone.zone_id, 0)):
-                result.append(zone)
-        return result, quest_counts
+        if self.planner is None:
+            result: list[Zone] = []
+            for zone, count in zip(zones, quest_counts, strict=False):
+                if hq.is_quest_number_too_low(zone, count - biases.get(zone.zone_id, 0)):
+                    result.append(zone)
+            return result, quest_counts
+        active_quests = self.db().get_active_quest_numbers()
+        current_span().count("active quests", sum(len(x) for x in active_quests.values()))
+        return self.planner.plan(zones, quest_counts, active_quests, hq, biases), quest_counts
 
+    @ticked("generator manager")
     def run(
         self, timeout_between_ai_calls: float, biases: dict[int, int] = None
     ) -> None:
@@ -726,28 +1265,45 @@ class GeneratorManager(Manager):
         """
         if not biases:
             biases = {}
+        span = current_span()
+        if self.use_batches or (self.concurrency > 1):
+            if self.use_batches:
+                self.__run_batch(biases)
+            else:
+                self.__run_concurrent(biases)
+            self.__generate_artifacts()
+            self.__update_anomaly()
+            return
         zones, quest_numbers = self.__get_zones_to_generate(biases)
+        span.count("zones", len(zones))
         log.info(f"Found {len(zones)} zones to generate quests/events for")
         for zone in zones:
             try:
                 try:
                     log.info(f"generating quests for zone {zone.zone_id}")
-                    quests = self.generator.generate_quests(zone, quest_numbers)
+                    with span.phase("generation"):
+                        quests = self.generator.generate_quests(zone, quest_numbers)
+                    span.count("quests", len(quests))
                     self.db().add_quests(quests)
                     log.info(f"Quest generation done for zone {zone.zone_id}")
                 except Exception as e:
                     log.error(
                         f"Encountered an error while generating quests for zone {zone.zone_id}: {e}"
                     )
-                sleep(timeout_between_ai_calls)
+                with span.phase("sleep"):
+                    sleep(timeout_between_ai_calls)
                 if quest_numbers[zone.zone_id - 1] < MAX_QUESTS_FOR_EVENTS:
                     # only generate zone events & enemies if there are less than MAX_QUESTS_FOR_EVENTS
                     log.info(f"generating zone events for zone {zone.zone_id}")
-                    zone_events = self.generator.generate_zone_events(zone)
+                    with span.phase("generation"):
+                        zone_events = self.generator.generate_zone_events(zone)
+                    span.count("zone events", len(zone_events))
                     self.db().add_zone_events(zone_events)
                     log.info(f"Zone events generation done for zone {zone.zone_id}")
                     log.info(f"Generating enemy metas for zone {zone.zone_id}")
-                    enemy_metas = self.generator.generate_enemy_metas(zone)
+                    with span.phase("generation"):
+                        enemy_metas = self.generator.generate_enemy_metas(zone)
+                    span.count("enemy metas", len(enemy_metas))
                     for enemy_meta in enemy_metas:
                         try:
                             self.db().add_enemy_meta(enemy_meta)
@@ -761,7 +1317,8 @@ class GeneratorManager(Manager):
                     f"Encountered an error while generating events & enemies for zone {zone.zone_id}: {e}"
                 )
             finally:
-                sleep(timeout_between_ai_calls)
+                with span.phase("sleep"):
+                    sleep(timeout_between_ai_calls)
         if len(zones) > 0:
             # generate town events only if there ia less than 6000 (600 * 2 * 5) of them
             if sum(quest_numbers) > MAX_QUESTS_FOR_TOWN_EVENTS:
@@ -769,12 +1326,19 @@ class GeneratorManager(Manager):
             # generate something for the town if you generated something for other zones
             try:
                 log.info("generating zone events for town")
-                town_events = self.generator.generate_zone_events(TOWN_ZONE)
+                with span.phase("generation"):
+                    town_events = self.generator.generate_zone_events(TOWN_ZONE)
+                span.count("zone events", len(town_events))
                 self.db().add_zone_events(town_events)
                 log.info("Zone event generation done for town")
             except Exception as e:
                 log.error(f"Encountered an error while generating for town zone: {e}")
-        # generate artifacts if needed
+        self.__generate_artifacts()
+        self.__update_anomaly()
+
+    def __generate_artifacts(self) -> None:
+        """ generate artifacts if there are not enough to be found """
+        span = current_span()
         available_artifacts = self.db().get_number_of_unclaimed_artifacts()
         log.info(
             f"Available artifacts: {available_artifacts}, threshold: {ARTIFACTS_THRESHOLD}"
@@ -782,7 +1346,9 @@ class GeneratorManager(Manager):
         if available_artifacts < ARTIFACTS_THRESHOLD:
             log.info("generating artifacts")
             try:
-                artifacts = self.generator.generate_artifacts()
+                with span.phase("generation"):
+                    artifacts = self.generator.generate_artifacts()
+                span.count("artifacts", len(artifacts))
                 for artifact in artifacts:
                     try:
                         self.db().add_artifact(artifact)
@@ -801,17 +1367,124 @@ class GeneratorManager(Manager):
                 log.info("artifact generation done")
             except Exception as e:
                 log.error(f"Encountered an error while generating artifacts: {e}")
-        # update anomaly
+
+    def __update_anomaly(self) -> None:
+        span = current_span()
         try:
             anomaly = self.db().get_current_anomaly()
             if anomaly.is_expired():
                 zones = copy(self.db().get_all_zones())
                 random.shuffle(zones)
-                new_anomaly = self.generator.generate_anomaly(zones[0])
+                with span.phase("generation"):
+                    new_anomaly = self.generator.generate_anomaly(zones[0])
                 self.db().update_anomaly(new_anomaly)
         except Exception as e:
             log.error("Encountered an error while generating anomaly: " + str(e))
 
+    def __run_batch(self, biases: dict[int, int]) -> None:
+        """ start a batch for the zones that need content, or collect the results of the batch in flight """
+        span = current_span()
+        batch_id: str | None = None
+        if os.path.isfile(self.BATCH_CHECKPOINT_FILENAME):
+            with open(self.BATCH_CHECKPOINT_FILENAME) as f:
+                batch_id = json.load(f)["batch id"]
+            log.info(f"resuming generation batch {batch_id}")
+        else:
+            zones, quest_numbers = self.__get_zones_to_generate(biases)
+            span.count("zones", len(zones))
+            log.info(f"Found {len(zones)} zones to generate quests/events for")
+            if not zones:
+                return
+            event_zones = self.__get_event_zones(zones, quest_numbers)
+            try:
+                with span.phase("generation"):
+                    batch_id = self.generator.start_batch(zones, quest_numbers, event_zones)
+            except Exception as e:
+                log.error(f"Encountered an error while starting generation batch: {e}")
+                return
+            with open(self.BATCH_CHECKPOINT_FILENAME, "w") as f:
+                json.dump({"batch id": batch_id, "started": datetime.now().isoformat()}, f)
+            log.info(f"started generation batch {batch_id} for {len(zones)} zones")
+        zones_map = {zone.zone_id: zone for zone in self.db().get_all_zones()} | {TOWN_ZONE.zone_id: TOWN_ZONE}
+        try:
+            with span.phase("batch wait"):
+                content = self.__wait_for_batch(batch_id, zones_map)
+        except GenerationBatchError as e:
+            log.error(f"generation batch failed, a new one will be started: {e}")
+            os.remove(self.BATCH_CHECKPOINT_FILENAME)
+            return
+        except Exception as e:
+            log.error(f"Encountered an error while checking generation batch {batch_id}: {e}")
+            return
+        if content is None:
+            log.info(f"generation batch {batch_id} is still running, will check again on the next run")
+            return
+        try:
+            self.__add_generated_content(content)
+        except Exception as e:
+            # nothing was saved, the results are added again on the next run
+            log.error(f"Encountered an error while saving the content of generation batch {batch_id}: {e}")
+            return
+        os.remove(self.BATCH_CHECKPOINT_FILENAME)
+        log.info(f"generation batch {batch_id} done")
+
+    def __run_concurrent(self, biases: dict[int, int]) -> None:
+        """ generate the content for all the zones that need it at once, making up to self.concurrency calls at a time """
+        span = current_span()
+        zones, quest_numbers = self.__get_zones_to_generate(biases)
+        span.count("zones", len(zones))
+        log.info(f"Found {len(zones)} zones to generate quests/events for")
+        if not zones:
+            return
+        try:
+            with span.phase("generation"):
+                content = self.generator.generate_content(
+                    zones, quest_numbers, self.__get_event_zones(zones, quest_numbers), concurrency=self.concurrency
+                )
+        except Exception as e:
+            log.error(f"Encountered an error while generating content for {len(zones)} zones: {e}")
+            return
+        self.__add_generated_content(content)
+        log.info(f"generation done for {len(zones)} zones")
+
+    @staticmethod
+    def __get_event_zones(zones: list[Zone], quest_numbers: list[int]) -> list[Zone]:
+        """ return the zones (town included) that need zone events & enemies out of the zones that need quests """
+        result = [zone for zone in zones if quest_numbers[zone.zone_id - 1] < MAX_QUESTS_FOR_EVENTS]
+        if sum(quest_numbers) <= MAX_QUESTS_FOR_TOWN_EVENTS:
+            result.append(TOWN_ZONE)
+        return result
+
+    def __add_generated_content(self, content: GeneratedContent) -> None:
+        span = current_span()
+        span.count("quests", len(content.quests))
+        span.count("zone events", len(content.zone_events))
+        span.count("enemy metas", len(content.enemy_metas))
+        with self.db().transaction():  # all or nothing, otherwise a batch saved again after an error adds quests twice
+            self.db().add_quests(content.quests)
+            self.db().add_zone_events(content.zone_events)
+            for enemy_meta in content.enemy_metas:
+                try:
+                    self.db().add_enemy_meta(enemy_meta)
+                except Exception as e:
+                    log.error(e)
+
+    def __wait_for_batch(self, batch_id: str, zones: dict[int, Zone]):
+        """
+        poll the batch with exponential backoff for at most max_batch_wait seconds, return None on timeout or if the
+        bot is shutting down
+        """
+        delay = self.BATCH_POLL_MIN_DELAY
+        deadline = time.monotonic() + self.max_batch_wait
+        while True:
+            content = self.generator.get_batch_results(batch_id, zones)
+            remaining = deadline - time.monotonic()
+            if (content is not None) or (remaining <= 0):
+                return content
+            if self.kill_event.wait(min(delay, remaining)):
+                return None
+            delay = min(delay * 2, self.BATCH_POLL_MAX_DELAY)
+
 
 class TourneyManager(Manager):
     def __init__(
@@ -826,6 +1499,7 @@ class TourneyManager(Manager):
         """wrapper around the acquire method to make calling it less verbose"""
         return self.database.acquire()
 
+    @ticked("tourney manager")
     def run(self) -> None:
         tourney = self.db().get_tourney()
         if not tourney.has_tourney_ended():
@@ -873,13 +1547,30 @@ class TourneyManager(Manager):
 
 class TimedUpdatesManager(Manager):
     """helper class to encapsulate all the small updates needed for the game to function"""
+    MIN_SLEEP: float = 1.0
 
     def __init__(self, database: PilgramDatabase) -> None:
         super().__init__(database)
 
+    def get_sleep_interval(self, max_sleep: float) -> float:
+        """
+        return how long to wait before the next run. Auctions are processed as soon as they expire: new auctions
+        always expire after the ones already in the database, so only the next expiry has to be checked. An expiry
+        that already passed belongs to an auction that could not be processed, it is retried after max_sleep.
+        """
+        next_expiry = self.db().get_next_auction_expiry()
+        if next_expiry is None:
+            return max_sleep
+        seconds_to_expiry = (next_expiry - datetime.now()).total_seconds()
+        if seconds_to_expiry <= 0:
+            return max_sleep
+        return min(max_sleep, max(self.MIN_SLEEP, seconds_to_expiry))
+
+    @ticked("updates manager")
     def run(self) -> None:
         # update auctions
         expired_auctions: list[Auction] = self.db().get_expired_auctions()
+        current_span().count("auctions", len(expired_auctions))
         log.info(f"{len(expired_auctions)} expired auctions to process")
         for auction in expired_auctions:
             if not auction.best_bidder:
@@ -926,12 +1617,16 @@ class NotificationsManager(Manager):
         self._tmp_blocked_users: list[int] = []
 
     def send_notification(self, notification: Notification, delay: float = 1.0) -> None:
-        result = self.notifier.notify(notification)
+        span = current_span()
+        with span.phase("notify"):
+            result = self.notifier.notify(notification)
+        span.count("sent")
         if not result.get("ok", False):
             reason = result.get("reason", "")
             if reason == "blocked":
                 self._tmp_blocked_users.append(notification.target.player_id)
-        sleep(delay)
+        with span.phase("sleep"):
+            sleep(delay)
 
     @staticmethod
     def get_internal_event_notification_text(event: Event) -> str:
@@ -952,8 +1647,11 @@ class NotificationsManager(Manager):
                     string = random.choice(strings)
         return string
 
+    @ticked("notifications manager")
     def run(self) -> None:
+        span = current_span()
         notifications = self.db().get_pending_notifications()
+        span.count("pending", len(notifications))
         # handle internal events (more important)
         for event in InternalEventBus().consume_all():
             if event.recipient.player_id in self._tmp_blocked_users:
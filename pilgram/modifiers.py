@@ -8,6 +8,7 @@ import pilgram.classes as classes
 import pilgram.combat_classes as cc
 import pilgram.equipment as equipment
 from pilgram.strings import Strings
+from pilgram.utils import get_rng
 
 
 class ModifierType:
@@ -132,6 +133,11 @@ class Modifier(ABC):
             return
         combat_container.write_to_log(text)
 
+    @staticmethod
+    def get_rng(context: ModifierContext) -> random.Random:
+        """returns the rng of the fight the modifier is applied in (or the global one if out of combat)"""
+        return get_rng(context.get("rng", None))
+
     def __str__(self) -> str:
         return f"*{self.NAME}* - {Strings.rarities[self.RARITY]}\n_{self.DESCRIPTION.format(str=self.strength)}_"
 
@@ -501,7 +507,7 @@ class ChaosBrand(Modifier, rarity=Rarity.UNCOMMON):
 
     def function(self, context: ModifierContext) -> Any:
         damage: cc.Damage = context.get("damage")
-        scaling_factor = 0.8 + (random.random() * self.get_fstrength())
+        scaling_factor = 0.8 + (self.get_rng(context).random() * self.get_fstrength())
         self.write_to_log(context, f"Chaos: {int(scaling_factor * 100)}%")
         return damage.scale(scaling_factor)
 
@@ -518,7 +524,7 @@ class LuckyHit(Modifier, rarity=Rarity.UNCOMMON):
 
     def function(self, context: ModifierContext) -> Any:
         damage: cc.Damage = context.get("damage")
-        if random.randint(1, 10) > 8:
+        if self.get_rng(context).randint(1, 10) > 8:
             scale = self.get_fstrength()
             self.write_to_log(context, "Lucky Hit!")
             return damage.scale(scale)
@@ -746,7 +752,7 @@ class RouletteAttack(Modifier, rarity=Rarity.RARE):
 
     def function(self, context: ModifierContext) -> Any:
         damage: cc.Damage = context.get("damage")
-        key = random.choice(list(damage.__dict__.keys()))
+        key = self.get_rng(context).choice(list(damage.__dict__.keys()))
         damage_modifier = damage.get_empty()
         damage.__dict__[key] = self.strength
         return damage + damage_modifier
@@ -930,7 +936,7 @@ class AdditionalHelper(Modifier, rarity=Rarity.LEGENDARY):
         TYPE = ModifierType.TURN_START
 
         def function(self, context: ModifierContext) -> Any:
-            if random.randint(1, 100) < 40:
+            if self.get_rng(context).randint(1, 100) < 40:
                 entity: cc.CombatActor = context.get("entity")
                 target: cc.CombatActor = context.get("opponent")
                 target.modify_hp(-self.strength)
@@ -998,7 +1004,7 @@ class Flinching(Modifier, rarity=Rarity.UNCOMMON):
 
     def function(self, context: ModifierContext) -> cc.Damage:
         target: cc.CombatActor = context.get("other")
-        if random.random() < (self.strength / 100):
+        if self.get_rng(context).random() < (self.strength / 100):
             target.timed_modifiers.append(self.FlinchedEffect(0, duration=1))
             self.write_to_log(context, f"{target.get_name()} flinches!")
         return context.get("damage")
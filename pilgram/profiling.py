@@ -0,0 +1,233 @@
+import cProfile
+import gc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Any
+
+from pilgram.listables import Listable
+
+PROFILES_DIRECTORY = "profiles"
+# objects that are shared by the whole program, they are never retained by a single object
+SHARED_TYPES: tuple[type, ...] = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class TickSpan:
+    """ the durations of the phases & the counters of a single manager tick """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.time()
+        self.duration: float = 0
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.error: str | None = None
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def phase(self, phase: str) -> Generator[None, None, None]:
+        """ time the code in the with block as the given phase, phases with the same name are summed """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def to_dict(self) -> dict[str, Any]:
+        result: dict[str, Any] = {
+            "tick": self.name,
+            "start": round(self.start, 3),
+            "duration": round(self.duration, 6),
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "counters": self.counters
+        }
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+class _NullSpan(TickSpan):
+    """ used outside of ticks (e.g. by the UI threads), records nothing """
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        pass
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan("none")
+_local = threading.local()
+_lock = threading.Lock()
+_last_spans: dict[str, dict[str, Any]] = {}
+_requested_profiles: set[str] = set()
+
+
+def current_span() -> TickSpan:
+    """ return the span of the tick running on this thread, or a span that records nothing if there is none """
+    return getattr(_local, "span", None) or _NULL_SPAN
+
+
+def request_profile(name: str) -> None:
+    """ run the next tick with the given name under cProfile & dump the stats in PROFILES_DIRECTORY """
+    with _lock:
+        _requested_profiles.add(name)
+
+
+def get_last_spans() -> dict[str, dict[str, Any]]:
+    """ return the last recorded span of each tick name """
+    with _lock:
+        return dict(_last_spans)
+
+
+def __dump_profile(profiler: cProfile.Profile, name: str) -> str:
+    os.makedirs(PROFILES_DIRECTORY, exist_ok=True)
+    path = os.path.join(PROFILES_DIRECTORY, f"{name.replace(' ', '_')}_{int(time.time())}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+@contextmanager
+def tick(name: str) -> Generator[TickSpan, None, None]:
+    """
+    record a manager tick. The span is logged as a json line once the tick ends & can be retrieved from
+    current_span() by the code running in the tick, so that it can add its own phases & counters.
+    """
+    span = TickSpan(name)
+    previous_span = getattr(_local, "span", None)
+    _local.span = span
+    with _lock:
+        profiler = cProfile.Profile() if name in _requested_profiles else None
+        _requested_profiles.discard(name)
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield span
+    except Exception as e:
+        span.error = str(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        span.duration = time.perf_counter() - start
+        _local.span = previous_span
+        span_dict = span.to_dict()
+        if profiler:
+            span_dict["profile"] = __dump_profile(profiler, name)
+        with _lock:
+            _last_spans[name] = span_dict
+        # idle ticks (e.g. the notifications manager with nothing to send) would just flood the logs
+        log.log(logging.INFO if (any(span.counters.values()) or span.phases) else logging.DEBUG, json.dumps(span_dict))
+
+
+def ticked(name: str) -> Callable[[Callable], Callable]:
+    """ decorator, record each call of the decorated function as a tick """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tick(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _get_content_ids() -> set[int]:
+    """ return the ids of the content objects (vocations, items, etc.) loaded from the content files """
+    result: set[int] = set()
+    classes: list[type] = [Listable]
+    while classes:
+        cls = classes.pop()
+        classes.extend(cls.__subclasses__())
+        result.update(id(x) for x in getattr(cls, "ALL_ITEMS", ()))
+    return result
+
+
+def get_memory_usage(roots: Iterable[Any], seen: set[int] | None = None) -> tuple[int, dict[str, tuple[int, int]]]:
+    """
+    return the size in bytes of all the objects reachable from roots & the (number, size) of those objects by type.
+    Objects whose id is in seen are not counted & the counted ones are added to it, so a set shared between calls
+    makes sure that objects are only counted once. Shared objects (classes, functions, content) are ignored.
+    """
+    if seen is None:
+        seen = set()
+    content_ids = _get_content_ids()
+    total = 0
+    types: dict[str, list[int]] = {}
+    stack: list[Any] = list(roots)
+    while stack:
+        obj = stack.pop()
+        if (id(obj) in seen) or (id(obj) in content_ids) or isinstance(obj, SHARED_TYPES) or (obj is None):
+            continue
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        total += size
+        record = types.setdefault(type(obj).__name__, [0, 0])
+        record[0] += 1
+        record[1] += size
+        stack.extend(gc.get_referents(obj))
+    return total, {type_name: (count, size) for type_name, (count, size) in types.items()}
+
+
+def _is_game_object(obj: Any, content_ids: set[int]) -> bool:
+    return type(obj).__module__.startswith("pilgram.") and hasattr(obj, "__dict__") and (id(obj) not in content_ids)
+
+
+def _get_game_references(obj: Any, content_ids: set[int]) -> Iterator[Any]:
+    """ yield the game objects referenced by the attributes of obj, also looking inside lists, tuples & dicts """
+    for value in vars(obj).values():
+        if isinstance(value, (list, tuple, set)):
+            yield from (x for x in value if _is_game_object(x, content_ids))
+        elif isinstance(value, dict):
+            yield from (x for x in value.values() if _is_game_object(x, content_ids))
+        elif _is_game_object(value, content_ids):
+            yield value
+
+
+def find_reference_cycles(roots: Iterable[Any]) -> dict[str, int]:
+    """
+    find the reference cycles between game objects (e.g. a guild whose founder is the player that references it)
+    reachable from roots. Return how many times each kind of cycle was found, as 'Player -> Guild -> Player'.
+    """
+    content_ids = _get_content_ids()
+    cycles: dict[str, int] = {}
+    done: set[int] = set()
+    for root in roots:
+        if (not _is_game_object(root, content_ids)) or (id(root) in done):
+            continue
+        path: list[Any] = [root]
+        on_path: set[int] = {id(root)}
+        iterators = [_get_game_references(root, content_ids)]
+        while iterators:
+            child = next(iterators[-1], None)
+            if child is None:
+                iterators.pop()
+                finished = path.pop()
+                on_path.discard(id(finished))
+                done.add(id(finished))
+            elif id(child) in on_path:
+                names = [type(x).__name__ for x in path[[id(x) for x in path].index(id(child)):]]
+                start = names.index(min(names))  # the same cycle can be found from any of its objects
+                names = names[start:] + names[:start]
+                signature = " -> ".join(names + names[:1])
+                cycles[signature] = cycles.get(signature, 0) + 1
+            elif id(child) not in done:
+                path.append(child)
+                on_path.add(id(child))
+                iterators.append(_get_game_references(child, content_ids))
+    return cycles
@@ -271,6 +271,8 @@ class Strings:
 
     # auctions
     no_auctions_yet = "No auctions yet"
+    no_auctions_found = "No auctions match the given filters"
+    invalid_auction_filter = "Invalid filter '{filter}'. Valid filters are: slot=head|chest|legs|arms|primary|secondary|relic, rarity=2, level=10 or level=10-20, price=5000 (max bid), sort={sorts} & page=2"
     auction_created = "Auction for item {item} created successfully."
     bid_placed = f"You placed a bid of {{amount}} {MONEY} on item {{item}}."
     auction_already_exists = "Auction for item {item} exists."
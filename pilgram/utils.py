@@ -1,4 +1,5 @@
 import json
+import random
 import time
 from collections.abc import Callable
 from datetime import timedelta
@@ -102,6 +103,11 @@ def generate_random_eldritch_name() -> str:
     return result
 
 
+def get_rng(rng: random.Random | None = None) -> random.Random:
+    """returns the given rng or the generator used by the random module functions if rng is None"""
+    return rng if rng is not None else random._inst
+
+
 def get_input_first_letter(input_string: str, accepted_letters: str) -> str | None:
     letter = input_string[0].lower()
     if letter in accepted_letters:
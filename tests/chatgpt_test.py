@@ -1,6 +1,9 @@
 import json
+import time
 import unittest
 
+import requests
+
 from AI.chatgpt import (
     ARTIFACTS_PER_BATCH,
     ARTIFACTS_PROMPT,
@@ -9,8 +12,10 @@ from AI.chatgpt import (
     EVENTS_PROMPT,
     MONSTERS_PER_BATCH,
     QUESTS_PROMPT,
+    QUESTS_PER_BATCH,
     ChatGPTAPI,
     ChatGPTGenerator,
+    GPTAPIError,
     build_messages,
     get_artifacts_system_prompt,
     get_enemies_system_prompt,
@@ -20,13 +25,15 @@ from AI.chatgpt import (
     ANOMALY_PROMPT,
     ANOMALY_RESPONSE_FORMAT,
 )
+from AI.stub_server import StubOpenAIServer
 from AI.utils import (
     filter_string_list_remove_empty,
     filter_strings_list_remove_too_short,
     remove_leading_numbers,
 )
-from pilgram.classes import Zone
+from pilgram.classes import TOWN_ZONE, Zone
 from pilgram.combat_classes import Damage
+from pilgram.profiling import tick
 
 SETTINGS = json.load(open('settings.json'))
 
@@ -38,8 +45,22 @@ def _read_file(filename: str) -> str:
 
 class TestChatGPT(unittest.TestCase):
     ZONE: Zone = Zone(1, "Test zone", 1, "forest at the edge of the city", Damage.get_empty(), Damage.get_empty(), {})
-    api_wrapper = ChatGPTAPI(SETTINGS["ChatGPT token"], "gpt-4o-mini")
-    generator: ChatGPTGenerator = ChatGPTGenerator(api_wrapper)
+    stub_server: StubOpenAIServer
+    api_wrapper: ChatGPTAPI
+    generator: ChatGPTGenerator
+
+    @classmethod
+    def setUpClass(cls):
+        # the generation tests run against a local server that replays the mock responses, set
+        # "ChatGPT base url" in settings.json to test against the real API
+        cls.stub_server = StubOpenAIServer(seed=1).start()
+        base_url = SETTINGS.get("ChatGPT base url", cls.stub_server.url)
+        cls.api_wrapper = ChatGPTAPI(SETTINGS["ChatGPT token"], "gpt-4o-mini", base_url=base_url)
+        cls.generator = ChatGPTGenerator(cls.api_wrapper)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_server.stop()
 
     def test_build_messages(self):
         messages = build_messages("system", "aaa", "bbb")
@@ -116,6 +137,75 @@ class TestChatGPT(unittest.TestCase):
             print(enemy_meta.win_text)
             print(enemy_meta.lose_text)
 
+    def test_generate_offline(self):
+        api_wrapper = ChatGPTAPI("token", "gpt-4o-mini", base_url=self.stub_server.url)
+        generator = ChatGPTGenerator(api_wrapper)
+        self.assertEqual(len(generator.generate_quests(self.ZONE, [0])), QUESTS_PER_BATCH)
+        self.assertEqual(len(generator.generate_zone_events(self.ZONE)), EVENTS_PER_BATCH)
+        self.assertEqual(len(generator.generate_enemy_metas(self.ZONE)), MONSTERS_PER_BATCH)
+        self.assertEqual(generator.generate_anomaly(self.ZONE).zone, self.ZONE)
+        self.stub_server.fail_next = 1
+        with self.assertRaises(GPTAPIError) as context:
+            generator.generate_artifacts()
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertEqual(len(generator.generate_artifacts()), ARTIFACTS_PER_BATCH)
+
+    def test_stub_server_batches(self):
+        url = self.stub_server.url
+        lines = [
+            {"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions", "body": {"model": "stub", "messages": build_messages("user", prompt)}}
+            for i, prompt in enumerate((QUESTS_PROMPT, EVENTS_PROMPT))
+        ]
+        file = requests.post(
+            f"{url}/v1/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(json.dumps(x) for x in lines))}
+        ).json()
+        batch = requests.post(f"{url}/v1/batches", json={"input_file_id": file["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"}).json()
+        batch = requests.get(f"{url}/v1/batches/{batch['id']}").json()
+        self.assertEqual(batch["status"], "completed")
+        self.assertEqual(batch["request_counts"]["completed"], 2)
+        output = [json.loads(x) for x in requests.get(f"{url}/v1/files/{batch['output_file_id']}/content").text.splitlines()]
+        self.assertEqual([x["custom_id"] for x in output], ["0", "1"])
+        self.assertIn("Quest", output[0]["response"]["body"]["choices"][0]["message"]["content"])
+
+    def test_generate_batch(self):
+        api_wrapper = ChatGPTAPI("token", "gpt-4o-mini", base_url=self.stub_server.url)
+        generator = ChatGPTGenerator(api_wrapper)
+        batch_id = generator.start_batch([self.ZONE], [0], [self.ZONE, TOWN_ZONE])
+        content = generator.get_batch_results(batch_id, {self.ZONE.zone_id: self.ZONE, TOWN_ZONE.zone_id: TOWN_ZONE})
+        self.assertEqual(len(content.quests), QUESTS_PER_BATCH)
+        self.assertEqual(len(content.zone_events), EVENTS_PER_BATCH * 2)
+        self.assertEqual(len(content.enemy_metas), MONSTERS_PER_BATCH)
+        self.assertEqual({event.zone.zone_id for event in content.zone_events}, {self.ZONE.zone_id, TOWN_ZONE.zone_id})
+        self.stub_server.batch_delay = 60
+        try:
+            batch_id = generator.start_batch([self.ZONE], [0], [])
+            self.assertIsNone(generator.get_batch_results(batch_id, {self.ZONE.zone_id: self.ZONE}))
+        finally:
+            self.stub_server.batch_delay = 0
+
+    def test_generate_content_concurrently(self):
+        api_wrapper = ChatGPTAPI("token", "gpt-4o-mini", base_url=self.stub_server.url)
+        api_wrapper.RETRY_BASE_DELAY = 0.01
+        generator = ChatGPTGenerator(api_wrapper)
+        zones = [Zone(i, f"zone {i}", i, "AAAAA", Damage.get_empty(), Damage.get_empty(), {}) for i in range(1, 5)]
+        self.stub_server.latency = 0.2
+        self.stub_server.fail_next = 2  # failed requests are retried
+        try:
+            start = time.perf_counter()
+            with tick("test generation") as span:
+                content = generator.generate_content(zones, [0] * len(zones), zones[:2], concurrency=8)
+            elapsed = time.perf_counter() - start
+        finally:
+            self.stub_server.latency = 0
+        self.assertEqual(len(content.quests), QUESTS_PER_BATCH * 4)
+        self.assertEqual(len(content.zone_events), EVENTS_PER_BATCH * 2)
+        self.assertEqual(len(content.enemy_metas), MONSTERS_PER_BATCH * 2)
+        self.assertEqual(span.counters["api calls"], 8)
+        self.assertEqual(span.counters["api retries"], 2)
+        self.assertLess(elapsed, 0.2 * 8)  # the 8 calls (+ 2 retries) overlap
+
     def test_filter_string_list_remove_empty_strings(self):
         string_list = ["aaa", "bbb", "", "\n", "ccc"]
         result = filter_string_list_remove_empty(string_list)
@@ -1,7 +1,7 @@
 import time
 import unittest
 from copy import deepcopy
-from random import randint
+from random import Random, randint
 
 from pilgram.classes import (
     Enemy,
@@ -9,11 +9,13 @@ from pilgram.classes import (
     Player,
     Quest,
     QuickTimeEvent,
+    Shade,
     Zone,
     ZoneEvent, Vocation,
 )
 from pilgram.combat_classes import CombatContainer, Damage
 from pilgram.equipment import ConsumableItem, Equipment, EquipmentType
+from pilgram.flags import BUFF_FLAGS_MASK, ForcedCombat, HexedFlag, StrengthBuff, unset_flags
 from pilgram.modifiers import Modifier, print_all_modifiers, get_modifier_from_name
 
 
@@ -196,6 +198,38 @@ class TestClasses(unittest.TestCase):
         result = combat.fight()
         print(result)
 
+    def test_combat_replay(self):
+        def _fight(seed: int) -> str:
+            player = Player.create_default(0, "Ombro", "")
+            player.level = 10
+            player.gear_level = 10
+            zone = Zone(1, "zone name", 10, "AAAA", Damage(5, 5, 1, 0, 5, 0, 0, 0), Damage(3, 3, 3, 3, 3, 1, 0, 0), {})
+            enemy = Enemy(
+                EnemyMeta(0, zone, "Cock monger", "AAAAA", "WIN", "LOSS"),
+                [get_modifier_from_name("Chaos Brand", 150), get_modifier_from_name("Lucky Hit", 200)],
+                0,
+                rng=Random(seed)
+            )
+            return CombatContainer([player, enemy], {player: None, enemy: None}, seed=seed).fight()
+
+        self.assertEqual(_fight(1234), _fight(1234))
+
+    def test_shade(self):
+        player = Player.create_default(0, "Ombro", "")
+        player.level = 10
+        for type_id in (0, 21, 44, 66):
+            player.equip_item(_generate_equipment(player, EquipmentType.get(type_id), []))
+        player.satchel = [ConsumableItem.get(5)]
+        shade = Shade.create(player, rng=Random(0))
+        self.assertEqual(len(shade.equipped_items), 3)
+        self.assertEqual(len(player.equipped_items), 4)
+        self.assertEqual(shade.satchel, [])
+        self.assertEqual(shade.name, "Ombro's Shade")
+        self.assertNotEqual(shade, player)
+        combat = CombatContainer([player, shade], {player: None, shade: None}, seed=0)
+        combat.fight()
+        self.assertTrue(player.is_dead() or shade.is_dead())
+
     def test_stats(self):
         player = Player.create_default(0, "Ombro", "")
         self.assertEqual(player.get_stats().vitality, 1)
@@ -203,3 +237,26 @@ class TestClasses(unittest.TestCase):
         item = _generate_equipment(player, EquipmentType.get(0), [modifier])
         player.equip_item(item)
         self.assertEqual(player.get_stats().vitality, 11)
+
+    def test_flags(self):
+        flags = HexedFlag.set(StrengthBuff.set(ForcedCombat.get_empty()))
+        self.assertTrue(HexedFlag.is_set(flags) and StrengthBuff.is_set(flags))
+        self.assertFalse(ForcedCombat.is_set(flags))
+        self.assertFalse(ForcedCombat.is_set(ForcedCombat.unset(flags)))  # unsetting a flag that isn't set is a no-op
+        flags = unset_flags(flags, BUFF_FLAGS_MASK)
+        self.assertTrue(HexedFlag.is_set(flags))
+        self.assertFalse(StrengthBuff.is_set(flags))
+
+    def test_vocation_combine(self):
+        first, second = Vocation.get_tier(1, 1), Vocation.get_tier(2, 3)
+        self.assertEqual((second.vocation_id, second.level), (2, 3))
+        self.assertEqual(Vocation.get_correct_vocation_tier_no_player(2, {2: 3}), second)
+        combined = Vocation.combine([first, second])
+        self.assertIs(combined, Vocation.combine([first, second]))
+        self.assertEqual(combined.original_vocations, [first, second])
+        self.assertEqual(combined.power_bonus, first.power_bonus + second.power_bonus)
+        self.assertIs(combined + first, combined)  # a vocation can't be added twice
+        combined + Vocation.get_tier(3, 1)
+        self.assertEqual(len(combined.original_vocations), 2)  # shared objects are never modified
+        with self.assertRaises(ValueError):
+            Vocation.get_tier(1, 6)
@@ -0,0 +1,16 @@
+from orm.db import PilgramORMDatabase
+from orm.models import ZoneModel
+from pilgram.classes import Quest, Zone
+from pilgram.combat_classes import Damage
+
+
+def get_or_create_zone(db: PilgramORMDatabase, name: str, quests: int = 0) -> Zone:
+    """ return the zone with the given name, created with the given number of quests if it doesn't exist """
+    zs = ZoneModel.get_or_none(ZoneModel.name == name)
+    if zs is None:
+        db.add_zone(Zone(0, name, 1, "AAAAAAAA", Damage.get_empty(), Damage.get_empty(), {}))
+        zs = ZoneModel.get(ZoneModel.name == name)
+        zone = db.get_zone(zs.id)
+        if quests > 0:
+            db.add_quests([Quest(0, zone, i, f"Quest {i}", "AAAAAAAA", "WIN", "LOSS") for i in range(quests)])
+    return db.get_zone(zs.id)
@@ -1,3 +1,6 @@
+import json
+import os
+import tempfile
 import unittest
 
 from pilgram.globals import ContentMeta
@@ -8,3 +11,23 @@ class TestGlobals(unittest.TestCase):
     def test_content_meta(self):
         self.assertEqual(ContentMeta.get("guilds.max_level"), 10)
         self.assertEqual(ContentMeta.get("test"), "test")
+
+    def test_content_meta_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "meta.json")
+            with open(filename, "w") as f:
+                json.dump({"guilds": {"max_level": 10, "names": ["a"]}}, f)
+
+            class TestMeta(ContentMeta):
+                FILENAME = filename
+                CHECK_INTERVAL = 0
+
+            self.assertEqual(TestMeta.get("guilds.max_level"), 10)
+            TestMeta.get("guilds.names").append("b")  # cached values can't be modified by the callers
+            self.assertEqual(TestMeta.get("guilds.names"), ["a"])
+            with open(filename, "w") as f:
+                json.dump({"guilds": {"max_level": 20}}, f)
+            os.utime(filename, (0, 0))  # make sure the mtime changes even on file systems with coarse timestamps
+            self.assertEqual(TestMeta.get("guilds.max_level"), 20)
+            self.assertEqual(TestMeta.get("guilds.names", default=[]), [])
+            self.assertEqual(ContentMeta.get("guilds.max_level"), 10)
@@ -1,5 +1,195 @@
+import os
+import threading
+import time
 import unittest
+from datetime import datetime, timedelta
+from random import Random
+
+from AI.chatgpt import ChatGPTAPI, ChatGPTGenerator
+from AI.stub_server import StubOpenAIServer
+from orm.db import PilgramORMDatabase
+from pilgram.classes import (
+    TOWN_ZONE,
+    Enemy,
+    EnemyMeta,
+    Player,
+    Shade,
+    Zone,
+    ZoneEvent,
+)
+from pilgram.combat_classes import Damage
+from pilgram.manager import (
+    GeneratorManager,
+    QuestManager,
+    QuestScheduler,
+    _CombatJob,
+    _GenerationPlanner,
+    _HighestQuests,
+    _ShadePools,
+    collect_forwarded_notifications,
+    get_next_update_time,
+    start_quest_workers,
+)
+from pilgram.modifiers import get_modifier_from_name
+from pilgram.profiling import get_last_spans, request_profile, tick
+from tests.fixtures import get_or_create_zone
+
+
+def _create_combat_jobs(logs: list[str], amount: int) -> list[_CombatJob]:
+    zone = Zone(1, "zone name", 10, "AAAA", Damage(5, 5, 1, 0, 5, 0, 0, 0), Damage(3, 3, 3, 3, 3, 1, 0, 0), {})
+    jobs: list[_CombatJob] = []
+    for i in range(amount):
+        player = Player.create_default(i, f"Ombro {i}", "")
+        player.level = 10 + i
+        player.gear_level = 10
+        enemy = Enemy(
+            EnemyMeta(0, zone, "Cock monger", "AAAAA", "WIN", "LOSS"),
+            [get_modifier_from_name("Chaos Brand", 150)],
+            i,
+            rng=Random(i)
+        )
+        jobs.append(_CombatJob([player, enemy], [None, None], i, logs.append))
+    return jobs
 
 
 class TestManagers(unittest.TestCase):
-    pass
\ No newline at end of file
+
+    def test_parallel_combat(self):
+        serial_logs: list[str] = []
+        serial_jobs = _create_combat_jobs(serial_logs, 8)
+        QuestManager(PilgramORMDatabase, timedelta(hours=1)).resolve_combat_jobs(serial_jobs)
+        parallel_logs: list[str] = []
+        parallel_jobs = _create_combat_jobs(parallel_logs, 8)
+        QuestManager(PilgramORMDatabase, timedelta(hours=1), combat_workers=2).resolve_combat_jobs(parallel_jobs)
+        self.assertEqual(serial_logs, parallel_logs)
+        for serial_job, parallel_job in zip(serial_jobs, parallel_jobs, strict=True):
+            self.assertEqual(serial_job.participants[0].hp_percent, parallel_job.participants[0].hp_percent)
+            self.assertEqual(serial_job.participants[1].hp, parallel_job.participants[1].hp)
+
+    def test_shade_pools(self):
+        pools = _ShadePools(2)
+        for i in range(3):
+            pools.add(1, Shade.create(Player.create_default(i, f"Ombro {i}", "")))
+        self.assertEqual(len(pools), 2)
+        self.assertEqual(pools.pop(1).name, "Ombro 1's Shade")
+        self.assertIsNone(pools.pop(2))
+        self.assertEqual(pools.get_metrics(), {"shades": 1, "created": 3, "evicted": 1, "fought": 1})
+
+    def test_next_update_time(self):
+        now = datetime.now()
+        interval = timedelta(hours=2)
+        self.assertEqual(get_next_update_time(now, None, interval), now + interval)
+        self.assertEqual(get_next_update_time(now, now + timedelta(hours=1), interval), now + timedelta(hours=1))
+        self.assertEqual(get_next_update_time(now, now + timedelta(hours=3), interval), now + interval)
+        self.assertEqual(get_next_update_time(now, now - timedelta(hours=1), interval), now)
+
+    def test_quest_scheduler_queue(self):
+        now = datetime.now()
+        scheduler = QuestScheduler(QuestManager(PilgramORMDatabase, timedelta(hours=1)), 3600, 3600)
+        scheduler.schedule(1, now - timedelta(minutes=5))
+        scheduler.schedule(2, now - timedelta(minutes=10))
+        scheduler.schedule(3, now + timedelta(minutes=10))
+        scheduler.schedule(1, now + timedelta(minutes=5))  # reschedule, the old entry becomes stale
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.pop_due(now), [2])
+        self.assertAlmostEqual(scheduler.get_seconds_to_next_update(now), 300, delta=1)
+        self.assertEqual(scheduler.pop_due(now + timedelta(minutes=20)), [1, 3])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_sharded_quest_workers(self):
+        db = PilgramORMDatabase.instance()
+        db.add_zone_event(ZoneEvent(0, TOWN_ZONE, "You walk around town."))
+        player_ids = [3001, 3002, 3003, 3004]
+        for player_id in player_ids:
+            player = db.get_player_from_name(f"Worker test {player_id}")
+            if not player:
+                player = Player.create_default(player_id, f"Worker test {player_id}", "")
+                db.add_player(player)
+            db.update_quest_progress(db.get_player_adventure_container(player), last_update=datetime.now() - timedelta(days=1))
+        processes, notifications_queue, kill_event = start_quest_workers(PilgramORMDatabase, timedelta(hours=1), 3600, 2)
+        notified: set[int] = set()
+        timeout = time.time() + 60
+        try:
+            while (not set(player_ids).issubset(notified)) and (time.time() < timeout):
+                collect_forwarded_notifications(db, notifications_queue, 1)
+                notified.update(n.target.player_id for n in db.get_pending_notifications())
+            # the workers updated the players, this process must not see its cached copies
+            self.assertTrue(all(db.get_player_data(x) is not db.get_player_data(x) for x in player_ids))
+        finally:
+            kill_event.set()
+            for process in processes:
+                process.join(timeout=30)
+            db.set_shared(False)
+        self.assertTrue(set(player_ids).issubset(notified))
+        for process in processes:
+            self.assertEqual(process.exitcode, 0)
+
+    def test_tick_spans(self):
+        request_profile("test tick")
+        with tick("test tick") as span:
+            QuestManager(PilgramORMDatabase, timedelta(hours=1)).resolve_combat_jobs(_create_combat_jobs([], 2))
+        self.assertEqual(span.counters["fights"], 2)
+        self.assertIn("combat", span.phases)
+        last_span = get_last_spans()["test tick"]
+        self.assertEqual(last_span["counters"], {"fights": 2})
+        self.assertTrue(os.path.isfile(last_span["profile"]))
+        os.remove(last_span["profile"])
+
+    def test_highest_quests_merge(self):
+        zones = [Zone(i, f"zone {i}", 1, "AAAA", Damage.get_empty(), Damage.get_empty(), {}) for i in (1001, 1002)]
+        # two quest workers with their own copy of the data, each one advancing a different zone
+        first_worker = _HighestQuests.load_from_file()
+        second_worker = _HighestQuests.load_from_file()
+        first_worker.update(zones[0].zone_id, first_worker.get(zones[0]) + 5)
+        second_worker.update(zones[1].zone_id, second_worker.get(zones[1]) + 5)
+        saved = _HighestQuests.load_from_file()
+        self.assertEqual(saved.get(zones[0]), first_worker.get(zones[0]))
+        self.assertEqual(saved.get(zones[1]), second_worker.get(zones[1]))
+
+    def test_generation_planner(self):
+        zones = [Zone(i, f"zone {i}", i * 5, "AAAA", Damage.get_empty(), Damage.get_empty(), {}) for i in range(1, 6)]
+        quest_counts = [20, 20, 100, 100, 50]
+        active_quests = {2: [18, 17], 3: [97, 96, 95, 94, 93], 4: [10], 5: [40]}
+        planner = _GenerationPlanner(timedelta(days=365))
+        hq = _HighestQuests({})
+        self.assertEqual(planner.get_buffer(zones[0], 20, []), 3)
+        self.assertGreater(planner.get_buffer(zones[1], 20, active_quests[2]), 3)
+        # the zones with more players near the frontier come first, zone 4 has only a player far from the frontier
+        self.assertEqual(
+            [zone.zone_id for zone in planner.plan(zones, quest_counts, active_quests, hq, {})],
+            [3, 2, 5]
+        )
+        # zone 5 lasts until the next run if the runs are close enough
+        planner = _GenerationPlanner(timedelta(seconds=1))
+        self.assertEqual(
+            [zone.zone_id for zone in planner.plan(zones, quest_counts, active_quests, hq, {})],
+            [3, 2]
+        )
+        self.assertEqual(
+            [zone.zone_id for zone in planner.plan(zones, quest_counts, active_quests, hq, {1: 18})],
+            [3, 2, 1]
+        )
+
+    def test_generator_batches(self):
+        with StubOpenAIServer(batch_delay=60) as stub_server:
+            generator = ChatGPTGenerator(ChatGPTAPI("token", "gpt-4o-mini", base_url=stub_server.url))
+            kill_event = threading.Event()
+            kill_event.set()  # the bot is shutting down, the manager doesn't wait for the batch
+            manager = GeneratorManager(
+                PilgramORMDatabase, generator, use_batches=True, max_batch_wait=600, kill_event=kill_event
+            )
+            zone = get_or_create_zone(PilgramORMDatabase.instance(), "Generator test zone", 3)
+            biases = {zone.zone_id: 10 ** 9}  # force the generation for the zone
+            try:
+                manager.run(0, biases)
+                # batch still running, it is resumed on the next run instead of starting a new one
+                self.assertTrue(os.path.isfile(GeneratorManager.BATCH_CHECKPOINT_FILENAME))
+                self.assertEqual(len(stub_server.batches), 1)
+                stub_server.batch_delay = 0
+                manager.run(0, biases)
+                self.assertEqual(len(stub_server.batches), 1)
+                self.assertFalse(os.path.isfile(GeneratorManager.BATCH_CHECKPOINT_FILENAME))
+                self.assertGreater(get_last_spans()["generator manager"]["counters"]["quests"], 0)
+            finally:
+                if os.path.isfile(GeneratorManager.BATCH_CHECKPOINT_FILENAME):
+                    os.remove(GeneratorManager.BATCH_CHECKPOINT_FILENAME)
@@ -10,6 +10,7 @@ from minigames.utils import (
     get_word_letters,
     print_maze,
 )
+from minigames.words import WordDifficulty
 from pilgram.classes import Player
 
 
@@ -69,6 +70,9 @@ class TestMinigames(unittest.TestCase):
     def test_get_random_word(self):
         word = get_random_word()
         self.assertTrue(word in ["elden", "cock", "ring"])
+        self.assertEqual(get_random_word((5, 5)), "elden")
+        self.assertIn(get_random_word((1, 4)), ["cock", "ring"])
+        self.assertRaises(ValueError, get_random_word, WordDifficulty.HARD)
 
     def test_get_word_letters(self):
         letters = get_word_letters("ombro")
@@ -1,23 +1,44 @@
 import random
 import unittest
-from datetime import timedelta
+from datetime import datetime, timedelta
 from random import randint
 
+import orm.db
 from orm.db import (
+    _ZONE_EVENT_POOLS,
     ENCODING,
     PilgramORMDatabase,
+    _get_id_pool,
     decode_equipped_items_ids,
     decode_modifiers,
     decode_progress,
     decode_satchel,
+    decode_vocation_ids,
+    decode_vocation_progress,
     encode_equipped_items,
     encode_modifiers,
     encode_progress,
-    encode_satchel, decode_vocation_ids, encode_vocation_ids, decode_vocation_progress, encode_vocation_progress,
+    encode_satchel,
+    encode_vocation_ids,
+    encode_vocation_progress,
+)
+from orm.models import PlayerModel, ZoneEventModel
+from orm.utils import get_caches_memory_report
+from pilgram.classes import (
+    TOWN_ZONE,
+    AdventureContainer,
+    Auction,
+    EnemyMeta,
+    Guild,
+    Player,
+    Quest,
+    ZoneEvent,
 )
-from pilgram.classes import Player, Guild
 from pilgram.equipment import ConsumableItem, Equipment, EquipmentType
+from pilgram.flags import Raiding
 from pilgram.modifiers import get_modifier
+from pilgram.profiling import find_reference_cycles, get_memory_usage
+from tests.fixtures import get_or_create_zone
 
 
 class TestORMDB(unittest.TestCase):
@@ -150,6 +171,39 @@ class TestORMDB(unittest.TestCase):
             for item_id in equipment_ids:
                 self.assertTrue(item_id in chosen_items, msg=f"{item_id} not in {chosen_items}. equipment: {equipment_ids}")
 
+    def test_lazy_item_damage(self):
+        db = PilgramORMDatabase.instance()
+        player = self._get_or_create_player(70, "Ciro")
+        item = Equipment.generate(12, EquipmentType.get(0), 1)
+        item.equipment_id = db.add_item(item, player)
+        loaded_item = db.get_item(item.equipment_id)
+        self.assertIsNone(loaded_item._damage)  # not derived until needed
+        self.assertEqual(str(loaded_item.damage), str(item.damage))
+        self.assertEqual(str(loaded_item.resist), str(item.resist))
+        self.assertIs(db.get_item(item.equipment_id).damage, loaded_item.damage)  # memoized by type, level & seed
+        loaded_item.temper()
+        self.assertEqual(loaded_item.damage.get_total_damage(), Equipment(0, 13, item.equipment_type, "", item.seed, None, None, [], 0).damage.get_total_damage())
+
+    def test_search_auctions(self):
+        db = PilgramORMDatabase.instance()
+        player = self._get_or_create_player(71, "Auctioneer")
+        for level, rarity, bid in ((91, 0, 100), (92, 1, 200)):
+            item = Equipment.generate(level, EquipmentType.get(0), rarity)
+            item.equipment_id = db.add_item(item, player)
+            db.add_auction(Auction.create_default(player, item, bid))
+        try:
+            auctions = db.search_auctions(min_level=91, max_level=92)
+            self.assertEqual([x.item.level for x in auctions], [91, 92])
+            self.assertEqual([x.item.level for x in db.search_auctions(min_level=91, max_level=92, sort="level")], [92, 91])
+            self.assertEqual([x.item.level for x in db.search_auctions(min_level=91, max_level=92, rarity=1)], [92])
+            self.assertEqual([x.item.level for x in db.search_auctions(min_level=91, max_level=92, max_price=150)], [91])
+            self.assertEqual(db.search_auctions(min_level=91, max_level=92, slot=EquipmentType.get(0).slot + 1), [])
+            self.assertEqual(len(db.search_auctions(min_level=91, max_level=92, page=2, page_size=1)), 1)
+            self.assertGreater(db.get_next_auction_expiry(), datetime.now())
+        finally:
+            for auction in db.search_auctions(min_level=91, max_level=92, page_size=100):
+                db.delete_auction(auction)
+
     def test_get_guild_ids_from_name_case_insensitive(self):
         # delete pilgram db in test before running this test
         db = PilgramORMDatabase.instance()
@@ -162,6 +216,164 @@ class TestORMDB(unittest.TestCase):
         self.assertTrue(1 in result)
         self.assertTrue(2 in result)
 
+    def test_bank_logs(self):
+        db = PilgramORMDatabase.instance()
+        first = self._get_or_create_player(72, "Banker")
+        second = self._get_or_create_player(73, "Thief")
+        guild = Guild.create_default(first, f"Bank{randint(0, 1000000)}", "AAAA")
+        guild.guild_id = db.add_guild(guild)
+        for amount in range(1, 13):
+            db.add_bank_log(guild, "deposit", first.player_id, amount)
+        db.add_bank_log(guild, "withdrawal", second.player_id, 50)
+        deposits = db.get_bank_logs(guild, "deposit")
+        self.assertEqual(deposits, [("Banker", amount) for amount in range(3, 13)])
+        self.assertEqual(db.get_bank_logs(guild, "withdrawal"), [("Thief", 50)])
+        self.assertEqual(db.get_bank_log_totals(guild), {"Banker": (78, 0), "Thief": (0, 50)})
+        db.delete_guild(guild)
+        self.assertEqual(db.get_bank_logs(guild, "deposit"), [])
+
+    def test_guild_roster(self):
+        db = PilgramORMDatabase.instance()
+        founder = self._get_or_create_player(74, "Rosterer")
+        member = self._get_or_create_player(75, "Recruit")
+        guild = Guild.create_default(founder, f"Roster{randint(0, 1000000)}", "AAAA")
+        guild.guild_id = db.add_guild(guild)
+        self.assertEqual(db.get_guild_members_number(guild), 0)
+        for player in (founder, member):
+            player.guild = guild
+            db.update_player_data(player)
+        self.assertEqual(db.get_guild_members_number(guild), 2)
+        member.set_flag(Raiding)
+        db.update_player_data(member)
+        self.assertEqual([x.player_id for x in db.get_raid_participants(guild)], [75])
+        member.unset_flag(Raiding)
+        member.guild = None  # kick
+        db.update_player_data(member)
+        self.assertEqual(db.get_guild_members_data(guild), [(74, "Rosterer", founder.level)])
+        self.assertEqual(db.get_raid_participants(guild), [])
+        # another process (e.g. the bot when quest workers are enabled) makes the member join & raid again
+        db.set_shared(True)
+        try:
+            PlayerModel.update(guild=guild.guild_id, flags=Raiding.set(0)).where(PlayerModel.id == 75).execute()
+            self.assertEqual(db.get_guild_members_number(guild), 2)
+            self.assertEqual([x.player_id for x in db.get_raid_participants(guild)], [75])
+            PlayerModel.update(guild=None, flags=0).where(PlayerModel.id == 75).execute()
+        finally:
+            db.set_shared(False)
+        founder.guild = None
+        db.update_player_data(founder)
+        db.delete_guild(guild)
+        self.assertEqual(db.get_guild_members_number(guild), 0)
+
+    def test_transaction(self):
+        db = PilgramORMDatabase.instance()
+        player = self._get_or_create_player(76, "Rollback")
+        money = PlayerModel.get(PlayerModel.id == 76).money
+        items_number = len(db.get_player_items(76))
+        adventure_container = db.get_player_adventure_container(player)
+        with self.assertRaises(ValueError), db.transaction():
+            player.money = money + 100
+            db.update_player_data(player)
+            item = Equipment.generate(1, EquipmentType.get_random("relic"), 3)
+            item.equipment_id = db.add_item(item, player)
+            db.get_player_items(76).append(item)
+            adventure_container.quest = Quest(-1, TOWN_ZONE, 1, "Raid", "AAAA", "", "", is_raid=True)
+            db.update_quest_progress(adventure_container)
+            raise ValueError("raid failed")
+        self.assertEqual(PlayerModel.get(PlayerModel.id == 76).money, money)
+        # the cached objects that held the rolled back changes were dropped
+        player = db.get_player_data(76)
+        self.assertEqual(player.money, money)
+        self.assertEqual(len(db.get_player_items(76)), items_number)
+        self.assertIsNone(db.get_player_adventure_container(player).quest)
+        with db.transaction():
+            player.money = money + 100
+            db.update_player_data(player)
+        self.assertEqual(PlayerModel.get(PlayerModel.id == 76).money, money + 100)
+        self.assertIs(db.get_player_data(76), player)
+
+    def test_shared_database(self):
+        db = PilgramORMDatabase.instance()
+        self._get_or_create_player(90, "Shared")
+        db.set_shared(True)
+        try:
+            # another process writing the player
+            PlayerModel.update(money=PlayerModel.money + 10).where(PlayerModel.id == 90).execute()
+            self.assertEqual(db.get_player_data(90).money, PlayerModel.get(PlayerModel.id == 90).money)
+            self.assertIsNot(db.get_player_data(90), db.get_player_data(90))
+        finally:
+            db.set_shared(False)
+        self.assertIs(db.get_player_data(90), db.get_player_data(90))
+
+    def test_random_zone_content(self):
+        db = PilgramORMDatabase.instance()
+        zone = get_or_create_zone(db, "ORM test zone")
+        db.add_zone_event(ZoneEvent(0, zone, "You find a very specific rock."))
+        db.add_enemy_meta(EnemyMeta(0, zone, f"Pool Monster {randint(0, 1000000)}", "AAAAA", "WIN", "LOSS"))
+        events = db.get_random_zone_events(zone, 20)
+        self.assertEqual(len(events), 20)
+        for event in events + [db.get_random_zone_event(zone)]:
+            self.assertEqual(event.zone, zone)
+        self.assertEqual(db.get_random_enemy_meta(zone).zone, zone)
+        new_event_text = f"A new event {randint(0, 1000000)}"
+        db.add_zone_events([ZoneEvent(0, zone, new_event_text)])
+        new_event_id = ZoneEventModel.get(ZoneEventModel.event_text == new_event_text).id
+        self.assertIn(new_event_id, _get_id_pool(_ZONE_EVENT_POOLS, ZoneEventModel, zone.zone_id))
+        # the generator (main process) adds an event while quest workers are running
+        db.set_shared(True)
+        orm.db.SHARED_POOLS_TTL = -1
+        try:
+            db.get_random_zone_event(zone)
+            new_event_id = ZoneEventModel.create(zone_id=zone.zone_id, event_text="An event from elsewhere").id
+            self.assertIn(new_event_id, _get_id_pool(_ZONE_EVENT_POOLS, ZoneEventModel, zone.zone_id))
+        finally:
+            orm.db.SHARED_POOLS_TTL = 60
+            db.set_shared(False)
+
+    def test_random_player_by_level(self):
+        db = PilgramORMDatabase.instance()
+        players = [self._get_or_create_player(77, "HighLevel"), self._get_or_create_player(78, "HigherLevel")]
+        for player, level in zip(players, (905, 908), strict=True):
+            player.level = level
+            db.update_player_data(player)
+        for _ in range(20):
+            self.assertIn(db.get_random_player_data(900).player_id, (77, 78))
+        for player in players:
+            player.level = 1
+            db.update_player_data(player)
+        self.assertIsNotNone(db.get_random_player_data(900))
+        # another process moved the player to a band this process never loaded
+        PlayerModel.update(level=2005).where(PlayerModel.id == 77).execute()
+        db.update_player_data(players[0])
+        self.assertEqual(PlayerModel.get(PlayerModel.id == 77).level, 1)
+        # the bot (main process) levels the players up while quest workers are running
+        db.set_shared(True)
+        orm.db.SHARED_POOLS_TTL = -1
+        try:
+            db.get_random_player_data(1500)
+            PlayerModel.update(level=1505).where(PlayerModel.id.in_([77, 78])).execute()
+            for _ in range(20):
+                self.assertIn(db.get_random_player_data(1500).player_id, (77, 78))
+        finally:
+            PlayerModel.update(level=1).where(PlayerModel.id.in_([77, 78])).execute()
+            orm.db.SHARED_POOLS_TTL = 60
+            db.set_shared(False)
+
+    def test_active_quest_numbers(self):
+        db = PilgramORMDatabase.instance()
+        player = self._get_or_create_player(79, "Frontier")
+        zone = get_or_create_zone(db, "ORM test zone")
+        try:
+            quest = db.get_quest_from_number(zone, 0)
+        except KeyError:
+            db.add_quest(Quest(0, zone, 0, "First quest", "AAAAAAAA", "WIN", "LOSS"))
+            quest = db.get_quest_from_number(zone, 0)
+        db.update_quest_progress(AdventureContainer(player, quest, datetime.now() + timedelta(hours=1), datetime.now()))
+        try:
+            self.assertIn(0, db.get_active_quest_numbers()[zone.zone_id])
+        finally:
+            db.update_quest_progress(AdventureContainer(player, None, datetime.now(), datetime.now()))
+
     def test_decode_vocation_ids(self):
         result = decode_vocation_ids(4294967295)  # 32 bit unsigned integer limit
         for item in result:
@@ -186,3 +398,25 @@ class TestORMDB(unittest.TestCase):
     def test_get_pending_updates(self):
         db = PilgramORMDatabase.instance()
         print(db.get_all_pending_updates(timedelta(hours=1)))
+
+    def test_get_update_schedule(self):
+        db = PilgramORMDatabase.instance()
+        player = self._get_or_create_player(69, "Ombro")
+        schedule = db.get_update_schedule([player.player_id])
+        self.assertEqual(len(schedule), 1)
+        self.assertEqual(schedule[0][0], player.player_id)
+        containers = db.get_adventure_containers([player.player_id])
+        self.assertEqual(containers[0].player_id(), player.player_id)
+
+    def test_caches_memory_report(self):
+        player = Player.create_default(0, "Ombro", "")
+        guild = Guild(0, "guild", 1, "", player, datetime.now(), 0, 0, 5, 0, datetime.now())
+        player.guild = guild
+        self.assertEqual(find_reference_cycles([player, guild]), {"Guild -> Player -> Guild": 1})
+        size, types = get_memory_usage([player])
+        self.assertGreater(size, 0)
+        self.assertEqual(types["Guild"][0], 1)
+        db = PilgramORMDatabase.instance()
+        db.get_player_data(db.get_random_player_data().player_id)
+        report = get_caches_memory_report()
+        self.assertGreater(report["caches"]["PilgramORMDatabase.get_player_data"]["bytes"], 0)
@@ -7,6 +7,7 @@ from typing import Any
 
 from AI.chatgpt import ChatGPTAPI, ChatGPTGenerator
 from orm.db import PilgramORMDatabase
+from orm.utils import get_caches_memory_report
 from pilgram.classes import Artifact, EnemyMeta, Quest, Zone, ZoneEvent
 from pilgram.combat_classes import Damage
 from pilgram.equipment import Equipment, EquipmentType
@@ -14,6 +15,7 @@ from pilgram.generics import PilgramDatabase
 from pilgram.globals import PLAYER_NAME_REGEX as PNR
 from pilgram.globals import POSITIVE_INTEGER_REGEX as PIR
 from pilgram.globals import YES_NO_REGEX, ContentMeta, GlobalSettings
+from pilgram.profiling import get_last_spans, request_profile
 from pilgram.strings import Strings
 from ui.interpreter import CLIInterpreter
 from ui.utils import InterpreterFunctionWrapper as IFW, player_arg, integer_arg
@@ -256,7 +258,8 @@ def process_enemy_add_zone(context: UserContext, user_input: str) -> str:
 def force_generate_zone_events(context: UserContext, zone_id_str: str) -> str:
     generator = ChatGPTGenerator(ChatGPTAPI(
         GlobalSettings.get("ChatGPT token"),
-        "gpt-3.5-turbo"
+        "gpt-3.5-turbo",
+        base_url=GlobalSettings.get("ChatGPT base url", default=ChatGPTAPI.BASE_URL)
     ))
     try:
         zone_id = int(zone_id_str)
@@ -273,7 +276,8 @@ def force_generate_zone_events(context: UserContext, zone_id_str: str) -> str:
 def force_generate_enemy_metas(context: UserContext, zone_id_str: str) -> str:
     generator = ChatGPTGenerator(ChatGPTAPI(
         GlobalSettings.get("ChatGPT token"),
-        "gpt-3.5-turbo"
+        "gpt-3.5-turbo",
+        base_url=GlobalSettings.get("ChatGPT base url", default=ChatGPTAPI.BASE_URL)
     ))
     try:
         zone_id = int(zone_id_str)
@@ -388,6 +392,38 @@ def set_player_stats(context: UserContext, player_name: str, stat_string: str) -
     return f"set player {player.name} stats to {player.stats}"
 
 
+def profile_next_tick(context: UserContext, tick_names: tuple[str, ...] = ()) -> str:
+    """ run the next tick of the given managers under cProfile """
+    for tick_name in tick_names:
+        request_profile(tick_name)
+    return f"the next tick of {', '.join(tick_names)} will be profiled, check the logs for the dump path"
+
+
+def show_tick_metrics(context: UserContext) -> str:
+    spans = get_last_spans()
+    if not spans:
+        return "no ticks recorded yet"
+    return "\n".join(json.dumps(span) for span in spans.values())
+
+
+def show_caches_memory(context: UserContext) -> str:
+    report = get_caches_memory_report()
+    lines = [f"caches retain {report['total bytes'] / 1024:.1f} KiB", "", "by cache:"]
+    for name, cache in sorted(report["caches"].items(), key=lambda x: x[1]["bytes"], reverse=True):
+        if cache["entries"] > 0:
+            lines.append(f"{name}: {cache['entries']} entries, {cache['bytes'] / 1024:.1f} KiB")
+    lines.extend(["", "by type:"])
+    lines.extend(f"{type_name}: {count} objects, {size / 1024:.1f} KiB" for type_name, (count, size) in report["types"].items())
+    lines.extend(["", "reference cycles:"])
+    lines.extend(f"{signature}: {count}" for signature, count in report["cycles"].items())
+    return "\n".join(lines)
+
+
+def reload_content_meta(context: UserContext) -> str:
+    ContentMeta.reload()
+    return f"{ContentMeta.FILENAME} reloaded"
+
+
 ADMIN_COMMANDS: dict[str, str | IFW | dict] = {
     "add": {
         "player": {
@@ -465,6 +501,18 @@ ADMIN_COMMANDS: dict[str, str | IFW | dict] = {
     },
     "tourney": {
         "reset": IFW(None, reset_guild_tourney, "Reset all guild scores")
+    },
+    "profile": {
+        "quest": IFW(None, profile_next_tick, "Profile the next quest manager tick", {"tick_names": ("quest scheduler", "quest manager")}),
+        "generator": IFW(None, profile_next_tick, "Profile the next generator manager tick", {"tick_names": ("generator manager",)}),
+        "tourney": IFW(None, profile_next_tick, "Profile the next tourney manager tick", {"tick_names": ("tourney manager",)}),
+        "updates": IFW(None, profile_next_tick, "Profile the next updates manager tick", {"tick_names": ("updates manager",)}),
+        "notifications": IFW(None, profile_next_tick, "Profile the next notifications manager tick", {"tick_names": ("notifications manager",)}),
+    },
+    "metrics": IFW(None, show_tick_metrics, "Show the last recorded tick of each manager"),
+    "memory": IFW(None, show_caches_memory, "Show the memory retained by the database caches"),
+    "reload": {
+        "content": IFW(None, reload_content_meta, "Reload the content meta file (values computed at startup are not updated)")
     }
 }
 
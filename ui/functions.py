@@ -1,13 +1,12 @@
 import logging
 import random
 import re
-import json
 from collections.abc import Callable
-from collections import deque
 from copy import copy
 from datetime import datetime, timedelta
 from functools import cache
 from random import choice
+from typing import Any
 
 from minigames.games import AAA
 from minigames.generics import MINIGAMES, PilgramMinigame
@@ -567,40 +566,29 @@ def withdraw(context: UserContext, amount_str: str) -> str:
     guild.bank -= amount
     db().update_guild(guild)
     # create a log
-    guild.create_bank_log("withdrawal", player.player_id, amount)
+    db().add_bank_log(guild, "withdrawal", player.player_id, amount)
     return Strings.withdrawal_successful.format(amm=amount_str)
 
 
-def process_transactions(data):
-    withdrawals = deque(maxlen=10)
-    deposits = deque(maxlen=10)
-    transactions = data.strip().split('\n')
-    for transaction in transactions:
-        try:
-            data = json.loads(transaction)
-            if data["transaction"] == "withdrawal":
-                withdrawals.append(data)
-            elif data["transaction"] == "deposit":
-                deposits.append(data)
-        except json.JSONDecodeError as e:
-            return Strings.no_logs # there might actually be something deeper going on
-    message = "Last 10 withdrawals:\n"
-    for withdrawal in withdrawals:
-            withdrawer = db().get_player_data(withdrawal['by']) # if the player withdrawed he must exist
-            message += f"{withdrawal['amount']} {MONEY} ➡️ {withdrawer.name}\n"
-    message += "\nLast 10 deposits:\n"
-    for deposit in deposits:
-            depositer = db().get_player_data(deposit['by']) # if the player deposited he must exist
-            message += f"{depositer.name} ➡️ {deposit['amount']} {MONEY}\n"
-    return message
-
-
 def check_bank_logs(context: UserContext) -> str:
     player = get_player(db, context)
     guild = player.guild
     if not guild:
         return Strings.not_in_a_guild
-    return process_transactions(guild.get_bank_logs_data())
+    withdrawals = db().get_bank_logs(guild, "withdrawal")
+    deposits = db().get_bank_logs(guild, "deposit")
+    if not (withdrawals or deposits):
+        return Strings.no_logs
+    message = "Last 10 withdrawals:\n"
+    for name, amount in withdrawals:
+        message += f"{amount} {MONEY} ➡️ {name}\n"
+    message += "\nLast 10 deposits:\n"
+    for name, amount in deposits:
+        message += f"{name} ➡️ {amount} {MONEY}\n"
+    message += "\nTotals (deposited / withdrawn):\n"
+    for name, (deposited, withdrawn) in db().get_bank_log_totals(guild).items():
+        message += f"{name}: {deposited} / {withdrawn} {MONEY}\n"
+    return message
 
 
 def rank_guilds(context: UserContext) -> str:
@@ -1154,14 +1142,42 @@ def force_qte(context: UserContext) -> str:
     return Strings.explore_text
 
 
-def check_auctions(context: UserContext) -> str:
+def __parse_auction_filter(auction_filter: str) -> dict[str, Any]:
+    key, _, value = auction_filter.lower().partition("=")
+    if key == "slot":
+        return {"slot": Slots.get_from_string(value)}
+    if key == "level":
+        min_level, _, max_level = value.partition("-")
+        return {"min_level": int(min_level), "max_level": int(max_level or min_level)}
+    if key in ("rarity", "page"):
+        return {key: int(value)}
+    if key == "price":
+        return {"max_price": int(value)}
+    if (key == "sort") and (value in Auction.SORTS):
+        return {"sort": value}
+    raise ValueError(auction_filter)
+
+
+def __parse_auction_filters(filters: tuple[str, ...]) -> dict[str, Any]:
+    """ converts filters like 'slot=head' or 'level=10-20' into search_auctions arguments, raises ValueError if invalid """
+    result: dict[str, Any] = {}
+    for auction_filter in filters:
+        try:
+            result.update(__parse_auction_filter(auction_filter))
+        except (KeyError, ValueError):
+            raise ValueError(auction_filter) from None
+    return result
+
+
+def check_auctions(context: UserContext, *filters: str) -> str:
     try:
-        auctions = db().get_auctions()
-        if not auctions:
-            return Strings.no_auctions_yet
-        return "Here are all auctions:\n\n" + "\n\n".join(str(x) for x in auctions)
-    except KeyError:
-        return Strings.no_auctions_yet
+        search_args = __parse_auction_filters(filters)
+    except ValueError as e:
+        return Strings.invalid_auction_filter.format(filter=e, sorts="|".join(Auction.SORTS))
+    auctions = db().search_auctions(**search_args)
+    if not auctions:
+        return Strings.no_auctions_yet if not filters else Strings.no_auctions_found
+    return f"Here are the auctions (page {search_args.get('page', 1)}):\n\n" + "\n\n".join(str(x) for x in auctions)
 
 
 def check_my_auctions(context: UserContext) -> str:
@@ -1741,7 +1757,7 @@ USER_COMMANDS: dict[str, str | IFW | dict] = {
         "my": {
             "auctions": IFW(None, check_my_auctions, "Shows your auctions."),
         },
-        "auctions": IFW(None, check_auctions, "Shows all auctions."),
+        "auctions": IFW(None, check_auctions, "Shows all auctions, can be filtered (e.g.: slot=head rarity=2 level=10-20 price=5000 sort=price page=2).", optional_args=[RWE("filters", None, None)]),
         "auction": IFW([integer_arg("Auction")], check_auction, "Show a specific auction."),
         "members": IFW(None, check_guild_members, "Shows the members of the given guild", optional_args=[guild_arg("Guild")]),
         "item": IFW([integer_arg("Item")], check_item, "Shows specified item stats"),